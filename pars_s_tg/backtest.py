@@ -0,0 +1,236 @@
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+MINUTES_PER_YEAR = 365 * 24 * 60
+
+DEFAULT_GRID = {
+    'fast': [5, 10, 20, 30, 50],
+    'slow': [60, 100, 200, 400],
+    'stop_loss': [0.005, 0.01, 0.02, 0.03, 0.05],
+    'take_profit': [0.01, 0.02, 0.03, 0.05, 0.08, 0.12, 0.2, 0.3, 0.5, 0.0],
+}
+
+
+def load_candles(source, symbol=None, interval=None):
+    """Свечи из CSV load_dt02 (timestamp — дата) или из датасета storage, колонки float64"""
+    if source.endswith('.csv'):
+        df = pd.read_csv(source, index_col='timestamp', parse_dates=True)
+    else:
+        from storage import read_ohlcv
+        df = read_ohlcv(symbol, interval, root=source)
+        df.index = pd.to_datetime(df.pop('timestamp'), unit='ms')
+    df = df[~df.index.duplicated(keep='first')].sort_index()
+    return df[PRICE_COLUMNS + ['volume']].astype(np.float64).dropna()
+
+
+def rolling_mean(values, window):
+    """Скользящее среднее через кумулятивную сумму; первые window-1 значений — NaN"""
+    result = np.full(len(values), np.nan)
+    if window > len(values):
+        return result
+    cumsum = np.cumsum(np.concatenate(([0.0], values)))
+    result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return result
+
+
+def crossover_signal(close, fast, slow, cache=None):
+    """1 — быстрая средняя выше медленной на закрытии бара, иначе 0"""
+    if cache is None:
+        cache = {}
+    for window in (fast, slow):
+        if window not in cache:
+            cache[window] = rolling_mean(close, window)
+    return (cache[fast] > cache[slow]).astype(np.int8)
+
+
+def run_backtest(prices, signal, stop_loss=0.0, take_profit=0.0, fee=0.00055,
+                 initial_capital=10000, bars_per_year=MINUTES_PER_YEAR, equity_curve=True):
+    """Бэктест long-only стратегии целиком на массивах, без цикла по барам.
+
+    signal[t] вычисляется на закрытии бара t, позиция открывается по open[t+1]. Stop-loss и
+    take-profit (доли от цены входа, 0 — выключено) проверяются по low/high; если в одном баре
+    задеты оба уровня, считаем, что сработал stop. После срабатывания позиция закрыта до смены
+    сигнала. Комиссия fee берётся с каждой стороны сделки.
+    """
+    open_, high, low, close = (prices[column] for column in PRICE_COLUMNS)
+    n = len(close)
+    if n < 2:
+        # Позиция открывается по open следующего бара: на пустой истории и одном баре сделок нет
+        result = {
+            'initial_capital': initial_capital, 'final_value': float(initial_capital), 'total_return': 0.0,
+            'max_drawdown': 0.0, 'sharpe': 0.0, 'total_trades': 0, 'win_rate': 0.0,
+            'stop_exits': 0, 'take_exits': 0, 'exposure': 0.0,
+        }
+        if equity_curve:
+            result['equity'] = np.full(n, float(initial_capital))
+            result['drawdown'] = np.zeros(n)
+        return result
+
+    # Желаемая позиция на баре t — сигнал закрытия t-1
+    wanted = np.zeros(n, dtype=bool)
+    wanted[1:] = signal[:-1] > 0
+    entries = wanted.copy()
+    entries[1:] &= ~wanted[:-1]
+    entry_bars = np.flatnonzero(entries)
+    trade_id = np.cumsum(entries) - 1                   # Номер сделки для бара внутри позиции
+    entry_price = np.where(wanted, open_[entry_bars][np.maximum(trade_id, 0)] if len(entry_bars) else 0.0, np.nan)
+
+    # Первое касание stop/take в пределах сделки
+    hit_stop = wanted & (low <= entry_price * (1 - stop_loss)) if stop_loss else np.zeros(n, dtype=bool)
+    hit_take = wanted & (high >= entry_price * (1 + take_profit)) if take_profit else np.zeros(n, dtype=bool)
+    hit = hit_stop | hit_take
+    hits_before = np.cumsum(hit) - hit
+    if len(entry_bars):
+        hits_before = hits_before - hits_before[entry_bars][np.maximum(trade_id, 0)]
+    active = wanted & (hits_before == 0)
+    exit_hit = active & hit
+
+    # Цена, от которой считается доходность бара: open на баре входа, иначе прошлый close
+    reference = np.empty(n)
+    reference[0] = open_[0]
+    reference[1:] = close[:-1]
+    reference[entries] = open_[entries]
+    exit_price = close.copy()
+    # Гэп через уровень исполняется по open, а не по цене стопа
+    stop_fill = np.minimum(open_, entry_price * (1 - stop_loss))
+    take_fill = np.maximum(open_, entry_price * (1 + take_profit))
+    exit_price[exit_hit & hit_take] = take_fill[exit_hit & hit_take]
+    exit_price[exit_hit & hit_stop] = stop_fill[exit_hit & hit_stop]
+
+    log_returns = np.where(active, np.log(exit_price / reference), 0.0)
+    # Выход по сигналу — по open бара, где желаемая позиция стала нулевой
+    natural_exit = np.zeros(n, dtype=bool)
+    natural_exit[1:] = active[:-1] & ~exit_hit[:-1] & ~wanted[1:]
+    log_returns[natural_exit] = np.log(open_[natural_exit] / close[np.flatnonzero(natural_exit) - 1])
+
+    fee_log = np.log1p(-fee)
+    exits = exit_hit | natural_exit
+    # Вход и стоп в одном баре — две комиссии: сумма bool-массивов дала бы OR и одну
+    log_returns += (entries.astype(np.int8) + exits) * fee_log
+    if active[-1] and not exit_hit[-1]:
+        log_returns[-1] += fee_log                      # Закрываем открытую позицию по последнему close
+
+    log_equity = np.cumsum(log_returns)
+    peak = np.maximum.accumulate(np.maximum(log_equity, 0.0))
+    drawdown = np.expm1(log_equity - peak)
+
+    # Итог каждой сделки — сумма лог-доходностей её баров (включая выход по open следующего бара)
+    trades = len(entry_bars)
+    if trades:
+        owner = np.where(active | natural_exit, trade_id, -1)
+        per_trade = np.bincount(owner[owner >= 0], weights=log_returns[owner >= 0], minlength=trades)
+        win_rate = float((per_trade > 0).mean())
+    else:
+        win_rate = 0.0
+
+    bar_std = log_returns.std()
+    result = {
+        'initial_capital': initial_capital,
+        'final_value': float(initial_capital * np.exp(log_equity[-1])),
+        'total_return': float(np.expm1(log_equity[-1])),
+        'max_drawdown': float(drawdown.min()),
+        'sharpe': float(log_returns.mean() / bar_std * np.sqrt(bars_per_year)) if bar_std > 0 else 0.0,
+        'total_trades': trades,
+        'win_rate': win_rate,
+        'stop_exits': int((exit_hit & hit_stop).sum()),
+        'take_exits': int((exit_hit & hit_take & ~hit_stop).sum()),
+        'exposure': float(active.mean()),
+    }
+    if equity_curve:
+        result['equity'] = initial_capital * np.exp(log_equity)
+        result['drawdown'] = drawdown
+    return result
+
+
+def param_grid(grid):
+    """Все комбинации параметров; fast >= slow пропускаются"""
+    names = list(grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    return [combo for combo in combos if combo.get('fast', 0) < combo.get('slow', 1)]
+
+
+# --- Перебор параметров в пуле процессов над общей памятью ---
+
+_shared = {}
+
+
+def _attach(name, n, fee):
+    """Инициализатор воркера: цены берутся из shared memory без копирования"""
+    block = shared_memory.SharedMemory(name=name)
+    matrix = np.ndarray((len(PRICE_COLUMNS), n), dtype=np.float64, buffer=block.buf)
+    _shared['block'] = block
+    _shared['prices'] = {column: matrix[i] for i, column in enumerate(PRICE_COLUMNS)}
+    _shared['fee'] = fee
+    _shared['ma_cache'] = {}
+
+
+def _run_chunk(combos):
+    prices, cache = _shared['prices'], _shared['ma_cache']
+    results = []
+    for combo in combos:
+        signal = crossover_signal(prices['close'], combo['fast'], combo['slow'], cache)
+        stats = run_backtest(prices, signal, combo['stop_loss'], combo['take_profit'],
+                             fee=_shared['fee'], equity_curve=False)
+        stats.update(combo)
+        results.append(stats)
+    return results
+
+
+def sweep(df, grid=None, workers=None, fee=0.00055, chunk_size=None):
+    """Перебор сетки параметров; каждый воркер видит одни и те же массивы цен в shared memory.
+
+    Комбинации группируются по (fast, slow), чтобы скользящие средние считались в воркере один раз.
+    """
+    combos = param_grid(grid or DEFAULT_GRID)
+    combos.sort(key=lambda combo: (combo['fast'], combo['slow']))
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, -(-len(combos) // (workers * 4)))
+    chunks = [combos[i:i + chunk_size] for i in range(0, len(combos), chunk_size)]
+
+    n = len(df)
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(PRICE_COLUMNS) * n * 8))
+    try:
+        matrix = np.ndarray((len(PRICE_COLUMNS), n), dtype=np.float64, buffer=block.buf)
+        for i, column in enumerate(PRICE_COLUMNS):
+            matrix[i] = df[column].to_numpy(dtype=np.float64)
+        results = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                 initargs=(block.name, n, fee)) as pool:
+            for chunk_results in pool.map(_run_chunk, chunks):
+                results.extend(chunk_results)
+        del matrix
+    finally:
+        block.close()
+        block.unlink()
+    return pd.DataFrame(results).sort_values('sharpe', ascending=False, ignore_index=True)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Использование: python backtest.py data/bybit_tonusdt_1_....csv [workers]")
+        return
+    df = load_candles(sys.argv[1])
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    combos = len(param_grid(DEFAULT_GRID))
+    print(f"Свечей: {len(df)}, комбинаций: {combos}")
+
+    started = time.perf_counter()
+    results = sweep(df, workers=workers)
+    print(f"Перебор завершён за {time.perf_counter() - started:.1f} с")
+    print(results.head(10).to_string(columns=['fast', 'slow', 'stop_loss', 'take_profit', 'total_return',
+                                              'max_drawdown', 'sharpe', 'total_trades', 'win_rate']))
+    output = os.path.splitext(sys.argv[1])[0] + '_sweep.csv'
+    results.to_csv(output, index=False)
+    print(f"Результаты: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from storage import DATASET_ROOT, list_partitions, partition_files, read_ohlcv, write_ohlcv
+
+BAR_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'trades']
+
+# Таймфреймы и их длительность; материализованные уровни строятся каскадом из предыдущего
+TIMEFRAMES = {
+    '1s': 1000,
+    '1m': 60 * 1000,
+    '5m': 5 * 60 * 1000,
+    '15m': 15 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+ROLLUP_CHAIN = list(TIMEFRAMES)
+# Метки interval в датасете — в обозначениях ByBit, чтобы 'linear_1' из load_dt02 был уровнем 1m
+INTERVAL_LABELS = {'1s': '1s', '1m': '1', '5m': '5', '15m': '15', '1h': '60', '1d': 'D'}
+# Чем крупнее таймфрейм, тем крупнее партиция: год дневных баров — один файл, а не 365
+PARTITIONS = {'1s': 'day', '1m': 'day', '5m': 'month', '15m': 'month', '1h': 'year', '1d': 'year'}
+
+
+def rollup_label(prefix, timeframe):
+    """Метка interval уровня в датасете: ('linear', '5m') -> 'linear_5'"""
+    return f"{prefix}_{INTERVAL_LABELS[timeframe]}"
+
+
+class BarAggregator:
+    """Собирает настоящие OHLCV-бары из потока сделок/тиков за O(1) на тик.
+
+    add() возвращает закрытый бар, когда приходит первый тик следующего интервала. Тики старше
+    текущего бара (опоздавшие) не переписывают уже отданные бары и считаются в late_ticks.
+    """
+
+    def __init__(self, interval_ms=1000):
+        self.interval_ms = interval_ms
+        self.start = None
+        self.open = self.high = self.low = self.close = 0.0
+        self.volume = 0.0
+        self.trades = 0
+        self.late_ticks = 0
+
+    def add(self, ts, price, size=0.0):
+        start = int(ts) - int(ts) % self.interval_ms
+        if self.start is None or start > self.start:
+            closed = self.flush()
+            self.start = start
+            self.open = self.high = self.low = self.close = price
+            self.volume = size
+            self.trades = 1
+            return closed
+        if start < self.start:
+            self.late_ticks += 1
+            return None
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += size
+        self.trades += 1
+        return None
+
+    def flush(self):
+        """Отдаёт текущий (незакрытый) бар и сбрасывает состояние"""
+        if self.start is None:
+            return None
+        bar = (self.start, self.open, self.high, self.low, self.close, self.volume, self.trades)
+        self.start = None
+        return bar
+
+
+def aggregate_ticks(timestamps, prices, sizes=None, interval_ms=1000):
+    """Векторная сборка баров из массивов сделок (одна сортировка и reduceat по границам интервалов)"""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    sizes = np.zeros(len(prices)) if sizes is None else np.asarray(sizes, dtype=np.float64)
+    if not len(timestamps):
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    if np.any(timestamps[1:] < timestamps[:-1]):
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, prices, sizes = timestamps[order], prices[order], sizes[order]
+
+    buckets = timestamps - timestamps % interval_ms
+    starts = np.r_[0, np.flatnonzero(np.diff(buckets)) + 1]
+    ends = np.r_[starts[1:], len(buckets)]
+    return pd.DataFrame({
+        'timestamp': buckets[starts],
+        'open': prices[starts],
+        'high': np.maximum.reduceat(prices, starts),
+        'low': np.minimum.reduceat(prices, starts),
+        'close': prices[ends - 1],
+        'volume': np.add.reduceat(sizes, starts),
+        'trades': (ends - starts).astype(np.float64),
+    })
+
+
+def rollup_bars(df, interval_ms):
+    """Сворачивает бары в более крупный таймфрейм: open первого, max/min, close последнего, сумма объёма"""
+    if df.empty:
+        return pd.DataFrame(columns=df.columns)
+    df = df.sort_values('timestamp', kind='stable')
+    timestamps = df['timestamp'].to_numpy(dtype=np.int64)
+    buckets = timestamps - timestamps % interval_ms
+    starts = np.r_[0, np.flatnonzero(np.diff(buckets)) + 1]
+    ends = np.r_[starts[1:], len(buckets)]
+
+    result = {'timestamp': buckets[starts]}
+    for column in df.columns:
+        if column == 'timestamp':
+            continue
+        values = df[column].to_numpy(dtype=np.float64)
+        if column == 'open':
+            result[column] = values[starts]
+        elif column == 'high':
+            result[column] = np.maximum.reduceat(values, starts)
+        elif column == 'low':
+            result[column] = np.minimum.reduceat(values, starts)
+        elif column == 'close':
+            result[column] = values[ends - 1]
+        else:
+            # volume, turnover, trades — суммируются
+            result[column] = np.add.reduceat(np.nan_to_num(values), starts)
+    return pd.DataFrame(result)
+
+
+def update_rollups(symbol, prefix, start, end, base='1m', root=DATASET_ROOT, append=False):
+    """Досчитывает материализованные уровни выше base для изменившегося диапазона [start, end) (мс).
+
+    Каждый уровень пересчитывается только для затронутых интервалов из уровня ниже, поэтому
+    стоимость пропорциональна новым данным, а не всей истории. append=True — для частых
+    маленьких обновлений (см. write_ohlcv). Возвращает {таймфрейм: строк}.
+    """
+    updated = {}
+    lower = base
+    for timeframe in ROLLUP_CHAIN[ROLLUP_CHAIN.index(base) + 1:]:
+        interval_ms = TIMEFRAMES[timeframe]
+        # Расширяем диапазон до границ интервалов уровня, иначе крайние бары соберутся не полностью
+        start = int(start) - int(start) % interval_ms
+        end = int(end) + (-int(end)) % interval_ms
+        bars = read_ohlcv(symbol, rollup_label(prefix, lower), start, end, root=root)
+        if bars.empty:
+            break
+        rolled = rollup_bars(bars, interval_ms)
+        write_ohlcv(rolled, symbol, rollup_label(prefix, timeframe), root, PARTITIONS[timeframe], append)
+        updated[timeframe] = len(rolled)
+        lower = timeframe
+    return updated
+
+
+def rebuild_rollups(symbol, prefix, base='1m', root=DATASET_ROOT):
+    """Полная пересборка уровней по всей истории base (первичное заполнение)"""
+    files = list_partitions(symbol, rollup_label(prefix, base), root=root)
+    if not files:
+        return {}
+    # Границы истории — по крайним партициям (с их delta-файлами, если они ещё не слиты)
+    first = pa.concat_tables([pq.read_table(f, columns=['timestamp']) for f in partition_files(files[0])])
+    last = pa.concat_tables([pq.read_table(f, columns=['timestamp']) for f in partition_files(files[-1])])
+    start = int(pc.min(first['timestamp']).as_py())
+    end = int(pc.max(last['timestamp']).as_py()) + TIMEFRAMES[base]
+    return update_rollups(symbol, prefix, start, end, base, root)
+
+
+def read_bars(symbol, prefix, timeframe, start=None, end=None, columns=None, root=DATASET_ROOT):
+    """Бары нужного таймфрейма из материализованного уровня — без resample на каждый запрос"""
+    return read_ohlcv(symbol, rollup_label(prefix, timeframe), start, end, columns, root)
+
+
+if __name__ == "__main__":
+    # python bars.py TONUSDT linear [1m] — пересобрать уровни 5m/15m/1h/1d из истории load_dt02
+    symbol = sys.argv[1] if len(sys.argv) > 1 else 'TONUSDT'
+    prefix = sys.argv[2] if len(sys.argv) > 2 else 'linear'
+    base = sys.argv[3] if len(sys.argv) > 3 else '1m'
+    for timeframe, rows in rebuild_rollups(symbol, prefix, base).items():
+        print(f"{rollup_label(prefix, timeframe)}: {rows} баров")
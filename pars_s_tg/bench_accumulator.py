@@ -0,0 +1,73 @@
+# Пиковая память (RSS) накопления свечей: list[dict] + set (как было в load_dt02) против KlineAccumulator
+import json
+import resource
+import subprocess
+import sys
+import time
+
+START_TS = 1674432000000          # 2023-01-23
+INTERVAL_MS = 60_000
+
+
+def fill_list(n):
+    import pandas as pd
+    all_klines, seen_timestamps = [], set()
+    for i in range(n):
+        ts = START_TS + i * INTERVAL_MS
+        if ts in seen_timestamps:
+            continue
+        seen_timestamps.add(ts)
+        all_klines.append({"timestamp": ts, "open": 2.13 + i * 1e-7, "high": 2.14, "low": 2.12,
+                           "close": 2.135, "volume": 1000.0 + i})
+    # save_progress строил DataFrame из всего списка
+    df = pd.DataFrame(all_klines)
+    return len(df)
+
+
+def fill_accumulator(n):
+    from kline_accumulator import KlineAccumulator
+    accumulator = KlineAccumulator(START_TS, START_TS + n * INTERVAL_MS, INTERVAL_MS)
+    for i in range(n):
+        accumulator.add(START_TS + i * INTERVAL_MS, 2.13 + i * 1e-7, 2.14, 2.12, 2.135, 1000.0 + i)
+    df, _ = accumulator.unsaved()
+    return len(df)
+
+
+def _baseline_rss_mb():
+    import numpy  # noqa: F401  — библиотеки грузятся в обоих вариантах, их вклад вычитаем
+    import pandas  # noqa: F401
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, n):
+    baseline = _baseline_rss_mb()
+    started = time.perf_counter()
+    rows = {'list': fill_list, 'accumulator': fill_accumulator}[mode](n)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'name': mode, 'rows': rows, 'seconds': elapsed,
+                      'peak_rss_mb': peak, 'data_rss_mb': peak - baseline}))
+
+
+def run(n=1_400_000):
+    """Каждый вариант — в отдельном процессе, чтобы пиковый RSS не смешивался"""
+    results = []
+    for mode in ('list', 'accumulator'):
+        output = subprocess.run([sys.executable, __file__, '--child', mode, str(n)],
+                                capture_output=True, text=True, check=True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]))
+        sys.exit(0)
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_400_000
+    results = run(n)
+    print(f"{'вариант':<14}{'свечей':>10}{'время, с':>10}{'пик RSS, МБ':>13}{'данные, МБ':>12}")
+    for result in results:
+        print(f"{result['name']:<14}{result['rows']:>10}{result['seconds']:>10.2f}"
+              f"{result['peak_rss_mb']:>13.0f}{result['data_rss_mb']:>12.0f}")
+    print(f"Сокращение памяти под данные: {results[0]['data_rss_mb'] / max(results[1]['data_rss_mb'], 1):.1f}x")
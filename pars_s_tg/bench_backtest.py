@@ -0,0 +1,96 @@
+# Бэктест на синтетических минутных свечах: цикл по строкам против векторного движка и перебора сетки
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest import DEFAULT_GRID, crossover_signal, param_grid, run_backtest, sweep
+
+LOOP_SAMPLE = 50_000              # Цикл по строкам меряем на выборке и экстраполируем
+
+
+def make_candles(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 2.0 * np.exp(np.cumsum(rng.normal(0, 0.0008, n)))
+    open_ = np.concatenate(([close[0]], close[:-1])) * (1 + rng.normal(0, 0.0001, n))
+    spread = np.abs(rng.normal(0, 0.0006, n))
+    return pd.DataFrame({
+        'open': open_,
+        'high': np.maximum(open_, close) * (1 + spread),
+        'low': np.minimum(open_, close) * (1 - spread),
+        'close': close,
+        'volume': rng.uniform(100, 10_000, n),
+    }, index=pd.date_range('2023-01-23', periods=n, freq='min', name='timestamp'))
+
+
+def backtest_loop(df, signal, stop_loss, take_profit, fee=0.00055, capital=10000.0):
+    """Построчный бэктест (iterrows, как BacktestEngine.run из инструкции) с той же логикой исполнения.
+
+    Эталон для проверки векторного движка и замера старого пути.
+    """
+    position = 0.0
+    entry = 0.0
+    row = None
+    for i, (_, row) in enumerate(df.iterrows()):
+        if i == 0:
+            continue
+        wanted, was_wanted = signal[i - 1] > 0, i > 1 and signal[i - 2] > 0
+        if not wanted:
+            if position:
+                capital = position * row['open'] * (1 - fee)
+                position = 0.0
+            continue
+        if not was_wanted:
+            entry = row['open']
+            position = capital * (1 - fee) / entry
+        if position:
+            if stop_loss and row['low'] <= entry * (1 - stop_loss):
+                capital = position * min(row['open'], entry * (1 - stop_loss)) * (1 - fee)
+                position = 0.0
+            elif take_profit and row['high'] >= entry * (1 + take_profit):
+                capital = position * max(row['open'], entry * (1 + take_profit)) * (1 - fee)
+                position = 0.0
+    if position:
+        capital = position * row['close'] * (1 - fee)
+    return capital
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def run(n=1_400_000, workers=None):
+    df = make_candles(n)
+    prices = {column: df[column].to_numpy() for column in ('open', 'high', 'low', 'close')}
+    signal = crossover_signal(prices['close'], 20, 100)
+    results = []
+
+    sample = min(n, LOOP_SAMPLE)
+    seconds, loop_capital = timed(backtest_loop, df.iloc[:sample], signal[:sample], 0.01, 0.03)
+    results.append({'name': 'row_loop', 'rows': n, 'combos': 1, 'seconds': seconds * n / sample,
+                    'extrapolated_from': sample})
+    check = run_backtest({k: v[:sample] for k, v in prices.items()}, signal[:sample], 0.01, 0.03)
+    assert abs(check['final_value'] - loop_capital) < 1e-6 * loop_capital, (check['final_value'], loop_capital)
+
+    seconds, _ = timed(run_backtest, prices, signal, 0.01, 0.03)
+    results.append({'name': 'vectorized', 'rows': n, 'combos': 1, 'seconds': seconds})
+
+    combos = len(param_grid(DEFAULT_GRID))
+    seconds, _ = timed(sweep, df, workers=workers)
+    results.append({'name': 'sweep', 'rows': n, 'combos': combos, 'seconds': seconds})
+    return results
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_400_000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    print(f"{'вариант':<12}{'свечей':>10}{'комбинаций':>12}{'время, с':>11}")
+    results = run(n, workers)
+    for result in results:
+        note = f"  (экстраполяция с {result['extrapolated_from']})" if 'extrapolated_from' in result else ''
+        print(f"{result['name']:<12}{result['rows']:>10}{result['combos']:>12}{result['seconds']:>11.2f}{note}")
+    loop_sweep = results[0]['seconds'] * results[2]['combos']
+    print(f"Перебор циклом по строкам занял бы ~{loop_sweep / 3600:.1f} ч, ускорение {loop_sweep / results[2]['seconds']:.0f}x")
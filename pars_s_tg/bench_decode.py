@@ -0,0 +1,110 @@
+# Разбор страниц /v5/market/kline: json + float() на каждое поле против пакетного декодирования в колонки NumPy
+import glob
+import json
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+
+import decode
+from decode import decode_kline_page, decode_klines
+from kline_accumulator import VALUE_COLUMNS, KlineAccumulator
+from stub_bybit import StubRestServer
+
+START_TS = 1674432000000          # 2023-01-23
+INTERVAL_MS = 60_000
+LIMIT = 200
+
+
+def synthetic_pages(pages, limit=LIMIT):
+    """Страницы стенда в компактном JSON, как их отдаёт ByBit"""
+    stub = StubRestServer(kline_range=(START_TS, START_TS + pages * limit * INTERVAL_MS))
+    stub.httpd.server_close()
+    return [json.dumps(stub.klines({'start': str(START_TS + i * limit * INTERVAL_MS), 'limit': str(limit)}, 0),
+                       separators=(',', ':')).encode() for i in range(pages)]
+
+
+def recorded_pages(directory):
+    """Записанные ответы свечей из кэша HttpCache (data/http_cache)"""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, '*', '*.z'))):
+        with open(path, 'rb') as f:
+            entry = json.loads(zlib.decompress(f.read()))
+        if entry['url'].endswith('/v5/market/kline'):
+            pages.append(entry['body'].encode())
+    return pages
+
+
+def per_row(pages, accumulator):
+    """Старый путь fetch_shard: json, сортировка lambda и float() по каждому полю каждой свечи"""
+    for raw in pages:
+        klines = json.loads(raw)['result']['list']
+        klines.sort(key=lambda x: int(x[0]))
+        for k in klines:
+            accumulator.add(int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]))
+
+
+def list_columns(pages, accumulator):
+    """Разбор JSON целиком, затем список строк -> колонки одним вызовом NumPy"""
+    for raw in pages:
+        klines = decode_klines(decode.loads(raw)['result']['list'])
+        accumulator.add_batch(klines['timestamp'], *(klines[name] for name in VALUE_COLUMNS))
+
+
+def page_columns(pages, accumulator):
+    """decode_kline_page: числа из сырых байтов без промежуточных строк"""
+    for raw in pages:
+        klines = decode_kline_page(raw)['klines']
+        accumulator.add_batch(klines['timestamp'], *(klines[name] for name in VALUE_COLUMNS))
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def run(pages):
+    timestamps = np.concatenate([decode_kline_page(raw)['klines']['timestamp'] for raw in pages])
+    first, last, candles = int(timestamps.min()), int(timestamps.max()), len(timestamps)
+    fast_loads = decode.loads
+    variants = [('per_row', per_row, json.loads), ('list_columns', list_columns, fast_loads),
+                ('page_json', page_columns, json.loads)]
+    if decode.orjson is not None:
+        variants.append(('page_orjson', page_columns, fast_loads))
+    results = []
+    reference = None
+    for name, func, loads in variants:
+        decode.loads = loads
+        accumulator = KlineAccumulator(first, last + INTERVAL_MS, INTERVAL_MS)
+        try:
+            seconds, _ = timed(func, pages, accumulator)
+        finally:
+            decode.loads = fast_loads
+        if reference is None:
+            reference = accumulator
+        else:
+            # Тот же результат до бита: те же слоты и те же значения
+            assert np.array_equal(accumulator.filled, reference.filled)
+            for column in VALUE_COLUMNS:
+                assert np.array_equal(accumulator.columns[column], reference.columns[column], equal_nan=True)
+        results.append({'name': name, 'pages': len(pages), 'candles': candles, 'seconds': seconds,
+                        'us_per_page': seconds / len(pages) * 1e6})
+    return results
+
+
+if __name__ == "__main__":
+    # python bench_decode.py [страниц | каталог data/http_cache с записанными ответами]
+    source = sys.argv[1] if len(sys.argv) > 1 else '2000'
+    pages = recorded_pages(source) if os.path.isdir(source) else synthetic_pages(int(source))
+    if not pages:
+        print(f"В {source} нет записанных страниц /v5/market/kline")
+        sys.exit(1)
+    results = run(pages)
+    baseline = results[0]['seconds']
+    print(f"{'вариант':<16}{'страниц':>9}{'мкс/стр.':>10}{'свечей/с':>12}{'ускорение':>11}")
+    for result in results:
+        print(f"{result['name']:<16}{result['pages']:>9}{result['us_per_page']:>10.0f}"
+              f"{result['candles'] / result['seconds']:>12.0f}{baseline / result['seconds']:>10.1f}x")
@@ -0,0 +1,62 @@
+# Офлайн-бенчмарк CollectorEngine: 100+ символов против локального стенда ByBit REST
+import sys
+import tempfile
+import time
+
+import requests
+
+from collector_engine import CollectorEngine
+from rate_limit import AdaptiveRateLimiter
+from stub_bybit import StubRestServer
+
+
+class _NoKeepAlive:
+    """Старое поведение: requests.get без Session — новое соединение на каждый запрос"""
+
+    def get(self, url, **kwargs):
+        return requests.get(url, **kwargs)
+
+    def close(self):
+        pass
+
+
+def run_mode(name, server_url, symbols, duration, period, **engine_kwargs):
+    with tempfile.TemporaryDirectory() as tmp:
+        # У стенда нет квоты: лимитер с большим потолком, чтобы сравнивать только транспорт
+        engine = CollectorEngine({'spot': symbols}, period=period, base_url=server_url,
+                                 output_dir=tmp, rate_limiter=AdaptiveRateLimiter(10_000), **engine_kwargs)
+        started = time.perf_counter()
+        engine.run(duration=duration)
+        engine.close()
+        elapsed = time.perf_counter() - started
+    stats = engine.stats()
+    stats['name'] = name
+    stats['rows_per_s'] = stats['rows'] / elapsed
+    # Доля тиков, реально выполненных по расписанию
+    expected = len(engine.jobs) * duration / period
+    stats['cadence'] = stats['ticks'] / expected if expected else 0.0
+    return stats
+
+
+def run(symbol_count=150, duration=5.0, period=0.5, latency=0.02):
+    symbols = [f"SYM{i:03d}USDT" for i in range(symbol_count)]
+    server = StubRestServer(symbols, latency=latency).start()
+    try:
+        return [
+            run_mode('batch_category', server.url, symbols, duration, period),
+            run_mode('per_symbol_pooled', server.url, symbols, duration, period,
+                     batch_threshold=symbol_count + 1, workers=32),
+            run_mode('per_symbol_no_keepalive', server.url, symbols, duration, period,
+                     batch_threshold=symbol_count + 1, workers=32, session=_NoKeepAlive()),
+        ]
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    print(f"{'режим':<26}{'запросов':>9}{'строк/с':>10}{'p50 мс':>9}{'p99 мс':>9}{'по графику':>12}{'пропущено':>11}")
+    for result in run(count):
+        print(f"{result['name']:<26}{result['requests']:>9}{result['rows_per_s']:>10.0f}"
+              f"{result['latency_p50_ms']:>9.1f}{result['latency_p99_ms']:>9.1f}"
+              f"{result['cadence']:>11.0%}{result['missed_ticks'] + result['overlapped_ticks']:>11}")
@@ -0,0 +1,100 @@
+# Признаки для обучения: пересчёт в pandas на каждый эксперимент против кэша стадий в memmap-матрицах
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest import load_candles
+from features import DEFAULT_STAGES, FeatureCache, FeaturePipeline, Stage
+
+START_TS = 1674432000000          # 2023-01-23
+DAY = 1440
+
+
+def make_candles(n, start_ts=START_TS, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 2.0 * np.exp(np.cumsum(rng.normal(0, 0.0008, n)))
+    open_ = close * (1 + rng.normal(0, 0.0001, n))
+    spread = np.abs(rng.normal(0, 0.0006, n))
+    return pd.DataFrame({
+        'open': open_,
+        'high': np.maximum(open_, close) * (1 + spread),
+        'low': np.minimum(open_, close) * (1 - spread),
+        'close': close,
+        'volume': rng.uniform(100, 10_000, n),
+    }, index=pd.to_datetime(start_ts + np.arange(n, dtype=np.int64) * 60_000, unit='ms').rename('timestamp'))
+
+
+def compute_in_memory(csv_file):
+    """Старый путь: прочитать CSV и посчитать все признаки заново"""
+    df = load_candles(csv_file)
+    columns = {'timestamp': df.index.values.astype('datetime64[ms]').astype(np.float64)}
+    columns.update({column: df[column].to_numpy() for column in df.columns})
+    outputs = {}
+    for stage in DEFAULT_STAGES:
+        inputs = {}
+        for name in stage.inputs:
+            inputs.update(columns if name == 'candles' else outputs[name])
+        outputs[stage.name] = stage.func(inputs, **stage.params)
+    return pd.DataFrame({column: values for result in outputs.values() for column, values in result.items()},
+                        index=df.index)
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def run(n=1_400_000):
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        candles = make_candles(n + DAY)
+        history, fresh = candles.iloc[:n], candles
+        csv_file = os.path.join(root, 'candles.csv')
+        history.to_csv(csv_file)
+
+        seconds, expected = timed(compute_in_memory, csv_file)
+        results.append({'name': 'csv+pandas', 'seconds': seconds})
+
+        cache = FeatureCache(os.path.join(root, 'features'))
+        pipeline = FeaturePipeline(cache=cache)
+        seconds, features = timed(pipeline.build, history, 'TONUSDT_1')
+        results.append({'name': 'cold_build', 'seconds': seconds, 'actions': pipeline.summary()})
+        assert features.columns == list(expected.columns)
+        assert np.allclose(features[:], expected.to_numpy(np.float32), equal_nan=True, rtol=1e-5, atol=1e-6)
+
+        seconds, _ = timed(pipeline.build, history, 'TONUSDT_1')
+        results.append({'name': 'warm_build', 'seconds': seconds, 'actions': pipeline.summary()})
+
+        # Свежий день свечей: стадии с конечным lookback досчитывают только хвост
+        seconds, appended = timed(pipeline.build, fresh, 'TONUSDT_1')
+        results.append({'name': 'append_day', 'seconds': seconds, 'actions': pipeline.summary()})
+        reference = FeaturePipeline(cache=FeatureCache(os.path.join(root, 'reference'))).build(fresh, 'TONUSDT_1')
+        assert np.allclose(appended[:], reference[:], equal_nan=True, rtol=1e-5, atol=1e-6)
+
+        # Новый параметр одной стадии: пересчитывается она и зависящие от неё, остальное из кэша
+        stages = [Stage('returns', DEFAULT_STAGES[0].func, {'periods': [1, 5, 15, 60, 240]}, lookback=240)]
+        stages += DEFAULT_STAGES[1:]
+        changed = FeaturePipeline(stages, cache)
+        seconds, _ = timed(changed.build, fresh, 'TONUSDT_1')
+        results.append({'name': 'changed_stage', 'seconds': seconds, 'actions': changed.summary()})
+
+        # Обучение: открыть готовую матрицу и прочитать случайный батч
+        seconds, opened = timed(FeaturePipeline(cache=cache).open, 'TONUSDT_1')
+        results.append({'name': 'open', 'seconds': seconds, 'actions': f"{opened.shape[0]} x {opened.shape[1]}"})
+        rows = np.sort(np.random.default_rng(1).choice(len(opened), 4096, replace=False))
+        seconds, batch = timed(opened.__getitem__, rows)
+        results.append({'name': 'random_batch', 'seconds': seconds, 'actions': f"{batch.shape[0]} строк"})
+        results.append({'name': 'cache_bytes', 'seconds': 0.0, 'actions': f"{cache.total_bytes() / 1024 ** 2:.0f} МБ"})
+    return results
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_400_000
+    print(f"{'вариант':<16}{'время, с':>10}  стадии")
+    for result in run(n):
+        print(f"{result['name']:<16}{result['seconds']:>10.3f}  {result.get('actions', '')}")
@@ -0,0 +1,123 @@
+# Стоимость обновления индикаторов на новый бар: пакетный пересчёт окна (как pandas-ta) против инкрементального
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicators import IndicatorSet
+
+try:
+    import pandas_ta as ta
+except ImportError:       # pandas-ta ставится не везде — тогда эталон считается теми же формулами на pandas
+    ta = None
+
+TICKS = 2_000             # Сколько новых баров прогоняем для замера инкрементального пути
+TOLERANCE = 1e-8
+
+
+def make_closes(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return 2.0 * np.exp(np.cumsum(rng.normal(0, 0.0008, n)))
+
+
+def _ema(series, length):
+    series = series.copy()
+    seed = series.iloc[:length].mean()
+    series.iloc[:length - 1] = np.nan
+    series.iloc[length - 1] = seed
+    return series.ewm(span=length, adjust=False).mean()
+
+
+def batch_indicators(closes):
+    """Пакетный пересчёт по всему окну — то, что делает pandas-ta на каждом тике"""
+    close = pd.Series(closes)
+    if ta is not None:
+        macd = ta.macd(close, 12, 26, 9)
+        bbands = ta.bbands(close, 20, 2.0)
+        return {
+            'ema_20': ta.ema(close, 20).to_numpy(),
+            'sma_50': ta.sma(close, 50).to_numpy(),
+            'rsi_14': ta.rsi(close, 14).to_numpy(),
+            'macd': macd.iloc[:, 0].to_numpy(),
+            'macd_signal': macd.iloc[:, 2].to_numpy(),
+            'bb_lower': bbands.iloc[:, 0].to_numpy(),
+            'bb_upper': bbands.iloc[:, 2].to_numpy(),
+        }
+    change = close.diff()
+    gain = change.clip(lower=0).ewm(alpha=1 / 14, min_periods=14).mean()
+    loss = (-change).clip(lower=0).ewm(alpha=1 / 14, min_periods=14).mean()
+    macd = _ema(close, 12) - _ema(close, 26)
+    signal = pd.Series(np.nan, index=close.index)
+    signal.iloc[25:] = _ema(macd.iloc[25:], 9)
+    mid = close.rolling(20).mean()
+    deviation = close.rolling(20).std(ddof=0)
+    return {
+        'ema_20': _ema(close, 20).to_numpy(),
+        'sma_50': close.rolling(50).mean().to_numpy(),
+        'rsi_14': (100 * gain / (gain + loss)).to_numpy(),
+        'macd': macd.to_numpy(),
+        'macd_signal': signal.to_numpy(),
+        'bb_lower': (mid - 2 * deviation).to_numpy(),
+        'bb_upper': (mid + 2 * deviation).to_numpy(),
+    }
+
+
+def flatten(values):
+    macd = values['macd'] or (None, None, None)
+    bbands = values['bbands'] or (None, None, None)
+    return {'ema_20': values['ema_20'], 'sma_50': values['sma_50'], 'rsi_14': values['rsi_14'],
+            'macd': macd[0], 'macd_signal': macd[1], 'bb_lower': bbands[0], 'bb_upper': bbands[2]}
+
+
+def check_accuracy(closes):
+    """Прогрев по первой половине, дальше потиковые обновления — сверяем с пакетным расчётом"""
+    half = len(closes) // 2
+    indicators = IndicatorSet()
+    indicators.warm_up(closes[:half])
+    streamed = {name: [] for name in flatten(indicators.values())}
+    for x in closes[half:]:
+        for name, value in flatten(indicators.update(x)).items():
+            streamed[name].append(np.nan if value is None else value)
+    reference = batch_indicators(closes)
+    errors = {}
+    for name, values in streamed.items():
+        expected = reference[name][half:]
+        errors[name] = float(np.nanmax(np.abs(np.array(values) - expected) / np.abs(expected)))
+    return errors
+
+
+def run(windows=(10_000, 100_000, 1_000_000)):
+    results = []
+    for window in windows:
+        closes = make_closes(window + TICKS)
+        started = time.perf_counter()
+        repeats = max(1, min(20, 2_000_000 // window))
+        for i in range(repeats):
+            batch_indicators(closes[i:i + window])
+        batch = (time.perf_counter() - started) / repeats
+
+        indicators = IndicatorSet()
+        started = time.perf_counter()
+        indicators.warm_up(closes[:window])
+        warm_up = time.perf_counter() - started
+        started = time.perf_counter()
+        for x in closes[window:]:
+            indicators.update(x)
+        incremental = (time.perf_counter() - started) / TICKS
+        results.append({'window': window, 'batch_ms': batch * 1000, 'incremental_us': incremental * 1e6,
+                        'warm_up_ms': warm_up * 1000, 'speedup': batch / incremental})
+    return results
+
+
+if __name__ == "__main__":
+    windows = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    errors = check_accuracy(make_closes(20_000, seed=1))
+    worst = max(errors.values())
+    print(f"Эталон: {'pandas-ta' if ta is not None else 'формулы pandas-ta на pandas'}, "
+          f"макс. относительное расхождение {worst:.2e}")
+    assert worst < TOLERANCE, errors
+    print(f"{'окно':>10}{'пакетно, мс':>14}{'на тик, мкс':>14}{'прогрев, мс':>14}{'ускорение':>12}")
+    for result in run(windows):
+        print(f"{result['window']:>10}{result['batch_ms']:>14.1f}{result['incremental_us']:>14.1f}"
+              f"{result['warm_up_ms']:>14.1f}{result['speedup']:>11.0f}x")
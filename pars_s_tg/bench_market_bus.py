@@ -0,0 +1,159 @@
+# Живые данные для потребителей: хвост CSV с разбором строк против шины в разделяемой памяти
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from buffered_writer import BufferedWriter
+from market_bus import POLL_SECONDS, MarketBusReader, MarketBusWriter
+
+BUS_NAME = f"moon_bench_{os.getpid()}"
+CSV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'publish_ns']
+LAST_N = 1000
+FLUSH_ROWS = 60             # Как FLUSH_ROWS/FLUSH_INTERVAL в parsing_ton.py
+FLUSH_INTERVAL = 10.0
+
+
+def bus_consumer(name, count, conn):
+    reader = MarketBusReader(name)
+    last_seq = reader.latest_seq() + count
+    conn.send('ready')
+    latencies = np.zeros(count, dtype=np.int64)
+    received = 0
+    while received < count:
+        record = reader.wait_next(timeout=5.0)
+        if record is None:
+            break
+        latencies[received] = time.time_ns() - record['publish_ns']
+        received += 1
+        if record['seq'] >= last_seq:
+            break
+    conn.send((latencies[:received], reader.dropped))
+    reader.close()
+
+
+def csv_consumer(path, count, conn):
+    """Старый путь: хвост CSV — опрос файла, разбор каждой новой строки"""
+    f = open(path)
+    f.readline()
+    conn.send('ready')
+    latencies = np.zeros(count, dtype=np.int64)
+    received = 0
+    partial = ''
+    deadline = time.monotonic() + 5.0
+    while received < count and time.monotonic() < deadline:
+        line = f.readline()
+        if not line:
+            time.sleep(POLL_SECONDS)
+            continue
+        if not line.endswith('\n'):
+            partial += line     # Строка дописана не целиком
+            continue
+        values = (partial + line).split(',')
+        partial = ''
+        bar = [float(value) for value in values[:-1]]     # Потребителю нужны числа, а не строки
+        latencies[received] = time.time_ns() - int(values[-1])
+        received += 1
+        deadline = time.monotonic() + 5.0
+    f.close()
+    conn.send((latencies[:received], 0))
+
+
+def paced(count, rate, publish):
+    """Публикует count записей с темпом rate в секунду (None — без пауз); возвращает время в publish"""
+    started = time.perf_counter()
+    spent = 0.0
+    for i in range(count):
+        if rate:
+            # Сборщик между тиками спит, а не крутится: иначе на одном ядре он мешал бы потребителю
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        close = 2.0 + i * 1e-4
+        begin = time.perf_counter()
+        publish(1674432000000 + i * 1000, close, close + 0.001, close - 0.001, close, 100.0 + i)
+        spent += time.perf_counter() - begin
+    return spent
+
+
+def measure(target, args, count, rate, publish, close=None):
+    parent, child = multiprocessing.Pipe()
+    consumer = multiprocessing.Process(target=target, args=args + (count, child))
+    consumer.start()
+    parent.recv()
+    seconds = paced(count, rate, publish)
+    if close:
+        close()
+    latencies, dropped = parent.recv()
+    consumer.join()
+    latencies = latencies / 1000.0
+    return {'messages': len(latencies), 'publish_us': seconds / count * 1e6, 'dropped': dropped,
+            'p50_us': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            'p99_us': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+            'max_us': float(latencies.max()) if len(latencies) else 0.0}
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def run(messages=20000, rate=1000):
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        # Буфер как у живых сборщиков: потребитель видит строки только после сброса пачки
+        csv_path = os.path.join(root, 'batched.csv')
+        writer = BufferedWriter(csv_path, CSV_COLUMNS, flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL)
+        publish = lambda *row: writer.write(row + (time.time_ns(),))
+        results.append({'name': 'csv_batched', **measure(csv_consumer, (csv_path,), messages, rate, publish,
+                                                         writer.close)})
+
+        # Чтобы потребитель видел свежие строки, CSV приходится сбрасывать на каждой записи
+        csv_path = os.path.join(root, 'ticks.csv')
+        writer = BufferedWriter(csv_path, CSV_COLUMNS, flush_rows=1)
+        publish = lambda *row: writer.write(row + (time.time_ns(),))
+        results.append({'name': 'csv_tail', **measure(csv_consumer, (csv_path,), messages, rate, publish)})
+        writer.close()
+
+        bus = MarketBusWriter(BUS_NAME)
+        try:
+            results.append({'name': 'bus', **measure(bus_consumer, (BUS_NAME,), messages, rate, bus.publish)})
+            # Без пауз: писатель быстрее читателя, отставшие записи перезаписываются и считаются в dropped
+            results.append({'name': 'bus_burst', **measure(bus_consumer, (BUS_NAME,), messages, None,
+                                                           bus.publish)})
+
+            # Последние N баров: срез разделяемой памяти против чтения CSV целиком
+            reader = MarketBusReader(BUS_NAME)
+            seconds, view = timed(reader.last_n, LAST_N)
+            results.append({'name': f'last_{LAST_N}_view', 'seconds': seconds, 'rows': len(view)})
+            seconds, copy = timed(reader.last_n, LAST_N, copy=True)
+            results.append({'name': f'last_{LAST_N}_copy', 'seconds': seconds, 'rows': len(copy)})
+            assert np.array_equal(view, copy) and reader.valid(view)
+            assert np.all(np.diff(view['seq'].astype(np.int64)) == 1)
+            del view
+            reader.close()
+        finally:
+            bus.close()
+        seconds, tail = timed(lambda: pd.read_csv(csv_path).tail(LAST_N))
+        results.append({'name': f'last_{LAST_N}_csv', 'seconds': seconds, 'rows': len(tail)})
+    return results
+
+
+if __name__ == "__main__":
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rate = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    results = run(messages, rate)
+    print(f"{'вариант':<16}{'получено':>10}{'публ., мкс':>12}{'p50, мкс':>10}{'p99, мкс':>10}"
+          f"{'max, мкс':>10}{'пропущено':>11}")
+    for result in results:
+        if 'p50_us' in result:
+            print(f"{result['name']:<16}{result['messages']:>10}{result['publish_us']:>12.1f}{result['p50_us']:>10.0f}"
+                  f"{result['p99_us']:>10.0f}{result['max_us']:>10.0f}{result['dropped']:>11}")
+    for result in results:
+        if 'rows' in result:
+            print(f"{result['name']:<16}{result['rows']:>10} строк  {result['seconds'] * 1e6:>10.0f} мкс")
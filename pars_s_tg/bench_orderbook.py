@@ -0,0 +1,126 @@
+# Стакан по потоку snapshot + delta: словарь float-цен с сортировкой против отсортированных массивов L2Book
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import websockets
+
+from orderbook import L2Book, OrderBookCollector, read_depth
+from stub_bybit import ReplayServer, make_synthetic_orderbook_session
+
+LEVELS = 20
+
+
+class DictBook:
+    """Наивный стакан: dict цена -> размер, top-N сортировкой всех уровней (эталон и старый путь)"""
+
+    def __init__(self):
+        self.bids = {}
+        self.asks = {}
+
+    def apply(self, message):
+        data = message['data']
+        if message['type'] == 'snapshot':
+            self.bids, self.asks = {}, {}
+        for side, levels in ((self.bids, data['b']), (self.asks, data['a'])):
+            for price, size in levels:
+                if float(size) == 0:
+                    side.pop(float(price), None)
+                else:
+                    side[float(price)] = float(size)
+
+    def top(self, levels):
+        bids = sorted(self.bids.items(), reverse=True)[:levels]
+        asks = sorted(self.asks.items())[:levels]
+        return bids, asks
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def apply_all(book, messages, every_top=False):
+    for message in messages:
+        book.apply(message)
+        if every_top:
+            # Лучшие уровни нужны после каждого обновления (сигналы, признаки спреда)
+            if isinstance(book, DictBook):
+                book.top(LEVELS)
+            else:
+                book.bids.top_prices(LEVELS)
+                book.asks.top_prices(LEVELS)
+    return book
+
+
+async def replay(messages, path, port=8767):
+    server = ReplayServer(messages, port=port)
+    collector = OrderBookCollector(url=server.url, file_prefix=path, levels=LEVELS)
+    async with websockets.serve(server.handler, server.host, server.port):
+        await collector.run(max_reconnects=0)
+    return collector
+
+
+def run(seconds=600, updates_per_second=500):
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        session = os.path.join(root, 'orderbook.jsonl')
+        make_synthetic_orderbook_session(session, seconds=seconds, updates_per_second=updates_per_second)
+        with open(session) as f:
+            raw = f.read().splitlines()
+        messages = [json.loads(line) for line in raw]
+
+        for name, make_book in (('dict', DictBook), ('l2book', lambda: L2Book('TONUSDT'))):
+            for every_top in (False, True):
+                elapsed, _ = timed(apply_all, make_book(), messages, every_top)
+                results.append({'name': f"{name}{'+top' if every_top else ''}", 'messages': len(messages),
+                                'seconds': elapsed, 'per_second': len(messages) / elapsed})
+
+        # Сверка с эталоном: итоговые top-N совпадают
+        reference = apply_all(DictBook(), messages)
+        book = apply_all(L2Book('TONUSDT'), messages)
+        bids, asks = reference.top(LEVELS)
+        assert book.bids.top_prices(LEVELS) == ([price for price, _ in bids], [size for _, size in bids])
+        assert book.asks.top_prices(LEVELS) == ([price for price, _ in asks], [size for _, size in asks])
+        assert not book.crossed()
+
+        # Полный путь: WebSocket-стенд без пауз -> json -> книга -> снимки раз в секунду на диск
+        prefix = os.path.join(root, 'tonusdt_ws')
+        elapsed, collector = timed(asyncio.run, replay(raw, prefix))
+        results.append({'name': 'ws_replay', 'messages': collector.messages, 'seconds': elapsed,
+                        'per_second': collector.messages / elapsed})
+
+        depth_path = collector.writer.path
+        elapsed, depth = timed(read_depth, depth_path)
+        assert len(depth['timestamp']) == collector.writer.rows_written
+        assert np.all(np.diff(depth['timestamp']) > 0)
+        assert np.all(depth['bid_price'][:, 0] < depth['ask_price'][:, 0])
+
+        # Тот же снимок в CSV для сравнения размера
+        csv_path = os.path.join(root, 'depth.csv')
+        columns = [f"{side}_{kind}_{i}" for side in ('bid', 'ask') for kind in ('price', 'size') for i in range(LEVELS)]
+        with open(csv_path, 'w') as f:
+            f.write(','.join(['timestamp', 'update_id'] + columns) + '\n')
+            for i in range(len(depth['timestamp'])):
+                values = np.concatenate([depth[name][i] for name in ('bid_price', 'bid_size', 'ask_price', 'ask_size')])
+                f.write(f"{depth['timestamp'][i]},{depth['update_id'][i]}," + ','.join(map(str, values)) + '\n')
+        results.append({'name': 'read_depth', 'messages': len(depth['timestamp']), 'seconds': elapsed,
+                        'per_second': len(depth['timestamp']) / elapsed if elapsed else 0.0,
+                        'bytes': os.path.getsize(depth_path), 'csv_bytes': os.path.getsize(csv_path)})
+    return results
+
+
+if __name__ == "__main__":
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    rate = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    results = run(seconds, rate)
+    print(f"{'вариант':<14}{'сообщений':>11}{'время, с':>11}{'сообщ./с':>12}")
+    for result in results:
+        print(f"{result['name']:<14}{result['messages']:>11}{result['seconds']:>11.3f}{result['per_second']:>12.0f}")
+    depth = results[-1]
+    print(f"Файл глубины: {depth['bytes'] / 1024:.0f} КБ, тот же снимок в CSV: {depth['csv_bytes'] / 1024:.0f} КБ")
@@ -0,0 +1,85 @@
+# Пропускная способность загрузчика против стенда с квотой ByBit: фиксированные паузы, статический и адаптивный лимит
+import sys
+import threading
+import time
+
+from collector_engine import make_session
+from rate_limit import AdaptiveRateLimiter, TokenBucket, is_rate_limited
+from stub_bybit import StubRestServer
+
+THREADS = 8
+
+
+class _FixedSleep:
+    """Старое поведение main(): пауза 0.2 с после каждого запроса в каждом потоке"""
+
+    def acquire(self):
+        pass
+
+    def observe(self, status_code, headers=None, content=b''):
+        time.sleep(0.2)
+        return is_rate_limited(status_code, content)
+
+
+class _Static:
+    """Token bucket без обратной связи от биржи"""
+
+    def __init__(self, rate):
+        self.bucket = TokenBucket(rate)
+
+    def acquire(self):
+        self.bucket.acquire()
+
+    def observe(self, status_code, headers=None, content=b''):
+        return is_rate_limited(status_code, content)
+
+
+def run_mode(name, limiter, server, duration):
+    session = make_session(THREADS)
+    counts = {'ok': 0, 'limited': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        while time.monotonic() < deadline:
+            limiter.acquire()
+            response = session.get(f"{server.url}/v5/market/tickers", params={'category': 'spot'}, timeout=5)
+            limited = limiter.observe(response.status_code, response.headers, response.content)
+            with lock:
+                counts['limited' if limited else 'ok'] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    session.close()
+    return {'name': name, 'ok_rps': counts['ok'] / elapsed, 'limited': counts['limited'],
+            'utilization': counts['ok'] / elapsed / (server.quota / server.quota_window)}
+
+
+def run(quota=100, duration=8.0, latency=0.001):
+    results = []
+    modes = [
+        ('fixed_sleep_0.2s', lambda: _FixedSleep()),
+        ('token_bucket_10', lambda: _Static(10)),
+        ('static_200', lambda: _Static(200)),
+        ('adaptive_max_200', lambda: AdaptiveRateLimiter(50, max_rate=200, base_backoff=0.2)),
+    ]
+    for name, factory in modes:
+        server = StubRestServer(latency=latency, quota=quota, quota_window=1.0).start()
+        try:
+            results.append(run_mode(name, factory(), server, duration))
+        finally:
+            server.stop()
+    return results
+
+
+if __name__ == "__main__":
+    quota = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    print(f"Квота стенда: {quota} запросов в секунду, потоков: {THREADS}")
+    print(f"{'режим':<20}{'успешных/с':>12}{'отказов 10006':>15}{'от квоты':>10}")
+    for result in run(quota):
+        print(f"{result['name']:<20}{result['ok_rps']:>12.1f}{result['limited']:>15}{result['utilization']:>10.0%}")
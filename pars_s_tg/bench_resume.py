@@ -0,0 +1,102 @@
+# Время возобновления load_dt02 на синтетических частичных файлах 1M/5M строк
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from kline_accumulator import KlineAccumulator
+from segment_store import SegmentStore
+
+START_TS = 1674432000000          # 2023-01-23
+INTERVAL_MS = 60_000
+SEGMENT_ROWS = 10_000             # 50 запросов по 200 свечей — один чекпоинт
+ITERROWS_SAMPLE = 100_000         # iterrows слишком медленный, меряем на выборке и экстраполируем
+
+
+def make_frame(n):
+    rng = np.random.default_rng(0)
+    close = 2.0 + np.cumsum(rng.normal(0, 0.001, n))
+    return pd.DataFrame({
+        'timestamp': START_TS + np.arange(n, dtype=np.int64) * INTERVAL_MS,
+        'open': close + 0.001, 'high': close + 0.002, 'low': close - 0.002,
+        'close': close, 'volume': rng.uniform(100, 10_000, n),
+    })
+
+
+def resume_iterrows(csv_path, n):
+    """Старый путь load_resume_info: read_csv с разбором дат + iterrows + list[dict] + set"""
+    existing_df = pd.read_csv(csv_path, index_col='timestamp', parse_dates=True, nrows=n)
+    all_klines, seen_timestamps = [], set()
+    for idx, row in existing_df.iterrows():
+        ts = int(idx.timestamp() * 1000)
+        all_klines.append({"timestamp": ts, "open": row['open'], "high": row['high'], "low": row['low'],
+                           "close": row['close'], "volume": row['volume']})
+        seen_timestamps.add(ts)
+    return len(all_klines)
+
+
+def resume_csv_vectorized(csv_path, n):
+    accumulator = KlineAccumulator(START_TS, START_TS + n * INTERVAL_MS, INTERVAL_MS)
+    df = pd.read_csv(csv_path)
+    df['timestamp'] = pd.to_datetime(df['timestamp']).astype('datetime64[ms]').astype('int64')
+    return accumulator.add_records(df)
+
+
+def resume_segments(directory, n):
+    accumulator = KlineAccumulator(START_TS, START_TS + n * INTERVAL_MS, INTERVAL_MS)
+    for records in SegmentStore(directory).iter_arrays():
+        accumulator.add_records(records)
+    return len(accumulator)
+
+
+def read_raw(directory, n):
+    """Нижняя граница: просто прочитать байты сегментов с диска"""
+    total = 0
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name), 'rb') as f:
+            total += len(f.read())
+    return total
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def run(sizes=(1_000_000, 5_000_000)):
+    results = []
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            df = make_frame(n)
+            csv_path = os.path.join(tmp, 'partial.csv')
+            legacy = df.copy()
+            legacy['timestamp'] = pd.to_datetime(legacy['timestamp'], unit='ms')
+            legacy.to_csv(csv_path, index=False)
+
+            store = SegmentStore(os.path.join(tmp, 'segments'))
+            for offset in range(0, n, SEGMENT_ROWS):
+                store.append(df.iloc[offset:offset + SEGMENT_ROWS])
+
+            sample = min(n, ITERROWS_SAMPLE)
+            seconds, _ = timed(resume_iterrows, csv_path, sample)
+            results.append({'name': 'iterrows_csv', 'rows': n, 'seconds': seconds * n / sample,
+                            'extrapolated_from': sample})
+            seconds, _ = timed(resume_csv_vectorized, csv_path, n)
+            results.append({'name': 'vectorized_csv', 'rows': n, 'seconds': seconds})
+            seconds, _ = timed(resume_segments, store.directory, n)
+            results.append({'name': 'mmap_segments', 'rows': n, 'seconds': seconds})
+            seconds, size = timed(read_raw, store.directory, n)
+            results.append({'name': 'raw_disk_read', 'rows': n, 'seconds': seconds, 'bytes': size})
+    return results
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000_000, 5_000_000]
+    print(f"{'вариант':<18}{'строк':>10}{'время, с':>11}")
+    for result in run(sizes):
+        note = f"  (экстраполяция с {result['extrapolated_from']})" if 'extrapolated_from' in result else ''
+        print(f"{result['name']:<18}{result['rows']:>10}{result['seconds']:>11.2f}{note}")
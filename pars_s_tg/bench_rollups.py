@@ -0,0 +1,70 @@
+# Запрос таймфрейма по минутной истории: resample на каждый запрос против материализованных уровней
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bars import TIMEFRAMES, read_bars, rebuild_rollups, update_rollups
+from storage import read_ohlcv, write_ohlcv
+
+START_TS = 1674432000000          # 2023-01-23
+SYMBOL = 'TONUSDT'
+RESAMPLE_RULES = {'5m': '5min', '15m': '15min', '1h': '1h', '1d': '1D'}
+
+
+def make_minutes(n, start_ts=START_TS, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 2.0 * np.exp(np.cumsum(rng.normal(0, 0.0008, n)))
+    return pd.DataFrame({
+        'timestamp': start_ts + np.arange(n, dtype=np.int64) * TIMEFRAMES['1m'],
+        'open': close * 0.9999, 'high': close * 1.001, 'low': close * 0.999, 'close': close,
+        'volume': rng.uniform(100, 10_000, n),
+    })
+
+
+def query_resample(root, timeframe):
+    """Старый путь: прочитать всю минутную историю и агрегировать её заново"""
+    df = read_ohlcv(SYMBOL, 'linear_1', root=root)
+    df.index = pd.to_datetime(df.pop('timestamp'), unit='ms')
+    return df.resample(RESAMPLE_RULES[timeframe]).agg(
+        {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}).dropna()
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def run(n=1_400_000):
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        df = make_minutes(n)
+        write_ohlcv(df, SYMBOL, 'linear_1', root)
+        seconds, _ = timed(rebuild_rollups, SYMBOL, 'linear', root=root)
+        results.append({'name': 'rebuild_all_levels', 'seconds': seconds})
+
+        # Догрузка одного дня свежих минут: уровни досчитываются только по нему
+        tail = make_minutes(1440, START_TS + n * TIMEFRAMES['1m'], seed=1)
+        write_ohlcv(tail, SYMBOL, 'linear_1', root)
+        seconds, _ = timed(update_rollups, SYMBOL, 'linear', int(tail['timestamp'].iloc[0]),
+                           int(tail['timestamp'].iloc[-1]) + TIMEFRAMES['1m'], root=root)
+        results.append({'name': 'incremental_day', 'seconds': seconds})
+
+        for timeframe in RESAMPLE_RULES:
+            seconds, resampled = timed(query_resample, root, timeframe)
+            results.append({'name': f"resample_{timeframe}", 'seconds': seconds, 'rows': len(resampled)})
+            seconds, bars = timed(read_bars, SYMBOL, 'linear', timeframe, root=root)
+            results.append({'name': f"rollup_{timeframe}", 'seconds': seconds, 'rows': len(bars)})
+            assert len(bars) == len(resampled)
+            assert np.allclose(bars['close'].to_numpy(), resampled['close'].to_numpy())
+    return results
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_400_000
+    print(f"{'вариант':<20}{'баров':>10}{'время, с':>11}")
+    for result in run(n):
+        print(f"{result['name']:<20}{result.get('rows', ''):>10}{result['seconds']:>11.3f}")
@@ -0,0 +1,319 @@
+# Офлайн-набор бенчмарков горячих путей сбора и хранения: стенд stub_bybit вместо биржи, синтетические
+# свечи, каждый замер — в отдельном процессе (чистый пиковый RSS), результаты — JSON для сравнения коммитов.
+#
+#   python bench_suite.py [--quick] [--output файл.json]
+#   python bench_suite.py --compare старый.json новый.json
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+START_TS = 1674432000000          # 2023-01-23
+INTERVAL_MS = 60_000
+RESULTS_DIR = os.path.join(ROOT, 'data', 'bench')
+
+# Размеры замеров: полный прогон и быстрый (--quick) для проверки перед коммитом
+CONFIG = {
+    'full': {
+        'save_to_csv': {'rows': 100_000},
+        'save_progress': {'sizes': [100_000, 500_000, 1_000_000], 'checkpoint_rows': 10_000},
+        'load_resume_info': {'sizes': [100_000, 1_000_000]},
+        'kline_parse': {'pages': 2000, 'limit': 200},
+        'backfill': {'days': 30, 'workers': 4, 'latency': 0.005, 'error_rate': 0.0},
+    },
+    'quick': {
+        'save_to_csv': {'rows': 10_000},
+        'save_progress': {'sizes': [20_000, 100_000], 'checkpoint_rows': 10_000},
+        'load_resume_info': {'sizes': [100_000]},
+        'kline_parse': {'pages': 200, 'limit': 200},
+        'backfill': {'days': 3, 'workers': 4, 'latency': 0.002, 'error_rate': 0.0},
+    },
+}
+# Главная метрика каждого замера для --compare: (ключ, больше — лучше)
+HEADLINE = {
+    'save_to_csv': ('us_per_record', False),
+    'save_progress': ('seconds_at_max', False),
+    'load_resume_info': ('seconds_at_max', False),
+    'kline_parse': ('us_per_page', False),
+    'backfill': ('candles_per_s', True),
+}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Коллекторы печатают каждую строку — в замере вывод глушим"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@contextlib.contextmanager
+def working_dir(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def make_frame(n, start_ts=START_TS, seed=0):
+    """Синтетические минутные свечи с колонкой timestamp в мс"""
+    rng = np.random.default_rng(seed)
+    close = 2.0 + np.cumsum(rng.normal(0, 0.001, n))
+    return pd.DataFrame({
+        'timestamp': start_ts + np.arange(n, dtype=np.int64) * INTERVAL_MS,
+        'open': close + 0.001, 'high': close + 0.002, 'low': close - 0.002,
+        'close': close, 'volume': rng.uniform(100, 10_000, n),
+    })
+
+
+def load_dt02_fresh(start_ts, end_ts):
+    """load_dt02 с чистым состоянием под диапазон [start_ts, end_ts) в текущем каталоге"""
+    import load_dt02
+    from http_cache import MODE_OFF, HttpCache
+    from kline_accumulator import KlineAccumulator
+    from rate_limit import AdaptiveRateLimiter
+    from segment_store import SegmentStore
+
+    load_dt02.http_cache = HttpCache(mode=MODE_OFF)
+    # У стенда нет квоты: лимитер с большим потолком, чтобы мерить сам путь загрузки
+    load_dt02.rate_limiter = AdaptiveRateLimiter(100_000)
+    load_dt02.stop_event.clear()
+    load_dt02.request_count = load_dt02.last_save_count = 0
+    load_dt02.shards = []
+    os.makedirs('data', exist_ok=True)
+    load_dt02.segment_store = SegmentStore(load_dt02.data_filename('_PARTIAL'))
+    load_dt02.accumulator = KlineAccumulator(start_ts, end_ts, INTERVAL_MS)
+    return load_dt02
+
+
+def case_save_to_csv(rows):
+    """Стоимость одной записи ByBitTONCollector1s.save_to_csv (буфер + пакетный сброс)"""
+    sys.path.insert(0, ROOT)
+    from bench_writer import make_records
+    from parsing_ton import ByBitTONCollector1s
+
+    records = make_records(rows)
+    # Без шины market_bus: замеряется только запись, а живой сборщик на этой машине не теряет свой сегмент
+    os.environ['MARKET_BUS'] = '0'
+    with tempfile.TemporaryDirectory() as tmp, quiet():
+        collector = ByBitTONCollector1s(csv_filename=os.path.join(tmp, 'ticks.csv'))
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        for record in records:
+            collector.save_to_csv(record)
+        collector.writer.close()
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        size = os.path.getsize(collector.csv_filename)
+    return {'rows': rows, 'seconds': wall, 'us_per_record': wall / rows * 1e6,
+            'cpu_us_per_record': cpu / rows * 1e6, 'bytes': size}
+
+
+def case_save_progress(sizes, checkpoint_rows):
+    """Время одного чекпоинта save_progress в зависимости от уже накопленного объёма"""
+    total = max(sizes)
+    frame = make_frame(total)
+    points = []
+    with tempfile.TemporaryDirectory() as tmp, working_dir(tmp):
+        load_dt02 = load_dt02_fresh(START_TS, START_TS + total * INTERVAL_MS)
+        load_dt02.shards = load_dt02.plan_shards(START_TS, START_TS + total * INTERVAL_MS)
+        for offset in range(0, total, checkpoint_rows):
+            load_dt02.accumulator.add_records(frame.iloc[offset:offset + checkpoint_rows])
+            started = time.perf_counter()
+            with quiet():
+                load_dt02.save_progress()
+            seconds = time.perf_counter() - started
+            rows = offset + checkpoint_rows
+            if rows in sizes:
+                points.append({'rows': rows, 'seconds': seconds})
+    return {'checkpoint_rows': checkpoint_rows, 'points': points, 'seconds_at_max': points[-1]['seconds']}
+
+
+def case_load_resume_info(sizes):
+    """Возобновление load_dt02 с сегментов чекпоинтов: от файла до заполненного накопителя"""
+    from segment_store import SegmentStore
+
+    points = []
+    for n in sizes:
+        frame = make_frame(n)
+        end_ts = START_TS + n * INTERVAL_MS
+        with tempfile.TemporaryDirectory() as tmp, working_dir(tmp):
+            load_dt02 = load_dt02_fresh(START_TS, end_ts)
+            store = SegmentStore(load_dt02.data_filename('_PARTIAL'))
+            for offset in range(0, n, 10_000):
+                store.append(frame.iloc[offset:offset + 10_000])
+            shards = load_dt02.plan_shards(START_TS, end_ts)
+            with open(load_dt02.data_filename('_PARTIAL_resume.json'), 'w') as f:
+                json.dump({'shards': shards, 'total_records': n, 'last_request': n // 200}, f)
+            load_dt02.segment_store = SegmentStore(store.directory)
+            load_dt02.input = lambda prompt: 'y'          # Ответ на вопрос "Продолжить?"
+            started = time.perf_counter()
+            with quiet():
+                _, records, _ = load_dt02.load_resume_info(end_ts)
+            seconds = time.perf_counter() - started
+            del load_dt02.input
+            assert records == n, (records, n)
+            points.append({'rows': n, 'seconds': seconds})
+    return {'points': points, 'seconds_at_max': points[-1]['seconds']}
+
+
+def case_kline_parse(pages, limit):
+    """Разбор страницы /v5/market/kline: сырое тело -> колонки -> накопитель, как в fetch_shard"""
+    from decode import decode_kline_page
+    from stub_bybit import StubRestServer
+
+    end_ts = START_TS + pages * limit * INTERVAL_MS
+    stub = StubRestServer(kline_range=(START_TS, end_ts))
+    stub.httpd.server_close()
+    bodies = [json.dumps(stub.klines({'start': str(START_TS + i * limit * INTERVAL_MS), 'limit': str(limit)}, 0),
+                         separators=(',', ':')).encode() for i in range(pages)]
+    with tempfile.TemporaryDirectory() as tmp, working_dir(tmp):
+        load_dt02 = load_dt02_fresh(START_TS, end_ts)
+        started = time.perf_counter()
+        for i, body in enumerate(bodies):
+            klines = decode_kline_page(body)['klines']
+            cursor = START_TS + i * limit * INTERVAL_MS
+            load_dt02.add_klines(klines, cursor, end_ts)
+        seconds = time.perf_counter() - started
+        assert len(load_dt02.accumulator) == pages * limit
+    return {'pages': pages, 'limit': limit, 'seconds': seconds, 'us_per_page': seconds / pages * 1e6,
+            'candles_per_s': pages * limit / seconds}
+
+
+def case_backfill(days, workers, latency, error_rate):
+    """Полный прогон load_dt02.main() против стенда: шарды, запросы, чекпоинты, итоговый файл и датасет"""
+    from stub_bybit import StubRestServer
+
+    with tempfile.TemporaryDirectory() as tmp, working_dir(tmp):
+        import load_dt02
+        start = datetime.fromtimestamp(START_TS / 1000)
+        load_dt02.START_DATE = start.strftime('%Y-%m-%d')
+        load_dt02.END_DATE = (start + pd.Timedelta(days=days)).strftime('%Y-%m-%d')
+        start_ts = load_dt02.date_to_timestamp(load_dt02.START_DATE)
+        end_ts = load_dt02.date_to_timestamp(load_dt02.END_DATE)
+        load_dt02.WORKERS = workers
+        load_dt02.SHARD_DAYS = max(1, days // workers)
+        server = StubRestServer(latency=latency, error_rate=error_rate,
+                                kline_range=(start_ts, end_ts)).start()
+        try:
+            load_dt02.BASE_URL = server.url
+            load_dt02_fresh(start_ts, end_ts)
+            started = time.perf_counter()
+            with quiet():
+                load_dt02.main()
+            seconds = time.perf_counter() - started
+        finally:
+            server.stop()
+        candles = len(pd.read_csv(load_dt02.data_filename('.csv')))
+    return {'days': days, 'workers': workers, 'latency': latency, 'candles': candles,
+            'requests': server.requests, 'seconds': seconds, 'candles_per_s': candles / seconds,
+            'requests_per_s': server.requests / seconds}
+
+
+CASES = {
+    'save_to_csv': case_save_to_csv,
+    'save_progress': case_save_progress,
+    'load_resume_info': case_load_resume_info,
+    'kline_parse': case_kline_parse,
+    'backfill': case_backfill,
+}
+
+
+def child(name, params):
+    started = time.perf_counter()
+    result = CASES[name](**params)
+    result['total_seconds'] = time.perf_counter() - started
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(result))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(profile='full', names=None):
+    """Все замеры, каждый в отдельном процессе -> словарь отчёта"""
+    report = {
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'profile': profile,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'cases': {},
+    }
+    for name in names or CASES:
+        params = CONFIG[profile][name]
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', name, json.dumps(params)],
+                                capture_output=True, text=True)
+        if output.returncode != 0:
+            report['cases'][name] = {'error': output.stderr.strip().splitlines()[-1:]}
+            continue
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        result['params'] = params
+        report['cases'][name] = result
+    return report
+
+
+def compare(old, new):
+    """Печатает главную метрику каждого замера в двух отчётах и изменение"""
+    print(f"{'замер':<18}{old['commit']:>14}{new['commit']:>14}{'изменение':>12}{'RSS, МБ':>16}")
+    for name, (key, higher_better) in HEADLINE.items():
+        before, after = old['cases'].get(name, {}), new['cases'].get(name, {})
+        if key not in before or key not in after:
+            continue
+        change = after[key] / before[key] - 1 if before[key] else 0.0
+        worse = change < 0 if higher_better else change > 0
+        mark = ' !' if worse and abs(change) > 0.1 else ''
+        rss = f"{before.get('peak_rss_mb', 0):.0f} -> {after.get('peak_rss_mb', 0):.0f}"
+        print(f"{name:<18}{before[key]:>14.4g}{after[key]:>14.4g}{change:>+11.1%}{mark:<2}{rss:>14}")
+
+
+def print_report(report):
+    print(f"{'замер':<18}{'метрика':<16}{'значение':>12}{'время, с':>10}{'RSS, МБ':>9}")
+    for name, result in report['cases'].items():
+        if 'error' in result:
+            print(f"{name:<18}ошибка: {result['error']}")
+            continue
+        key, _ = HEADLINE[name]
+        print(f"{name:<18}{key:<16}{result[key]:>12.4g}{result['total_seconds']:>10.2f}{result['peak_rss_mb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ['--child']:
+        child(args[1], json.loads(args[2]))
+        sys.exit(0)
+    if args[:1] == ['--compare']:
+        with open(args[1]) as f:
+            old = json.load(f)
+        with open(args[2]) as f:
+            new = json.load(f)
+        compare(old, new)
+        sys.exit(0)
+
+    profile = 'quick' if '--quick' in args else 'full'
+    output = args[args.index('--output') + 1] if '--output' in args else None
+    names = [arg for arg in args if arg in CASES] or None
+    report = run(profile, names)
+    print_report(report)
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_{datetime.now():%Y%m%d_%H%M%S}_{report['commit']}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"Результаты: {output}")
@@ -0,0 +1,81 @@
+# Микробенчмарк записи: DataFrame на каждую строку (как было в parsing_ton.py) против BufferedWriter
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from buffered_writer import BufferedWriter, FSYNC_EVERY_FLUSH
+
+COLUMNS = ['symbol', 'timestamp', 'time_utc', 'time_local', 'open', 'high', 'low', 'close', 'volume']
+
+
+def make_records(n, start_ms=1761148788215):
+    records = []
+    for i in range(n):
+        ts = start_ms + i * 1000
+        moment = datetime.fromtimestamp(ts / 1000)
+        price = 2.133 + (i % 100) * 0.0001
+        records.append({
+            'symbol': 'TONUSDT',
+            'timestamp': ts,
+            'time_utc': moment.strftime('%Y-%m-%d %H:%M:%S'),
+            'time_local': moment.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            'open': price, 'high': 2.306, 'low': 2.115, 'close': price, 'volume': 4215071.76,
+        })
+    return records
+
+
+def write_per_row(path, records):
+    """Старый путь: DataFrame + to_csv(mode='a') на каждую запись"""
+    pd.DataFrame(columns=COLUMNS).to_csv(path, index=False)
+    for record in records:
+        pd.DataFrame([record]).to_csv(path, mode='a', header=False, index=False, float_format='%.10f')
+
+
+def write_buffered(path, records, **kwargs):
+    writer = BufferedWriter(path, COLUMNS, **kwargs)
+    for record in records:
+        writer.write(tuple(record[column] for column in COLUMNS))
+    writer.close()
+
+
+def measure(name, func, path, records, **kwargs):
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    func(path, records, **kwargs)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    return {
+        'name': name,
+        'rows': len(records),
+        'rows_per_s': len(records) / wall,
+        'cpu_us_per_row': cpu / len(records) * 1e6,
+        'bytes': os.path.getsize(path),
+    }
+
+
+def run(rows=2000):
+    """Возвращает результаты для всех вариантов записи"""
+    records = make_records(rows)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Старый путь очень медленный — меряем его на меньшей выборке
+        results.append(measure('dataframe_per_row', write_per_row,
+                               os.path.join(tmp, 'per_row.csv'), records[:min(rows, 2000)]))
+        results.append(measure('buffered_1000', write_buffered,
+                               os.path.join(tmp, 'buffered.csv'), records, flush_rows=1000))
+        results.append(measure('buffered_60_fsync', write_buffered,
+                               os.path.join(tmp, 'buffered_fsync.csv'), records,
+                               flush_rows=60, fsync=FSYNC_EVERY_FLUSH))
+    return results
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    results = run(rows)
+    baseline = results[0]['cpu_us_per_row']
+    print(f"{'вариант':<22}{'строк':>9}{'строк/с':>14}{'CPU мкс/строка':>17}{'ускорение':>11}")
+    for result in results:
+        print(f"{result['name']:<22}{result['rows']:>9}{result['rows_per_s']:>14.0f}"
+              f"{result['cpu_us_per_row']:>17.2f}{baseline / result['cpu_us_per_row']:>10.0f}x")
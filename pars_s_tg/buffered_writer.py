@@ -0,0 +1,281 @@
+import atexit
+import os
+import signal
+import sys
+import threading
+import time
+import weakref
+from operator import itemgetter
+
+from metrics import FLUSH_TIME, ROWS_PERSISTED
+
+FSYNC_NEVER = 'never'            # Данные уходят в page cache, на диск — когда решит ОС
+FSYNC_EVERY_FLUSH = 'flush'      # fsync после каждого сброса буфера
+FSYNC_INTERVAL = 'interval'      # fsync не чаще чем раз в fsync_interval секунд
+
+_open_writers = weakref.WeakSet()
+FLUSH_TICK = 0.5                 # Как часто фоновый поток проверяет сброс по времени
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def _flush_loop():
+    # Сброс по времени не должен зависеть от write(): в тихом рынке или в паузе лимитера
+    # строки иначе лежали бы в памяти, пока не придёт следующая
+    while True:
+        time.sleep(FLUSH_TICK)
+        for writer in list(_open_writers):
+            writer.flush_due()
+
+
+def _start_flusher():
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name='buffered-writer-flush', daemon=True)
+            _flusher.start()
+
+
+class BufferedWriter:
+    """Буферизованная запись строк в CSV: кольцевой буфер в памяти, сброс по количеству строк или по времени.
+
+    По времени буфер сбрасывает и фоновый поток, даже если новых строк нет. Строки пишутся в порядке
+    вызовов write(); с sort_key (колонка, обычно timestamp) каждый сброс упорядочен по ней — так
+    перекрывающиеся тики планировщика не меняют порядок внутри сброса. Строка старше уже
+    сброшенных не переставляется назад: она попадёт в следующий сброс.
+    """
+
+    def __init__(self, filename, columns, flush_rows=1000, flush_interval=5.0, float_format='%.10f',
+                 fsync=FSYNC_NEVER, fsync_interval=30.0, capacity=None, sort_key=None):
+        self.filename = filename
+        self.name = os.path.basename(filename)      # Метка в метриках
+        self.flush_time = FLUSH_TIME.labels(file=self.name)
+        self.columns = list(columns)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.float_format = float_format
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.sort_key = None if sort_key is None else itemgetter(self.columns.index(sort_key))
+
+        # Кольцевой буфер фиксированной ёмкости: слоты переиспользуются, сброс — когда буфер заполнен
+        self.capacity = max(capacity or flush_rows, 1)
+        self.slots = [None] * self.capacity
+        self.head = 0                # Куда пишется следующая строка
+        self.count = 0               # Сколько строк ждёт сброса
+        self.row_format = None       # Шаблон строки по типам первой записи: '%d,%.10f,...\n'
+
+        self.rows_written = 0
+        self.flushes = 0
+        self.last_flush = time.monotonic()
+        self.last_fsync = self.last_flush
+        self.lock = threading.Lock()       # write() может вызываться из нескольких потоков планировщика
+
+        is_new = not os.path.exists(filename)
+        self.file = open(filename, 'a')
+        if is_new:
+            self.file.write(','.join(self.columns) + '\n')
+            self.file.flush()
+        _open_writers.add(self)
+        _start_flusher()
+
+    def _build_row_format(self, row):
+        parts = []
+        for value in row:
+            if isinstance(value, float):
+                parts.append(self.float_format)
+            elif isinstance(value, int) and not isinstance(value, bool):
+                parts.append('%d')
+            else:
+                parts.append('%s')
+        return ','.join(parts) + '\n'
+
+    def write(self, row):
+        """Добавляет строку (значения в порядке columns); на диск попадёт при ближайшем сбросе"""
+        with self.lock:
+            if self.row_format is None:
+                self.row_format = self._build_row_format(row)
+            self.slots[self.head] = row
+            self.head = (self.head + 1) % self.capacity
+            self.count += 1
+            if (self.count >= self.flush_rows or self.count == self.capacity
+                    or time.monotonic() - self.last_flush >= self.flush_interval):
+                self._flush_locked()
+
+    def _pending_rows(self):
+        tail = (self.head - self.count) % self.capacity
+        if tail + self.count <= self.capacity:
+            return self.slots[tail:tail + self.count]
+        return self.slots[tail:] + self.slots[:self.head]
+
+    def flush(self, blocking=True):
+        """Сбрасывает накопленные строки одной операцией записи"""
+        # blocking=False — для обработчика сигнала: если прерван сам write(), сброс сделает close()
+        if not self.lock.acquire(blocking):
+            return 0
+        try:
+            return self._flush_locked()
+        finally:
+            self.lock.release()
+
+    def flush_due(self):
+        """Сброс по времени из фонового потока: только если строки ждут дольше flush_interval"""
+        with self.lock:
+            if self.count and time.monotonic() - self.last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        now = time.monotonic()
+        self.last_flush = now
+        if not self.count or self.file is None:
+            return 0
+
+        row_format = self.row_format
+        rows = self._pending_rows()
+        if self.sort_key is not None:
+            rows = sorted(rows, key=self.sort_key)
+        self.file.write(''.join([row_format % row for row in rows]))
+        self.file.flush()
+        self.flush_time.observe(time.monotonic() - now)
+
+        if self.fsync == FSYNC_EVERY_FLUSH or (
+                self.fsync == FSYNC_INTERVAL and now - self.last_fsync >= self.fsync_interval):
+            os.fsync(self.file.fileno())
+            self.last_fsync = now
+
+        flushed = self.count
+        ROWS_PERSISTED.inc(flushed, file=self.name)
+        self.rows_written += flushed
+        self.flushes += 1
+        self.count = 0
+        return flushed
+
+    def truncate(self, size):
+        """Сбрасывает буфер и обрезает файл до size байт (замена последней строки)"""
+        with self.lock:
+            self._flush_locked()
+            self.file.truncate(size)
+
+    def close(self):
+        with self.lock:
+            if self.file is None:
+                return
+            self._flush_locked()
+            if self.fsync != FSYNC_NEVER:
+                os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+        _open_writers.discard(self)
+
+
+def _last_row(filename, key_index, max_bytes=65536):
+    """Ключ последней полной строки CSV (как текст) и смещение её начала; (None, None), если строк нет"""
+    if not os.path.exists(filename):
+        return None, None
+    with open(filename, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        start = max(size - max_bytes, 0)
+        f.seek(start)
+        tail = f.read()
+    end = tail.rfind(b'\n')
+    if end <= 0:
+        return None, None
+    begin = tail.rfind(b'\n', 0, end) + 1
+    if begin == 0 and start == 0:
+        return None, None       # Единственная строка — заголовок
+    fields = tail[begin:end].decode().split(',')
+    if len(fields) <= key_index:
+        return None, None
+    return fields[key_index], start + begin
+
+
+class UpsertWriter:
+    """Запись свечей, которые ещё формируются: открытая свеча живёт в памяти и обновляется на месте,
+    в CSV она попадает одной строкой — когда приходит следующая свеча или при остановке.
+
+    Незакрытая свеча, записанная при остановке, остаётся последней строкой файла; если после
+    перезапуска приходит та же свеча, эта строка заменяется — повторов по ключу не появляется.
+    """
+
+    def __init__(self, filename, columns, key='timestamp', **kwargs):
+        self.key_index = list(columns).index(key)
+        self.tail_key, self.tail_offset = _last_row(filename, self.key_index)
+        self.writer = BufferedWriter(filename, columns, **kwargs)
+        self.filename = filename
+        self.name = self.writer.name
+        self.current = None          # Открытая свеча (строка в порядке columns)
+        self.updates = 0
+        self.stale = 0               # Ответы про уже закрытую свечу (пришли позже более свежих)
+        self.lock = threading.Lock()
+
+    @property
+    def rows_written(self):
+        return self.writer.rows_written
+
+    @property
+    def count(self):
+        return self.writer.count + (self.current is not None)
+
+    def upsert(self, row):
+        """Обновляет открытую свечу; возвращает закрытую строку, если началась следующая свеча"""
+        key = row[self.key_index]
+        with self.lock:
+            current = self.current
+            if current is None:
+                if self.tail_key is not None and str(key) == self.tail_key:
+                    self.writer.truncate(self.tail_offset)
+                self.tail_key = None
+                self.current = row
+                return None
+            current_key = current[self.key_index]
+            self.updates += 1
+            if key == current_key:
+                self.current = row
+                return None
+            if key < current_key:
+                self.stale += 1
+                return None
+            self.writer.write(current)
+            self.current = row
+            return current
+
+    def flush(self, blocking=True):
+        return self.writer.flush(blocking)
+
+    def close(self):
+        with self.lock:
+            if self.current is not None:
+                self.writer.write(self.current)
+                self.current = None
+        self.writer.close()
+
+
+def flush_all(blocking=True):
+    """Сбрасывает буферы всех открытых писателей"""
+    for writer in list(_open_writers):
+        writer.flush(blocking)
+
+
+def close_all():
+    for writer in list(_open_writers):
+        writer.close()
+
+
+def install_signal_handlers():
+    """По SIGINT/SIGTERM сначала сбрасывает все буферы, затем передаёт сигнал прежнему обработчику"""
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(signum)
+
+        def handler(sig, frame, previous=previous):
+            flush_all(blocking=False)
+            if callable(previous):
+                previous(sig, frame)
+            elif sig == signal.SIGTERM:
+                sys.exit(0)     # Остальное закроет atexit после раскрутки стека
+            else:
+                raise KeyboardInterrupt
+
+        signal.signal(signum, handler)
+
+
+atexit.register(close_all)
@@ -0,0 +1,230 @@
+import heapq
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from buffered_writer import BufferedWriter
+from rate_limit import AdaptiveRateLimiter
+
+BYBIT_REST = 'https://api.bybit.com'
+TICKER_COLUMNS = ['timestamp', 'last_price', 'bid1', 'ask1', 'high_24h', 'low_24h', 'volume_24h', 'turnover_24h']
+
+# Начиная с этого числа символов в категории выгоднее один запрос на всю категорию
+BATCH_THRESHOLD = 3
+# Лимит ByBit по IP — 600 запросов за 5 секунд; дальше темп подстраивается по заголовкам квоты
+RATE_LIMIT = 120
+
+
+def make_session(pool_size=16):
+    """requests.Session с пулом keep-alive соединений: TCP/TLS рукопожатие один раз на соединение"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class PollJob:
+    """Периодический опрос: либо вся категория одним запросом, либо один символ"""
+
+    def __init__(self, category, symbols, period, batch):
+        self.category = category
+        self.symbols = set(symbols)
+        self.period = period
+        self.batch = batch
+        self.in_flight = False
+        self.ticks = 0
+        self.missed = 0          # Пропущенные тики: планировщик опоздал больше чем на период
+        self.overlapped = 0      # Тики, на которых предыдущий запрос ещё не завершился
+
+    @property
+    def name(self):
+        return f"{self.category}:*" if self.batch else f"{self.category}:{next(iter(self.symbols))}"
+
+
+class CollectorEngine:
+    """Сборщик тикеров по многим символам в одном процессе с общим планировщиком и пулом соединений"""
+
+    def __init__(self, watch, period=1.0, base_url=BYBIT_REST, workers=8, output_dir='.',
+                 batch_threshold=BATCH_THRESHOLD, flush_rows=1000, flush_interval=5.0, session=None,
+                 rate_limiter=None):
+        # watch: {'spot': ['TONUSDT', ...], 'linear': [...]}
+        self.base_url = base_url
+        self.session = session or make_session(pool_size=workers)
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter(RATE_LIMIT)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.running = False
+        self.lock = threading.Lock()
+
+        self.writers = {}
+        self.latest = {}                              # (category, symbol) -> последняя запись
+        self.latencies = deque(maxlen=10_000)         # Время ответа API, секунды
+        self.requests_made = 0
+        self.errors = 0
+        self.poll_failures = 0                        # Исключения внутри poll (разбор ответа, запись)
+        self.rows = 0
+
+        self.jobs = []
+        for category, symbols in watch.items():
+            for symbol in symbols:
+                self.writers[(category, symbol)] = BufferedWriter(
+                    f"{output_dir}/{symbol.lower()}_{category}_ticker.csv", TICKER_COLUMNS,
+                    flush_rows=flush_rows, flush_interval=flush_interval, sort_key='timestamp')
+            if len(symbols) >= batch_threshold:
+                self.jobs.append(PollJob(category, symbols, period, batch=True))
+            else:
+                self.jobs.extend(PollJob(category, [symbol], period, batch=False) for symbol in symbols)
+
+    # ---------- запросы ----------
+
+    def fetch_tickers(self, category, symbol=None):
+        params = {'category': category}
+        if symbol:
+            params['symbol'] = symbol
+        # Ожидание лимитера не входит в задержку ответа API
+        self.rate_limiter.acquire()
+        started = time.perf_counter()
+        try:
+            response = self.session.get(f"{self.base_url}/v5/market/tickers", params=params, timeout=5)
+            self.rate_limiter.observe(response.status_code, response.headers, response.content)
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            with self.lock:
+                self.errors += 1
+            print(f"Ошибка запроса {category}/{symbol or '*'}: {e}")
+            return None
+        finally:
+            with self.lock:
+                self.requests_made += 1
+                self.latencies.append(time.perf_counter() - started)
+
+        if data.get('retCode') != 0:
+            with self.lock:
+                self.errors += 1
+            print(f"Ошибка API {category}/{symbol or '*'}: {data.get('retMsg')}")
+            return None
+        return data
+
+    def poll(self, job):
+        """Один опрос задачи: запрос и раскладка результатов по символам"""
+        try:
+            symbol = None if job.batch else next(iter(job.symbols))
+            data = self.fetch_tickers(job.category, symbol)
+            if data:
+                # Время сервера биржи, а не локальные часы
+                server_time = int(data.get('time', time.time() * 1000))
+                for ticker in data['result']['list']:
+                    if ticker['symbol'] in job.symbols:
+                        self.handle_ticker(job.category, ticker, server_time)
+        finally:
+            job.in_flight = False
+
+    def _poll_done(self, future, job):
+        """Колбэк future опроса: исключение из пула иначе потерялось бы молча"""
+        error = future.exception()
+        if error is None:
+            return
+        with self.lock:
+            self.poll_failures += 1
+        print(f"Ошибка опроса {job.name}: {type(error).__name__}: {error}")
+
+    def handle_ticker(self, category, ticker, server_time):
+        record = (
+            server_time,
+            float(ticker['lastPrice']),
+            float(ticker.get('bid1Price') or 0.0),
+            float(ticker.get('ask1Price') or 0.0),
+            float(ticker['highPrice24h']),
+            float(ticker['lowPrice24h']),
+            float(ticker['volume24h']),
+            float(ticker['turnover24h']),
+        )
+        key = (category, ticker['symbol'])
+        with self.lock:
+            self.writers[key].write(record)
+            self.latest[key] = record
+            self.rows += 1
+
+    # ---------- планировщик ----------
+
+    def run(self, duration=None):
+        """Цикл планировщика: абсолютные дедлайны по монотонным часам, без накопления дрейфа"""
+        self.running = True
+        started = time.monotonic()
+        queue = [(started, index, job) for index, job in enumerate(self.jobs)]
+        heapq.heapify(queue)
+
+        try:
+            while self.running:
+                deadline, index, job = queue[0]
+                now = time.monotonic()
+                if duration is not None and now - started >= duration:
+                    break
+                if deadline > now:
+                    time.sleep(min(deadline - now, 0.5))
+                    continue
+
+                heapq.heappop(queue)
+                late = now - deadline
+                if late >= job.period:
+                    # Опоздали больше чем на период — догонять нет смысла, переходим к ближайшему тику
+                    skipped = int(late // job.period)
+                    job.missed += skipped
+                    deadline += skipped * job.period
+
+                if job.in_flight:
+                    job.overlapped += 1
+                else:
+                    job.in_flight = True
+                    job.ticks += 1
+                    future = self.executor.submit(self.poll, job)
+                    future.add_done_callback(lambda future, job=job: self._poll_done(future, job))
+                heapq.heappush(queue, (deadline + job.period, index, job))
+        except KeyboardInterrupt:
+            print("\nОстановлено пользователем")
+        finally:
+            self.running = False
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for writer in self.writers.values():
+            writer.close()
+        self.session.close()
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+
+        return {
+            'symbols': len(self.writers),
+            'jobs': len(self.jobs),
+            'requests': self.requests_made,
+            'errors': self.errors,
+            'poll_failures': self.poll_failures,
+            'rows': self.rows,
+            'ticks': sum(job.ticks for job in self.jobs),
+            'missed_ticks': sum(job.missed for job in self.jobs),
+            'overlapped_ticks': sum(job.overlapped for job in self.jobs),
+            'latency_p50_ms': percentile(0.5) * 1000,
+            'latency_p99_ms': percentile(0.99) * 1000,
+            'throttled': self.rate_limiter.throttled,
+            'effective_rps': self.rate_limiter.stats()['effective_rps'],
+        }
+
+
+if __name__ == "__main__":
+    engine = CollectorEngine({'spot': ['TONUSDT', 'BTCUSDT', 'ETHUSDT'], 'linear': ['TONUSDT']})
+    try:
+        engine.run()
+    finally:
+        engine.close()
+        print(engine.stats())
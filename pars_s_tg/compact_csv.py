@@ -0,0 +1,84 @@
+import heapq
+import os
+import sys
+import time
+
+# Сколько разных ключей держать в памяти: повтор свечи дальше этого окна считается опоздавшим
+COMPACT_WINDOW = 1024
+WRITE_BATCH = 10_000
+
+
+def compact_csv(path, output=None, key='timestamp', window=COMPACT_WINDOW):
+    """Сжимает CSV с повторами свечей до одной строки на ключ (побеждает последняя запись) за один проход.
+
+    Строки не разбираются целиком — только поле ключа; в памяти не больше window незаписанных
+    ключей, и они выходят по возрастанию. Без output файл заменяется атомарно.
+    Возвращает статистику: строк на входе и выходе, опоздавших повторов и битых строк.
+    """
+    target = output or path + '.compact'
+    stats = {'rows_in': 0, 'rows_out': 0, 'late': 0, 'bad': 0}
+    pending = {}             # ключ -> последняя строка с этим ключом
+    order = []               # куча ключей из pending
+    last_written = None
+    previous = value = None  # Поле ключа предыдущей строки как текст и как число
+    batch = []
+
+    with open(path, newline='') as src, open(target, 'w', newline='') as dst:
+        header = src.readline()
+        dst.write(header)
+        key_index = header.rstrip('\r\n').split(',').index(key)
+
+        for line in src:
+            stats['rows_in'] += 1
+            if not line.endswith('\n'):
+                stats['bad'] += 1        # Недописанная строка (сборщик остановлен посреди записи)
+                continue
+            fields = line.split(',', key_index + 1)
+            if len(fields) > key_index and fields[key_index] == previous:
+                pending[value] = line    # Очередное обновление той же свечи — самый частый случай
+                continue
+            try:
+                value = int(fields[key_index])
+            except (IndexError, ValueError):
+                stats['bad'] += 1
+                continue
+            if last_written is not None and value <= last_written:
+                stats['late'] += 1       # Ключ уже записан: такой повтор не исправить за один проход
+                previous = None
+                continue
+            previous = fields[key_index]
+            if value not in pending:
+                heapq.heappush(order, value)
+            pending[value] = line
+            if len(pending) > window:
+                last_written = heapq.heappop(order)
+                batch.append(pending.pop(last_written))
+                if last_written == value:
+                    previous = None
+                if len(batch) >= WRITE_BATCH:
+                    dst.write(''.join(batch))
+                    stats['rows_out'] += len(batch)
+                    batch = []
+
+        while order:
+            batch.append(pending.pop(heapq.heappop(order)))
+        dst.write(''.join(batch))
+        stats['rows_out'] += len(batch)
+
+    if output is None:
+        os.replace(target, path)
+    return stats
+
+
+if __name__ == "__main__":
+    # python compact_csv.py tonusdt_kline_1s.csv [...] — одна строка на свечу вместо ~60 повторов
+    if len(sys.argv) < 2:
+        print("Использование: python compact_csv.py file.csv [file2.csv ...]")
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        size = os.path.getsize(path)
+        started = time.perf_counter()
+        stats = compact_csv(path)
+        print(f"{path}: {stats['rows_in']} -> {stats['rows_out']} строк, "
+              f"{size / 1024:.0f} -> {os.path.getsize(path) / 1024:.0f} КБ за {time.perf_counter() - started:.2f} с"
+              f" (опоздавших повторов {stats['late']}, битых строк {stats['bad']})")
@@ -0,0 +1,59 @@
+# Разовая конвертация накопленных CSV в колоночный датасет data/dataset
+import glob
+import os
+import re
+import sys
+
+import pandas as pd
+
+from bars import rebuild_rollups
+from storage import DATASET_ROOT, write_ohlcv
+
+# Файлы живых сборщиков из parsing_ton.py: (путь, symbol, interval в датасете)
+COLLECTOR_FILES = [
+    ('bybit_tonusdt_1s.csv', 'TONUSDT', 'spot_ticker_1s'),
+    ('tonusdt_1s_fullprecision.csv', 'TONUSDT', 'spot_price_1s'),
+    ('tonusdt_kline_1s.csv', 'TONUSDT', 'spot_1'),      # минутные свечи, опрашиваемые каждую секунду
+]
+
+# Итоговые файлы load_dt02.py: data/bybit_tonusdt_1_20230123_20251023.csv
+HISTORY_PATTERN = re.compile(r'bybit_([a-z0-9]+)_([0-9A-Z]+)_\d{8}_\d{8}(_PARTIAL)?\.csv$')
+
+
+def convert_file(path, symbol, interval, root=DATASET_ROOT):
+    """Конвертирует один CSV; дубли timestamp схлопываются, побеждает последняя запись"""
+    df = pd.read_csv(path)
+    rows = write_ohlcv(df, symbol, interval, root)
+    print(f"✅ {path}: {len(df)} строк -> {symbol}/{interval} ({rows} уникальных в затронутых днях)")
+
+
+def main(base_dir='.'):
+    root = os.path.join(base_dir, DATASET_ROOT)
+    converted = 0
+    for name, symbol, interval in COLLECTOR_FILES:
+        path = os.path.join(base_dir, name)
+        if os.path.exists(path):
+            convert_file(path, symbol, interval, root)
+            converted += 1
+
+    history_symbols = set()
+    for path in sorted(glob.glob(os.path.join(base_dir, 'data', 'bybit_*.csv'))):
+        match = HISTORY_PATTERN.search(os.path.basename(path))
+        if not match:
+            continue
+        symbol, interval = match.group(1).upper(), match.group(2)
+        convert_file(path, symbol, f"linear_{interval}", root)
+        converted += 1
+        if interval == '1':
+            history_symbols.add(symbol)
+
+    # Уровни 5m/15m/1h/1d по минутной истории — запросы по таймфреймам читают их без resample
+    for symbol in sorted(history_symbols):
+        levels = rebuild_rollups(symbol, 'linear', root=root)
+        print(f"🧱 {symbol}: " + ', '.join(f"{timeframe}={rows}" for timeframe, rows in levels.items()))
+
+    print(f"📦 Сконвертировано файлов: {converted}, датасет: {root}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else '.')
@@ -0,0 +1,77 @@
+import json
+import re
+import sys
+import time
+
+import numpy as np
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:       # orjson ставится не везде — тогда стандартный json (тот же результат, в ~2 раза медленнее)
+    orjson = None
+    loads = json.loads
+
+KLINE_FIELDS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+LIST_START = re.compile(rb'"list"\s*:\s*\[')
+
+
+def _columns(values):
+    """Матрица n x 7 (float64) -> колонки по возрастанию времени: timestamp int64, остальное float64"""
+    timestamps = values[:, 0].astype(np.int64)
+    if len(timestamps) > 1 and timestamps[0] > timestamps[-1] and np.all(timestamps[1:] < timestamps[:-1]):
+        order = slice(None, None, -1)        # ByBit отдаёт страницу от новых к старым
+    elif np.all(timestamps[1:] >= timestamps[:-1]):
+        order = slice(None)
+    else:
+        order = np.argsort(timestamps, kind='stable')
+    columns = {'timestamp': timestamps[order]}
+    for index, name in enumerate(KLINE_FIELDS[1:], 1):
+        columns[name] = values[order, index]
+    return columns
+
+
+def decode_klines(klines):
+    """Уже разобранный result.list ([["1674432000000", "2.1", ...], ...]) -> колонки NumPy"""
+    values = np.array(klines, dtype=np.float64).reshape(-1, len(KLINE_FIELDS))
+    return _columns(values)
+
+
+def decode_kline_page(raw):
+    """Сырой ответ /v5/market/kline (bytes или str) -> словарь ответа, свечи в data['klines'] колонками.
+
+    Числа в result.list приходят строками. Вместо разбора тысячи строк по одной кавычки у списка
+    снимаются, и парсер JSON сразу отдаёт плоский список чисел, из которого NumPy собирает матрицу
+    за один вызов. Остальной ответ (retCode, retMsg) разбирается отдельно, list в нём пустой.
+    """
+    if isinstance(raw, str):
+        raw = raw.encode()
+    match = LIST_START.search(raw)
+    if match:
+        start = match.end() - 1
+        end = raw.find(b']]', start) + 2 if raw[start + 1:start + 2] == b'[' else start + 2
+        try:
+            values = loads(b'[' + raw[start:end].translate(None, b'"[]') + b']')
+            data = loads(raw[:start] + b'[]' + raw[end:])
+            data['klines'] = _columns(np.array(values, dtype=np.float64).reshape(-1, len(KLINE_FIELDS)))
+            return data
+        except (ValueError, TypeError):
+            pass        # Нестандартная страница (пустые поля, другое число колонок) — общий путь ниже
+    data = loads(raw)
+    result = data.get('result') or {}
+    data['klines'] = decode_klines(result.get('list') or [])
+    return data
+
+
+if __name__ == "__main__":
+    # python decode.py page.json — разобрать записанную страницу и показать колонки
+    with open(sys.argv[1], 'rb') as f:
+        raw = f.read()
+    started = time.perf_counter()
+    data = decode_kline_page(raw)
+    elapsed = time.perf_counter() - started
+    klines = data['klines']
+    print(f"retCode={data.get('retCode')}, свечей: {len(klines['timestamp'])}, разбор: {elapsed * 1e6:.0f} мкс"
+          f" ({'orjson' if orjson else 'json'})")
+    for name, values in klines.items():
+        print(f"{name:<10}{values.dtype}  {values[:3]}")
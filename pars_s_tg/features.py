@@ -0,0 +1,391 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicators import _ema_series
+
+FEATURES_VERSION = 1             # Поднять при изменении формул стадий: все ключи кэша станут новыми
+CANDLE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+MATRIX_FILE = 'matrix.bin'
+META_FILE = 'meta.json'
+
+
+# Стадии: функция (входные колонки -> новые колонки) + параметры. lookback — сколько строк истории
+# нужно, чтобы досчитать хвост точно так же, как при полном расчёте; None — только полный пересчёт.
+
+def returns_stage(inputs, periods=(1, 5, 15, 60)):
+    """Логарифмические доходности за periods баров"""
+    log_close = np.log(inputs['close'])
+    result = {}
+    for period in periods:
+        values = np.full(len(log_close), np.nan)
+        values[period:] = log_close[period:] - log_close[:-period]
+        result[f'ret_{period}'] = values
+    return result
+
+
+def lags_stage(inputs, column='ret_1', lags=(1, 2, 3, 4, 5, 10, 20)):
+    """Лаги колонки: значение lag баров назад"""
+    values = inputs[column]
+    result = {}
+    for lag in lags:
+        shifted = np.full(len(values), np.nan)
+        shifted[lag:] = values[:-lag]
+        result[f'{column}_lag_{lag}'] = shifted
+    return result
+
+
+def rolling_stage(inputs, windows=(15, 60, 240)):
+    """Скользящие окна: волатильность и средняя доходность, z-оценка объёма, положение цены в диапазоне"""
+    returns = pd.Series(inputs['ret_1'])
+    volume = pd.Series(inputs['volume'])
+    close = pd.Series(inputs['close'])
+    result = {}
+    for window in windows:
+        result[f'ret_mean_{window}'] = returns.rolling(window).mean().to_numpy()
+        result[f'ret_std_{window}'] = returns.rolling(window).std(ddof=0).to_numpy()
+        mean = volume.rolling(window).mean()
+        result[f'volume_z_{window}'] = ((volume - mean) / volume.rolling(window).std(ddof=0)).to_numpy()
+        low = pd.Series(inputs['low']).rolling(window).min()
+        high = pd.Series(inputs['high']).rolling(window).max()
+        result[f'range_pos_{window}'] = ((close - low) / (high - low)).to_numpy()
+    return result
+
+
+def indicators_stage(inputs, ema=20, rsi=14, macd=(12, 26, 9), bbands=(20, 2.0)):
+    """Индикаторы с формулами indicators.py (pandas-ta), нормированные на цену"""
+    close = inputs['close']
+    series = pd.Series(close)
+    result = {f'ema_{ema}_ratio': close / _ema_series(close, ema) - 1.0}
+
+    change = series.diff()
+    gain = change.clip(lower=0).ewm(alpha=1.0 / rsi, min_periods=rsi).mean()
+    loss = (-change).clip(lower=0).ewm(alpha=1.0 / rsi, min_periods=rsi).mean()
+    result[f'rsi_{rsi}'] = (gain / (gain + loss)).to_numpy()
+
+    fast, slow, signal = macd
+    line = _ema_series(close, fast) - _ema_series(close, slow)
+    signal_line = np.full(len(close), np.nan)
+    if len(close) >= slow:
+        signal_line[slow - 1:] = _ema_series(line[slow - 1:], signal)
+    result['macd'] = line / close
+    result['macd_hist'] = (line - signal_line) / close
+
+    length, std = bbands
+    mid = series.rolling(length).mean()
+    deviation = series.rolling(length).std(ddof=0)
+    result[f'bb_pos_{length}'] = ((series - mid) / (2 * std * deviation)).to_numpy()
+    result[f'bb_width_{length}'] = (2 * std * deviation / mid).to_numpy()
+    return result
+
+
+def calendar_stage(inputs):
+    """Время суток и день недели (UTC) в циклическом кодировании"""
+    seconds = inputs['timestamp'] / 1000.0
+    day = 2 * np.pi * (seconds % 86400) / 86400
+    week = 2 * np.pi * ((seconds / 86400 + 3) % 7) / 7   # 1970-01-01 — четверг
+    return {'day_sin': np.sin(day), 'day_cos': np.cos(day), 'week_sin': np.sin(week), 'week_cos': np.cos(week)}
+
+
+class Stage:
+    """Объявление стадии: имя, функция, параметры, входы ('candles' или имена других стадий)"""
+
+    def __init__(self, name, func, params=None, inputs=('candles',), lookback=0):
+        self.name = name
+        self.func = func
+        self.params = params or {}
+        self.inputs = tuple(inputs)
+        self.lookback = lookback
+
+    def spec(self):
+        return {'name': self.name, 'func': f"{self.func.__module__}.{self.func.__qualname__}",
+                'params': self.params, 'inputs': list(self.inputs), 'lookback': self.lookback}
+
+
+DEFAULT_STAGES = [
+    Stage('returns', returns_stage, {'periods': [1, 5, 15, 60]}, lookback=60),
+    Stage('lags', lags_stage, {'column': 'ret_1', 'lags': [1, 2, 3, 4, 5, 10, 20]},
+          inputs=('returns',), lookback=20),
+    Stage('rolling', rolling_stage, {'windows': [15, 60, 240]}, inputs=('candles', 'returns'), lookback=240),
+    # Рекурсивные ema/rma забывают начальное значение как (1 - alpha)^n: через 2000 баров его вклад
+    # меньше 1e-60, и хвост совпадает с полным расчётом в пределах float32
+    Stage('indicators', indicators_stage, {'ema': 20, 'rsi': 14, 'macd': [12, 26, 9], 'bbands': [20, 2.0]},
+          lookback=2000),
+    Stage('calendar', calendar_stage),
+]
+
+
+def stage_key(source_id, start_ts, stage, input_keys):
+    """Ключ результата стадии: источник, начало диапазона, параметры стадии и ключи её входов"""
+    payload = {'version': FEATURES_VERSION, 'source': source_id, 'start': int(start_ts),
+               'stage': stage.spec(), 'inputs': input_keys}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def fingerprint(row):
+    """Отпечаток последней строки свечей, покрытой записью: замена истории задним числом его меняет"""
+    return hashlib.sha256(np.ascontiguousarray(row, dtype=np.float64).tobytes()).hexdigest()[:16]
+
+
+class FeatureCache:
+    """Кэш матриц признаков: каталог на запись, внутри float32-матрица по строкам и meta.json.
+
+    Строки матрицы лежат подряд, поэтому новые свечи дописываются в конец файла, а открытие —
+    это np.memmap без чтения данных. Давность использования — mtime meta.json (LRU при вытеснении).
+    """
+
+    def __init__(self, directory='data/features', max_bytes=8 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evictions = 0
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def meta(self, key):
+        try:
+            with open(os.path.join(self._entry_dir(key), META_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key, meta):
+        path = os.path.join(self._entry_dir(key), META_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def open(self, key, meta=None):
+        """Матрица записи через memmap (только чтение); строк ровно столько, сколько в meta"""
+        meta = meta or self.meta(key)
+        if meta is None:
+            raise KeyError(key)
+        path = os.path.join(self._entry_dir(key), MATRIX_FILE)
+        os.utime(os.path.join(self._entry_dir(key), META_FILE))
+        shape = (meta['rows'], len(meta['columns']))
+        if not meta['rows']:
+            return np.empty(shape, dtype=meta['dtype'])
+        return np.memmap(path, dtype=meta['dtype'], mode='r', shape=shape)
+
+    def create(self, key, matrix, meta):
+        """Записывает матрицу целиком (новая запись или пересчёт)"""
+        directory = self._entry_dir(key)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, MATRIX_FILE)
+        np.ascontiguousarray(matrix, dtype=meta['dtype']).tofile(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        meta['rows'] = len(matrix)
+        self._write_meta(key, meta)
+
+    def append(self, key, rows, meta):
+        """Дописывает строки в конец матрицы; meta обновляется последней, поэтому обрыв записи безопасен"""
+        path = os.path.join(self._entry_dir(key), MATRIX_FILE)
+        rows = np.ascontiguousarray(rows, dtype=meta['dtype'])
+        with open(path, 'r+b') as f:
+            # Хвост от прерванного дописывания отбрасываем: истина — число строк в meta
+            f.seek(meta['rows'] * rows.shape[1] * rows.itemsize)
+            f.truncate()
+            f.write(rows.tobytes())
+        meta['rows'] += len(rows)
+        self._write_meta(key, meta)
+
+    def entries(self):
+        """[(mtime meta, байт, ключ)] по всем записям"""
+        result = []
+        if not os.path.isdir(self.directory):
+            return result
+        for key in os.listdir(self.directory):
+            directory = self._entry_dir(key)
+            try:
+                used = os.stat(os.path.join(directory, META_FILE)).st_mtime
+                size = os.stat(os.path.join(directory, MATRIX_FILE)).st_size
+            except OSError:
+                continue
+            result.append((used, size, key))
+        return result
+
+    def total_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=()):
+        """Удаляет давно не использованные записи, пока кэш не станет меньше 90% лимита"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes * 0.9:
+                break
+            if key in keep:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
+            removed += 1
+        self.evictions += removed
+        return removed
+
+
+class FeatureMatrix:
+    """Признаки как набор memmap-блоков по стадиям; строки склеиваются только для запрошенного среза"""
+
+    def __init__(self, timestamps, blocks):
+        self.timestamps = timestamps
+        self.blocks = blocks                      # [(колонки, матрица)]
+        self.columns = [column for columns, _ in blocks for column in columns]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def shape(self):
+        return len(self.timestamps), len(self.columns)
+
+    def __getitem__(self, rows):
+        return np.hstack([matrix[rows] for _, matrix in self.blocks])
+
+    def column(self, name):
+        for columns, matrix in self.blocks:
+            if name in columns:
+                return matrix[:, columns.index(name)]
+        raise KeyError(name)
+
+    def to_frame(self, rows=slice(None)):
+        index = pd.to_datetime(self.timestamps[rows], unit='ms')
+        return pd.DataFrame(self[rows], index=index, columns=self.columns)
+
+
+class FeaturePipeline:
+    """Построение признаков по стадиям с кэшем: неизменные стадии переиспользуются, новые свечи
+    досчитываются только хвостом (с запасом lookback строк истории)."""
+
+    def __init__(self, stages=None, cache=None):
+        self.stages = stages if stages is not None else DEFAULT_STAGES
+        self.cache = cache or FeatureCache()
+        self.actions = {}
+
+    def _manifest_path(self, source_id):
+        name = hashlib.sha256(json.dumps([source_id] + [stage.spec() for stage in self.stages],
+                                         sort_keys=True).encode()).hexdigest()[:32]
+        return os.path.join(self.cache.directory, 'pipelines', name + '.json')
+
+    def build(self, candles, source_id):
+        """Признаки для свечей (DataFrame load_candles или с колонкой timestamp в мс) -> FeatureMatrix"""
+        if 'timestamp' in candles.columns:
+            timestamps = candles['timestamp'].to_numpy(dtype=np.int64)
+        else:
+            timestamps = candles.index.values.astype('datetime64[ms]').astype(np.int64)
+        columns = {'timestamp': timestamps.astype(np.float64)}
+        for column in CANDLE_COLUMNS[1:]:
+            columns[column] = candles[column].to_numpy(dtype=np.float64)
+        n = len(timestamps)
+        start_ts = int(timestamps[0]) if n else 0
+
+        self.actions = {}
+        keys = {'candles': 'candles'}
+        outputs = {'candles': (CANDLE_COLUMNS, None)}
+        blocks = []
+        for stage in self.stages:
+            key = stage_key(source_id, start_ts, stage, [keys[name] for name in stage.inputs])
+            keys[stage.name] = key
+            stage_columns, matrix = self._build_stage(stage, key, columns, outputs, timestamps)
+            outputs[stage.name] = (stage_columns, matrix)
+            blocks.append((stage_columns, matrix))
+
+        manifest_path = self._manifest_path(source_id)
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump({'source': source_id, 'rows': n, 'stages': [keys[stage.name] for stage in self.stages]},
+                      f, indent=1)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        np.save(manifest_path[:-len('.json')] + '_timestamps.npy', timestamps)
+
+        self.cache.evict(keep=set(keys.values()))
+        return FeatureMatrix(timestamps, blocks)
+
+    def _inputs(self, stage, columns, outputs, begin, end):
+        inputs = {}
+        for name in stage.inputs:
+            if name == 'candles':
+                for column, values in columns.items():
+                    inputs[column] = values[begin:end]
+            else:
+                stage_columns, matrix = outputs[name]
+                block = np.asarray(matrix[begin:end], dtype=np.float64)
+                for i, column in enumerate(stage_columns):
+                    inputs[column] = block[:, i]
+        return inputs
+
+    def _compute(self, stage, columns, outputs, begin, end):
+        result = stage.func(self._inputs(stage, columns, outputs, begin, end), **stage.params)
+        names = list(result)
+        return names, np.column_stack([result[name] for name in names]).astype(np.float32)
+
+    def _build_stage(self, stage, key, columns, outputs, timestamps):
+        n = len(timestamps)
+        meta = self.cache.meta(key)
+        if meta is not None:
+            rows = meta['rows']
+            # Запись годится, если покрытая ею история не менялась и не длиннее текущей
+            if rows > n or (rows and (int(timestamps[rows - 1]) != meta['end']
+                                      or fingerprint([columns[c][rows - 1] for c in CANDLE_COLUMNS])
+                                      != meta['fingerprint'])):
+                meta = None
+        if meta is not None and meta['rows'] == n:
+            self.actions[stage.name] = 'hit'
+            return meta['columns'], self.cache.open(key, meta)
+
+        last = [columns[c][n - 1] for c in CANDLE_COLUMNS] if n else []
+        if meta is not None and stage.lookback is not None:
+            rows = meta['rows']
+            begin = max(0, rows - stage.lookback)
+            _, tail = self._compute(stage, columns, outputs, begin, n)
+            meta.update(end=int(timestamps[n - 1]), fingerprint=fingerprint(last))
+            self.cache.append(key, tail[rows - begin:], meta)
+            self.actions[stage.name] = f'append {n - rows}'
+        else:
+            names, matrix = self._compute(stage, columns, outputs, 0, n)
+            meta = {'stage': stage.spec(), 'columns': names, 'dtype': 'float32', 'rows': n,
+                    'start': int(timestamps[0]) if n else None, 'end': int(timestamps[n - 1]) if n else None,
+                    'fingerprint': fingerprint(last), 'created': time.time()}
+            self.cache.create(key, matrix, meta)
+            self.actions[stage.name] = 'build'
+        return meta['columns'], self.cache.open(key, meta)
+
+    def open(self, source_id):
+        """Открывает последнюю построенную матрицу без исходных свечей и без чтения данных в память"""
+        manifest_path = self._manifest_path(source_id)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        timestamps = np.load(manifest_path[:-len('.json')] + '_timestamps.npy', mmap_mode='r')
+        blocks = []
+        for key in manifest['stages']:
+            meta = self.cache.meta(key)
+            if meta is None:
+                raise KeyError(f"{source_id}: запись {key} вытеснена, нужен build()")
+            blocks.append((meta['columns'], self.cache.open(key, meta)[:len(timestamps)]))
+        return FeatureMatrix(timestamps, blocks)
+
+    def summary(self):
+        return ', '.join(f"{name}: {action}" for name, action in self.actions.items())
+
+
+if __name__ == "__main__":
+    # python features.py data/bybit_tonusdt_1_....csv — построить/обновить признаки по истории load_dt02
+    if len(sys.argv) < 2:
+        print("Использование: python features.py data/bybit_tonusdt_1_....csv")
+        sys.exit(1)
+    from backtest import load_candles
+    source = sys.argv[1]
+    candles = load_candles(source)
+    pipeline = FeaturePipeline()
+    started = time.perf_counter()
+    features = pipeline.build(candles, os.path.basename(source))
+    print(f"Признаки {features.shape[0]} x {features.shape[1]} за {time.perf_counter() - started:.2f} с "
+          f"({pipeline.summary()})")
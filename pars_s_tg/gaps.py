@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+
+
+def gaps_from_mask(filled, start_ts, interval_ms):
+    """Пропущенные интервалы по битовой маске заполненных слотов (KlineAccumulator.filled)"""
+    # Переходы заполнено/пусто находим одной разностью по маске с рамкой из заполненных слотов
+    edges = np.diff(np.concatenate(([True], filled, [True])).astype(np.int8))
+    starts = np.flatnonzero(edges == -1)
+    ends = np.flatnonzero(edges == 1)
+    return np.column_stack((start_ts + starts.astype(np.int64) * interval_ms,
+                            start_ts + ends.astype(np.int64) * interval_ms))
+
+
+def missing_count(gaps, interval_ms):
+    return int(((gaps[:, 1] - gaps[:, 0]) // interval_ms).sum()) if len(gaps) else 0
+
+
+def plan_refill_requests(gaps, interval_ms, limit=200):
+    """Окна запросов (start, end) по limit свечей, покрывающие все пропуски минимальным числом вызовов.
+
+    Окно начинается с первой непокрытой пропущенной свечи и забирает все пропуски, попавшие в
+    ближайшие limit свечей, — жадное покрытие точек отрезками даёт минимум запросов.
+    """
+    windows = []
+    covered_until = None
+    span = limit * interval_ms
+    for gap_from, gap_to in gaps:
+        cursor = int(gap_from) if covered_until is None else max(int(gap_from), covered_until)
+        while cursor < gap_to:
+            windows.append((cursor, cursor + span - interval_ms))   # end у ByBit включительный
+            covered_until = cursor + span
+            cursor = covered_until
+    return windows
+
+
+def save_gap_index(path, gaps, interval_ms, start_ts, end_ts):
+    """Сохраняет индекс пропусков рядом с файлом данных"""
+    index = {
+        'interval_ms': int(interval_ms),
+        'range': [int(start_ts), int(end_ts)],
+        'gap_count': int(len(gaps)),
+        'missing_candles': missing_count(gaps, interval_ms),
+        'gaps': [[int(gap_from), int(gap_to)] for gap_from, gap_to in gaps],
+    }
+    with open(path, 'w') as f:
+        json.dump(index, f, indent=1)
+    return index
+
+
+
+def load_gap_index(path, interval_ms, start_ts, end_ts):
+    """Пропуски из сохранённого индекса (массив [from, to]) или None, если его нет или он для другого диапазона"""
+    try:
+        with open(path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get('interval_ms') != int(interval_ms) or index.get('range') != [int(start_ts), int(end_ts)]:
+        return None
+    return np.array(index.get('gaps', []), dtype=np.int64).reshape(-1, 2)
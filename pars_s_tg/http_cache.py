@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from urllib.parse import urlencode
+
+MODE_OFF = 'off'          # Всегда сеть, кэш не трогаем
+MODE_RECORD = 'record'    # Кэш, при промахе — сеть и запись ответа
+MODE_REPLAY = 'replay'    # Только записанные ответы (TTL игнорируется), промах — CacheMiss
+CACHE_MODES = (MODE_OFF, MODE_RECORD, MODE_REPLAY)
+
+ENTRY_SUFFIX = '.z'
+
+
+class CacheMiss(KeyError):
+    """Ответа нет в кэше, а в режиме replay сеть запрещена"""
+
+
+def cache_key(url, params=None):
+    """Ключ по содержимому запроса: адрес + параметры в каноническом порядке"""
+    query = urlencode(sorted((params or {}).items()))
+    return hashlib.sha256(f"{url}?{query}".encode()).hexdigest()
+
+
+class HttpCache:
+    """Кэш ответов REST на диске: zlib-сжатые записи, TTL для открытых окон и вытеснение LRU по размеру.
+
+    Запись с ttl=None хранится бессрочно (закрытые исторические окна). Давность использования
+    записи — mtime файла: он обновляется при каждом попадании, поэтому LRU переживает перезапуск.
+    """
+
+    def __init__(self, directory='data/http_cache', max_bytes=512 * 1024 * 1024, mode=MODE_OFF):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.total_bytes = None          # Считается лениво при первой записи
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ENTRY_SUFFIX)
+
+    def get(self, url, params=None):
+        """Текст ответа или None (в replay вместо None — CacheMiss)"""
+        if self.mode == MODE_OFF:
+            return None
+        path = self._path(cache_key(url, params))
+        try:
+            with open(path, 'rb') as f:
+                entry = json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error):
+            entry = None
+
+        if entry is not None and (self.mode == MODE_REPLAY or entry['expires'] is None
+                                  or entry['expires'] > time.time()):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            with self.lock:
+                self.hits += 1
+            return entry['body']
+
+        with self.lock:
+            self.misses += 1
+        if self.mode == MODE_REPLAY:
+            raise CacheMiss(f"{url} {params}")
+        return None
+
+    def put(self, url, params, body, ttl=None):
+        """Сохраняет ответ; ttl в секундах, None — бессрочно"""
+        if self.mode != MODE_RECORD:
+            return
+        entry = {
+            'url': url,
+            'params': params,
+            'stored': time.time(),
+            'expires': None if ttl is None else time.time() + ttl,
+            'body': body,
+        }
+        data = zlib.compress(json.dumps(entry).encode(), 6)
+        path = self._path(cache_key(url, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Уникальный tmp на поток: одновременная запись одного ключа не портит файл
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.stores += 1
+            if self.total_bytes is None:
+                self.total_bytes = self._scan_size()
+            else:
+                self.total_bytes += len(data) - previous
+            if self.total_bytes > self.max_bytes:
+                self._evict_locked()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(ENTRY_SUFFIX):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict_locked(self):
+        """Удаляет давно не использованные записи, пока кэш не станет меньше 90% лимита"""
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(self._entries()):
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {'mode': self.mode, 'hits': self.hits, 'misses': self.misses, 'stores': self.stores,
+                'evictions': self.evictions, 'bytes': self.total_bytes}
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return (f"кэш {self.mode}: попаданий {self.hits}/{lookups} ({hit_rate:.0%}), "
+                f"записано {self.stores}, вытеснено {self.evictions}")
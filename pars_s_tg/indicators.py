@@ -0,0 +1,323 @@
+import math
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Инкрементальные индикаторы: состояние — несколько чисел и кольцевой буфер, обновление O(1) на бар.
+# Формулы повторяют pandas-ta (ema с presma, rsi на rma, bbands с ddof=0), чтобы значения совпадали
+# с пакетным пересчётом по всей истории.
+
+
+class SMA:
+    """Простая скользящая средняя на кольцевом буфере с бегущей суммой"""
+
+    def __init__(self, length=10):
+        self.length = length
+        self.buffer = np.zeros(length)
+        self.position = 0
+        self.count = 0
+        self.total = 0.0
+        self.value = None
+
+    def update(self, x):
+        x = float(x)
+        self.total += x - self.buffer[self.position]
+        self.buffer[self.position] = x
+        self.position += 1
+        if self.position == self.length:
+            self.position = 0
+            # Раз в оборот буфера пересчитываем сумму, чтобы ошибка округления не копилась
+            self.total = float(self.buffer.sum())
+        self.count += 1
+        self.value = self.total / self.length if self.count >= self.length else None
+        return self.value
+
+    def warm_up(self, values):
+        values = np.asarray(values, dtype=np.float64)[-self.length:]
+        for x in values:
+            self.update(x)
+        return self.value
+
+
+class RollingStd:
+    """Стандартное отклонение окна (ddof=0): сдвиг Уэлфорда с удалением старого значения"""
+
+    def __init__(self, length=5):
+        self.length = length
+        self.buffer = np.zeros(length)
+        self.position = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.value = None
+
+    def update(self, x):
+        x = float(x)
+        if self.count < self.length:
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+        else:
+            old = self.buffer[self.position]
+            old_mean = self.mean
+            self.mean += (x - old) / self.length
+            self.m2 += (x - old) * (x - self.mean + old - old_mean)
+        self.buffer[self.position] = x
+        self.position = (self.position + 1) % self.length
+        if self.position == 0 and self.count == self.length:
+            window = self.buffer
+            self.mean = float(window.mean())
+            self.m2 = float(((window - self.mean) ** 2).sum())
+        self.value = math.sqrt(max(self.m2, 0.0) / self.length) if self.count >= self.length else None
+        return self.value
+
+    def warm_up(self, values):
+        values = np.asarray(values, dtype=np.float64)[-self.length:]
+        for x in values:
+            self.update(x)
+        return self.value
+
+
+class EMA:
+    """EMA как в pandas-ta: первое значение — SMA первых length баров, дальше alpha = 2 / (length + 1)"""
+
+    def __init__(self, length=10):
+        self.length = length
+        self.alpha = 2.0 / (length + 1)
+        self.count = 0
+        self.seed_total = 0.0
+        self.value = None
+
+    def update(self, x):
+        x = float(x)
+        self.count += 1
+        if self.count < self.length:
+            self.seed_total += x
+        elif self.count == self.length:
+            self.value = (self.seed_total + x) / self.length
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+    def warm_up(self, values):
+        """Прогрев по истории одним векторным проходом pandas вместо цикла по барам"""
+        values = np.asarray(values, dtype=np.float64)
+        if self.count or len(values) <= self.length:
+            for x in values:
+                self.update(x)
+            return self.value
+        self.value = float(_ema_series(values, self.length)[-1])
+        self.count = len(values)
+        return self.value
+
+
+class RMA:
+    """Сглаживание Уайлдера как pandas-ta rma: ewm(alpha=1/length, adjust=True, min_periods=length)"""
+
+    def __init__(self, length=14):
+        self.length = length
+        self.decay = 1.0 - 1.0 / length
+        self.count = 0
+        self.numerator = 0.0
+        self.denominator = 0.0
+        self.value = None
+
+    def update(self, x):
+        self.numerator = float(x) + self.decay * self.numerator
+        self.denominator = 1.0 + self.decay * self.denominator
+        self.count += 1
+        self.value = self.numerator / self.denominator if self.count >= self.length else None
+        return self.value
+
+    def warm_up(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if self.count or len(values) < self.length:
+            for x in values:
+                self.update(x)
+            return self.value
+        # Знаменатель — геометрическая сумма, числитель восстанавливаем из значения ewm
+        mean = float(pd.Series(values).ewm(alpha=1.0 / self.length).mean().iloc[-1])
+        self.count = len(values)
+        self.denominator = (1.0 - self.decay ** self.count) / (1.0 - self.decay)
+        self.numerator = mean * self.denominator
+        self.value = mean
+        return self.value
+
+
+class RSI:
+    """RSI Уайлдера (pandas-ta rsi): rma положительных и отрицательных изменений цены"""
+
+    def __init__(self, length=14, scalar=100.0):
+        self.length = length
+        self.scalar = scalar
+        self.gain = RMA(length)
+        self.loss = RMA(length)
+        self.previous = None
+        self.value = None
+
+    def update(self, x):
+        x = float(x)
+        if self.previous is not None:
+            change = x - self.previous
+            gain = self.gain.update(max(change, 0.0))
+            loss = self.loss.update(max(-change, 0.0))
+            if gain is not None:
+                total = gain + loss
+                self.value = self.scalar * gain / total if total else None
+        self.previous = x
+        return self.value
+
+    def warm_up(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if self.previous is not None or len(values) < 2:
+            for x in values:
+                self.update(x)
+            return self.value
+        change = np.diff(values)
+        gain = self.gain.warm_up(np.maximum(change, 0.0))
+        loss = self.loss.warm_up(np.maximum(-change, 0.0))
+        self.previous = float(values[-1])
+        if gain is not None and gain + loss:
+            self.value = self.scalar * gain / (gain + loss)
+        return self.value
+
+
+class MACD:
+    """MACD (pandas-ta macd): ema(fast) - ema(slow), сигнальная ema считается с первого значения macd"""
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+        self.value = None
+
+    def update(self, x):
+        fast = self.fast.update(x)
+        slow = self.slow.update(x)
+        if slow is None:
+            return None
+        macd = fast - slow
+        signal = self.signal.update(macd)
+        self.value = (macd, signal, macd - signal if signal is not None else None)
+        return self.value
+
+    def warm_up(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if self.slow.count or len(values) <= self.slow.length:
+            for x in values:
+                self.update(x)
+            return self.value
+        # Ряд macd нужен целиком только для прогрева сигнальной линии
+        fast_series = _ema_series(values, self.fast.length)
+        slow_series = _ema_series(values, self.slow.length)
+        macd = (fast_series - slow_series)[self.slow.length - 1:]
+        self.fast.warm_up(values)
+        self.slow.warm_up(values)
+        signal = self.signal.warm_up(macd)
+        self.value = (float(macd[-1]), signal, float(macd[-1]) - signal if signal is not None else None)
+        return self.value
+
+
+class BBands:
+    """Полосы Боллинджера (pandas-ta bbands): sma ± std * stdev(ddof=0) -> (lower, mid, upper)"""
+
+    def __init__(self, length=5, std=2.0):
+        self.length = length
+        self.std = std
+        self.mean = SMA(length)
+        self.deviation = RollingStd(length)
+        self.value = None
+
+    def update(self, x):
+        mid = self.mean.update(x)
+        deviation = self.deviation.update(x)
+        if mid is None:
+            return None
+        self.value = (mid - self.std * deviation, mid, mid + self.std * deviation)
+        return self.value
+
+    def warm_up(self, values):
+        values = np.asarray(values, dtype=np.float64)[-self.length:]
+        for x in values:
+            self.update(x)
+        return self.value
+
+
+def _ema_series(values, length):
+    series = pd.Series(values, dtype=np.float64)
+    seed = series.iloc[:length].mean()
+    series.iloc[:length - 1] = np.nan
+    series.iloc[length - 1] = seed
+    return series.ewm(span=length, adjust=False).mean().to_numpy()
+
+
+class IndicatorSet:
+    """Набор индикаторов по цене закрытия: update(close) -> dict с текущими значениями.
+
+    Тики планировщика идут в пуле потоков и могут перекрываться: update под блокировкой, а с key
+    (время тика или свечи) цена старше уже применённой отбрасывается и считается в stale.
+    """
+
+    def __init__(self, indicators=None):
+        self.indicators = indicators if indicators is not None else {
+            'ema_20': EMA(20),
+            'sma_50': SMA(50),
+            'rsi_14': RSI(14),
+            'macd': MACD(12, 26, 9),
+            'bbands': BBands(20, 2.0),
+        }
+        self.bars = 0
+        self.stale = 0
+        self.last_key = None
+        self.lock = threading.Lock()
+
+    def update(self, close, key=None):
+        with self.lock:
+            if key is not None:
+                if self.last_key is not None and key <= self.last_key:
+                    self.stale += 1          # Ответ на более ранний тик пришёл позже следующего
+                    return None
+                self.last_key = key
+            self.bars += 1
+            return {name: indicator.update(close) for name, indicator in self.indicators.items()}
+
+    def warm_up(self, closes):
+        """Прогрев по истории (массив цен закрытия по возрастанию времени)"""
+        closes = np.asarray(closes, dtype=np.float64)
+        closes = closes[~np.isnan(closes)]
+        self.bars += len(closes)
+        return {name: indicator.warm_up(closes) for name, indicator in self.indicators.items()}
+
+    def warm_up_csv(self, csv_file, column='close', max_rows=100_000, key=None):
+        """Прогрев по хвосту CSV коллектора; возвращает число прочитанных баров.
+
+        key — колонка свечи (timestamp), если одна свеча записана много раз: берётся последняя
+        запись каждой свечи, а самая свежая свеча пропускается, так как может быть ещё открыта.
+        """
+        if not os.path.exists(csv_file):
+            return 0
+        df = pd.read_csv(csv_file, usecols=[column] if key is None else [key, column])
+        if key is not None:
+            df = df.drop_duplicates(key, keep='last').sort_values(key).iloc[:-1]
+        closes = df[column].to_numpy()[-max_rows:]
+        self.warm_up(closes)
+        return len(closes)
+
+    def values(self):
+        with self.lock:
+            return {name: indicator.value for name, indicator in self.indicators.items()}
+
+    def summary(self):
+        """Короткая строка для вывода коллектора"""
+        parts = []
+        for name, value in self.values().items():
+            if value is None:
+                continue
+            if isinstance(value, tuple):
+                value = value[0] if name == 'macd' else value[1]
+            if value is not None:
+                parts.append(f"{name}={value:.6g}")
+        return ' '.join(parts)
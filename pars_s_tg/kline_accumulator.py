@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+VALUE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+class KlineAccumulator:
+    """Свечи в предвыделенных колонках NumPy: слот = (timestamp - start_ts) // interval_ms.
+
+    Проверка дубля — O(1) по битовой маске заполненных слотов, пропуски — просто незаполненные
+    слоты (NaN в колонках). На 1.4M минутных свечей это ~60 МБ вместо сотен МБ для list[dict] + set.
+    """
+
+    def __init__(self, start_ts, end_ts, interval_ms=60_000):
+        self.start_ts = int(start_ts)
+        self.end_ts = int(end_ts)
+        self.interval_ms = int(interval_ms)
+        self.size = max(0, -(-(self.end_ts - self.start_ts) // self.interval_ms))
+
+        self.filled = np.zeros(self.size, dtype=bool)
+        self.saved = np.zeros(self.size, dtype=bool)       # Слоты, уже записанные на диск
+        self.columns = {name: np.full(self.size, np.nan) for name in VALUE_COLUMNS}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def slot(self, ts):
+        """Номер слота для timestamp или -1, если он вне диапазона или не на границе интервала"""
+        offset = int(ts) - self.start_ts
+        if offset < 0 or offset % self.interval_ms:
+            return -1
+        index = offset // self.interval_ms
+        return index if index < self.size else -1
+
+    def add(self, ts, open_, high, low, close, volume):
+        """Добавляет свечу; False — если слот уже заполнен или timestamp вне диапазона"""
+        index = self.slot(ts)
+        if index < 0 or self.filled[index]:
+            return False
+        self.filled[index] = True
+        columns = self.columns
+        columns['open'][index] = open_
+        columns['high'][index] = high
+        columns['low'][index] = low
+        columns['close'][index] = close
+        columns['volume'][index] = volume
+        self.count += 1
+        return True
+
+    def add_batch(self, timestamps, open_, high, low, close, volume):
+        """Векторное добавление: дубли, timestamp вне диапазона и уже заполненные слоты отбрасываются.
+
+        Возвращает количество реально добавленных свечей.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        offsets = timestamps - self.start_ts
+        indexes = offsets // self.interval_ms
+        valid = (offsets >= 0) & (offsets % self.interval_ms == 0) & (indexes < self.size)
+        positions = np.flatnonzero(valid)
+        slots = indexes[positions]
+
+        # Внутри пачки побеждает первое вхождение timestamp (уже упорядоченную пачку не сортируем)
+        if len(slots) > 1 and not np.all(slots[1:] > slots[:-1]):
+            slots, first = np.unique(slots, return_index=True)
+            positions = positions[first]
+        fresh = ~self.filled[slots]
+        slots, positions = slots[fresh], positions[fresh]
+
+        self.filled[slots] = True
+        for name, values in zip(VALUE_COLUMNS, (open_, high, low, close, volume)):
+            self.columns[name][slots] = np.asarray(values, dtype=np.float64)[positions]
+        self.count += len(slots)
+        return len(slots)
+
+    def add_records(self, records):
+        """Добавляет структурированный массив (или DataFrame) с колонками timestamp/open/high/low/close/volume"""
+        return self.add_batch(records['timestamp'], records['open'], records['high'],
+                              records['low'], records['close'], records['volume'])
+
+    def timestamps(self, mask=None):
+        """Timestamp (мс) заполненных слотов, int64"""
+        indexes = np.flatnonzero(self.filled if mask is None else mask)
+        return self.start_ts + indexes.astype(np.int64) * self.interval_ms
+
+    def _frame(self, mask):
+        indexes = np.flatnonzero(mask)
+        data = {'timestamp': self.start_ts + indexes.astype(np.int64) * self.interval_ms}
+        for name in VALUE_COLUMNS:
+            data[name] = self.columns[name][indexes]
+        return pd.DataFrame(data, copy=False)
+
+    def to_frame(self):
+        """Заполненные свечи по порядку времени (timestamp в мс)"""
+        return self._frame(self.filled)
+
+    def unsaved(self):
+        """Свечи, ещё не записанные на диск: (DataFrame, маска слотов) для очередного сегмента.
+
+        Слоты не помечаются записанными: после успешной записи сегмента вызовите commit(маска),
+        иначе при ошибке записи эти свечи попадут в следующий сегмент.
+        """
+        mask = self.filled & ~self.saved
+        return self._frame(mask), mask
+
+    def commit(self, mask):
+        """Слоты маски из unsaved() записаны на диск"""
+        self.saved |= mask
+
+    def mark_saved(self):
+        """Все текущие свечи уже есть на диске (например, загружены из сегментов)"""
+        self.saved[:] = self.filled
@@ -2,10 +2,25 @@
 import requests
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
 import time
 import signal
 import sys
 import os
+from urllib.parse import urlparse
+
+from rate_limit import AdaptiveRateLimiter, backoff_delay
+from decode import decode_kline_page, loads
+from http_cache import CACHE_MODES, MODE_OFF, CacheMiss, HttpCache
+from gaps import gaps_from_mask, load_gap_index, missing_count, plan_refill_requests, save_gap_index
+from kline_accumulator import VALUE_COLUMNS, KlineAccumulator
+from metrics import (GAPS_DETECTED, HTTP_LATENCY, HTTP_REQUESTS, HTTP_RETRIES, MISSING_CANDLES, PARSE_TIME,
+                     ROWS_PERSISTED, PeriodicSummary, start_from_env)
+from segment_store import SegmentStore
+from bars import update_rollups
+from storage import write_ohlcv
 
 SYMBOL = "TONUSDT"
 INTERVAL = "1"  # 1 минута
@@ -14,61 +29,84 @@ INTERVAL_SECONDS = int(INTERVAL) * 60   # Для правильной прове
 START_DATE = "2023-01-23"
 END_DATE = "2025-10-23"
 LIMIT = 200
+BASE_URL = os.environ.get("BYBIT_BASE_URL", "https://api.bybit.com")   # Адрес стенда stub_bybit для офлайн-прогонов
+
+# Параллельная загрузка по временным шардам
+WORKERS = 4                  # Количество потоков загрузки
+SHARD_DAYS = 30              # Размер одного шарда
+REQUESTS_PER_SECOND = 50     # Потолок темпа на все потоки (rate_limit: 50 из конфига); ниже — по заголовкам квоты
+MAX_THROTTLED_RETRIES = 20   # Сколько раз подряд можно упереться в лимит на одном запросе
+MAX_REQUESTS = 10000         # 🛡️ Жёсткий лимит запросов, чтобы не уйти в бесконечность
+AUTOSAVE_INTERVAL = 50       # Автосохранение каждые N запросов
+
+# Кэш ответов API: закрытые окна истории хранятся бессрочно, окна с открытой свечой — LIVE_CACHE_TTL секунд
+HTTP_CACHE_DIR = "data/http_cache"
+# По умолчанию выключен; включается явно: --cache=record / --cache=replay (только записанное) или BYBIT_HTTP_CACHE
+HTTP_CACHE_MODE = os.environ.get("BYBIT_HTTP_CACHE", MODE_OFF)
+HTTP_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+LIVE_CACHE_TTL = 60
 
 # Глобальные переменные для сохранения состояния
-all_klines = []
-seen_timestamps = set()
+accumulator = None           # KlineAccumulator на весь диапазон, создаётся в main()
 request_count = 0
-current_start = 0
-filename = ""
+last_save_count = 0
+shards = []                  # Курсоры шардов: [{'id', 'start', 'end', 'cursor', 'done'}]
+replay_missed = []           # Шарды, остановленные на странице, которой нет в кэше replay
+segment_store = None         # Append-only сегменты _PARTIAL, создаётся в main()
+
+state_lock = threading.RLock()          # Защищает все глобальные переменные выше
+stop_event = threading.Event()          # Выставляется по Ctrl+C, потоки завершают текущий запрос
+rate_limiter = AdaptiveRateLimiter(REQUESTS_PER_SECOND)
+http_cache = HttpCache(HTTP_CACHE_DIR, HTTP_CACHE_MAX_BYTES, HTTP_CACHE_MODE)
+progress_log = PeriodicSummary(10.0)    # Сводка по запросам раз в 10 с вместо строки на каждый запрос
+parse_klines_time = PARSE_TIME.labels(stage='klines')
+
+def data_filename(suffix):
+    """Путь к файлу данных текущей загрузки"""
+    return f"data/bybit_{SYMBOL.lower()}_{INTERVAL}_{START_DATE.replace('-', '')}_{END_DATE.replace('-', '')}{suffix}"
 
 def save_progress():
-    """Сохраняет текущий прогресс в CSV файл"""
-    global all_klines, current_start, request_count, filename
-    
-    if not all_klines:
+    """Дописывает новые свечи сегментом и сохраняет точку возобновления"""
+    # Данные и курсоры шардов снимаются под одной блокировкой, чтобы они были согласованы
+    with state_lock:
+        _save_progress_locked()
+
+def _save_progress_locked():
+    if not accumulator:
         print("ℹ️ Нет данных для сохранения")
         return
     
     try:
-        df = pd.DataFrame(all_klines)
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df.set_index('timestamp', inplace=True)
-        df.sort_index(inplace=True)
-        df = df[~df.index.duplicated(keep='first')]  # Финальная очистка от дублей
-
-        # Проверка целостности
-        total_expected = 0
-        total_actual = len(df)
-        gaps = 0
-        if len(df) > 1:
-            total_expected = int((df.index[-1] - df.index[0]).total_seconds() / INTERVAL_SECONDS) + 1
-            gaps = total_expected - total_actual
-
-        # Определяем имя файла
-        if not filename:
-            filename = f"data/bybit_{SYMBOL.lower()}_{INTERVAL}_{START_DATE.replace('-', '')}_{END_DATE.replace('-', '')}_PARTIAL.csv"
-
-        # Создаем папку data если её нет
-        os.makedirs('data', exist_ok=True)
-        
-        df.to_csv(filename)
-        
-        print(f"\n💾 ПРОГРЕСС СОХРАНЕН: {total_actual} свечей в {filename}")
-        if len(df) > 1:
-            print(f"📅 Диапазон: {df.index[0]} — {df.index[-1]}")
+        # Пишем только свечи, появившиеся после прошлого чекпоинта
+        new_klines, mask = accumulator.unsaved()
+        segment_store.append(new_klines)
+        accumulator.commit(mask)
+        ROWS_PERSISTED.inc(len(new_klines), file='segments')
+
+        # Проверка целостности по манифесту, без перечитывания данных
+        first_ts, last_ts = segment_store.time_range()
+        total_actual = len(accumulator)
+        total_expected = (last_ts - first_ts) // (INTERVAL_SECONDS * 1000) + 1
+        gaps = total_expected - total_actual
+        MISSING_CANDLES.set(gaps)
+
+        print(f"\n💾 ПРОГРЕСС СОХРАНЕН: +{len(new_klines)} свечей (всего {total_actual}) в {segment_store.directory}")
+        if total_actual > 1:
+            print(f"📅 Диапазон: {pd.to_datetime(first_ts, unit='ms')} — {pd.to_datetime(last_ts, unit='ms')}")
             print(f"📊 Ожидалось: {total_expected} минут")
             print(f"📉 Пропущено: {gaps} минут ({gaps/total_expected:.2%})")
         
-        # Сохраняем также точку возобновления
+        # Сохраняем также курсоры всех шардов
         resume_info = {
-            'last_timestamp': current_start,
-            'total_records': len(all_klines),
+            'shards': shards,
+            'total_records': len(accumulator),
             'last_request': request_count
         }
-        resume_file = filename.replace('.csv', '_resume.json')
-        pd.Series(resume_info).to_json(resume_file)
-        print(f"📋 Точка возобновления сохранена: {resume_file}")
+        resume_file = data_filename('_PARTIAL_resume.json')
+        with open(resume_file, 'w') as f:
+            json.dump(resume_info, f)
+        pending = sum(1 for shard in shards if not shard['done'])
+        print(f"📋 Точка возобновления сохранена: {resume_file} (незавершённых шардов: {pending})")
         
     except Exception as e:
         print(f"❌ Ошибка при сохранении прогресса: {e}")
@@ -76,52 +114,88 @@ def save_progress():
 def signal_handler(sig, frame):
     """Обработчик сигнала прерывания (Ctrl+C)"""
     print(f"\n\n🛑 Получен сигнал прерывания...")
-    print("💾 Сохраняем прогресс перед выходом...")
-    save_progress()
-    print("👋 Выход из программы")
-    sys.exit(0)
-
-def load_resume_info():
+    print("⏳ Ждём завершения текущих запросов в потоках...")
+    stop_event.set()
+
+def discard_partial():
+    """Новая загрузка: сегменты и _PARTIAL.csv брошенного прогона не должны попасть в итоговый файл"""
+    if segment_store.segments:
+        print(f"🗑️ Удалены сегменты прошлой загрузки: {segment_store.directory} ({segment_store.total_rows} свечей)")
+    segment_store.clear()
+    legacy_file = data_filename('_PARTIAL.csv')
+    if os.path.exists(legacy_file):
+        os.remove(legacy_file)
+        print(f"🗑️ Удален временный файл прошлой загрузки: {legacy_file}")
+
+def plan_shards(start_ts, end_ts):
+    """Делит диапазон [start_ts, end_ts) на независимые временные шарды"""
+    shard_ms = SHARD_DAYS * 24 * 60 * 60 * 1000
+    planned = []
+    shard_start = start_ts
+    while shard_start < end_ts:
+        shard_end = min(shard_start + shard_ms, end_ts)
+        planned.append({
+            'id': len(planned),
+            'start': shard_start,
+            'end': shard_end,
+            'cursor': shard_start,
+            'done': False,
+        })
+        shard_start = shard_end
+    return planned
+
+def resume_shards(resume_data, end_ts):
+    """Восстанавливает курсоры шардов из файла возобновления"""
+    if 'shards' in resume_data:
+        return resume_data['shards']
+    # Старый формат с единственным курсором: всё до last_timestamp уже загружено
+    return plan_shards(int(resume_data['last_timestamp']), end_ts)
+
+def load_resume_info(end_ts):
     """Загружает информацию для возобновления работы"""
-    global all_klines, seen_timestamps, request_count, current_start
+    global request_count, shards
     
-    resume_file = f"data/bybit_{SYMBOL.lower()}_{INTERVAL}_{START_DATE.replace('-', '')}_{END_DATE.replace('-', '')}_PARTIAL_resume.json"
+    resume_file = data_filename('_PARTIAL_resume.json')
     if os.path.exists(resume_file):
         try:
-            resume_data = pd.read_json(resume_file, typ='series')
+            with open(resume_file) as f:
+                resume_data = json.load(f)
+            resumed_shards = resume_shards(resume_data, end_ts)
+            pending = [shard for shard in resumed_shards if not shard['done']]
             print(f"🔄 Найдена точка возобновления: {resume_file}")
-            print(f"   Последний timestamp: {resume_data['last_timestamp']}")
+            print(f"   Незавершённых шардов: {len(pending)} из {len(resumed_shards)}")
             print(f"   Всего записей: {resume_data['total_records']}")
             print(f"   Запросов сделано: {resume_data['last_request']}")
             
             choice = input("   Продолжить с этой точки? (y/n): ").strip().lower()
             if choice == 'y':
-                # Загружаем существующие данные если есть
-                existing_file = f"data/bybit_{SYMBOL.lower()}_{INTERVAL}_{START_DATE.replace('-', '')}_{END_DATE.replace('-', '')}_PARTIAL.csv"
-                if os.path.exists(existing_file):
+                # Загружаем существующие данные если есть: сегменты или целый CSV старого формата
+                existing_file = data_filename('_PARTIAL.csv')
+                if segment_store.segments or os.path.exists(existing_file):
                     try:
-                        existing_df = pd.read_csv(existing_file, index_col='timestamp', parse_dates=True)
-                        for idx, row in existing_df.iterrows():
-                            ts = int(idx.timestamp() * 1000)
-                            all_klines.append({
-                                "timestamp": ts,
-                                "open": row['open'],
-                                "high": row['high'],
-                                "low": row['low'],
-                                "close": row['close'],
-                                "volume": row['volume'],
-                            })
-                            seen_timestamps.add(ts)
+                        load_started = time.perf_counter()
+                        if segment_store.segments:
+                            # Бинарные сегменты отображаются в память и вливаются целыми колонками
+                            for records in segment_store.iter_arrays():
+                                accumulator.add_records(records)
+                        else:
+                            existing_df = pd.read_csv(existing_file)
+                            existing_df['timestamp'] = pd.to_datetime(existing_df['timestamp']).astype('datetime64[ms]').astype('int64')
+                            accumulator.add_records(existing_df)
+                        print(f"⚡ Состояние восстановлено за {time.perf_counter() - load_started:.2f} с")
+                        # Свечи из сегментов уже на диске, из старого CSV — запишутся первым сегментом
+                        if segment_store.segments:
+                            accumulator.mark_saved()
                         request_count = resume_data['last_request']
-                        current_start = resume_data['last_timestamp']
-                        print(f"📂 Загружено {len(all_klines)} существующих записей")
-                        return current_start, len(all_klines), request_count
+                        shards = resumed_shards
+                        print(f"📂 Загружено {len(accumulator)} существующих записей")
+                        return shards, len(accumulator), request_count
                     except Exception as e:
                         print(f"⚠️ Ошибка загрузки существующих данных: {e}")
                 else:
-                    current_start = resume_data['last_timestamp']
+                    shards = resumed_shards
                     request_count = resume_data['last_request']
-                    return current_start, resume_data['total_records'], request_count
+                    return shards, resume_data['total_records'], request_count
         except Exception as e:
             print(f"⚠️ Ошибка загрузки точки возобновления: {e}")
     
@@ -131,139 +205,164 @@ def date_to_timestamp(date_str):
     dt = datetime.strptime(date_str, "%Y-%m-%d")
     return int(dt.timestamp() * 1000)
 
-def make_api_request(url, params, max_retries=3):
-    """Безопасный запрос к API с повторными попытками"""
-    for attempt in range(max_retries):
+def cache_ttl(window_end):
+    """TTL ответа в кэше: None (бессрочно), если окно целиком в прошлом и свечи в нём уже закрыты"""
+    closed_before = time.time() * 1000 - INTERVAL_SECONDS * 1000
+    return None if window_end <= closed_before else LIVE_CACHE_TTL
+
+def make_api_request(url, params, max_retries=3, ttl=LIVE_CACHE_TTL, decode=loads):
+    """Безопасный запрос к API с повторными попытками; сначала смотрим в кэш ответов.
+
+    decode разбирает сырое тело ответа в словарь с retCode (для свечей — decode_kline_page).
+    """
+    # В replay промах — CacheMiss: решает вызывающий, повтор или пропуск минуты здесь не помогут
+    cached = http_cache.get(url, params)
+    if cached is not None:
+        return decode(cached)
+
+    endpoint = urlparse(url).path
+    attempt = 0
+    throttled = 0
+    while attempt < max_retries:
         try:
+            # Общий на все потоки контроллер темпа — только для реальных обращений к сети
+            rate_limiter.acquire()
+            started = time.perf_counter()
             response = requests.get(url, params=params, timeout=15)
+            HTTP_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+            HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+
+            # Превышение лимита: контроллер сам снизит темп и поставит паузу всем потокам,
+            # такие повторы не расходуют попытки (но и не бесконечны)
+            if rate_limiter.observe(response.status_code, response.headers, response.content):
+                throttled += 1
+                HTTP_RETRIES.inc(reason='throttled')
+                print(f"🚦 Лимит запросов превышен ({response.status_code}), темп: {rate_limiter.rate:.1f} запр/с")
+                if throttled >= MAX_THROTTLED_RETRIES:
+                    return None
+                continue
             
             # Проверяем статус код
             if response.status_code != 200:
                 print(f"❌ HTTP ошибка {response.status_code}: {response.text[:100]}")
-                time.sleep(2)
+                HTTP_RETRIES.inc(reason='http')
+                time.sleep(backoff_delay(attempt))
+                attempt += 1
                 continue
                 
             # Проверяем что ответ не пустой
             if not response.text.strip():
                 print(f"❌ Пустой ответ от сервера")
-                time.sleep(2)
+                HTTP_RETRIES.inc(reason='empty')
+                time.sleep(backoff_delay(attempt))
+                attempt += 1
                 continue
                 
             # Пытаемся распарсить JSON
             try:
-                data = response.json()
+                with PARSE_TIME.time(stage='json'):
+                    data = decode(response.content)
+                if data.get("retCode") == 0:
+                    http_cache.put(url, params, response.text, ttl)
                 return data
             except ValueError as e:
                 print(f"❌ Ошибка парсинга JSON (попытка {attempt + 1}/{max_retries}): {e}")
                 print(f"📄 Ответ сервера: {response.text[:200]}...")
-                time.sleep(2)
-                continue
+                HTTP_RETRIES.inc(reason='json')
                 
         except requests.exceptions.Timeout:
             print(f"⏰ Таймаут запроса (попытка {attempt + 1}/{max_retries})")
-            time.sleep(3)
+            HTTP_RETRIES.inc(reason='timeout')
         except requests.exceptions.ConnectionError:
             print(f"🔌 Ошибка подключения (попытка {attempt + 1}/{max_retries})")
-            time.sleep(5)
+            HTTP_RETRIES.inc(reason='connection')
         except Exception as e:
             print(f"⚠️ Неожиданная ошибка запроса (попытка {attempt + 1}/{max_retries}): {e}")
-            time.sleep(2)
+            HTTP_RETRIES.inc(reason='error')
+        # Сетевые сбои: экспоненциальная задержка с джиттером вместо фиксированных 2/3/5 с
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
     
     return None
 
-def main():
-    global all_klines, seen_timestamps, request_count, current_start, filename
-    
-    # Регистрируем обработчик сигналов
-    signal.signal(signal.SIGINT, signal_handler)
+def add_klines(klines, current_start, shard_end):
+    """Добавляет свечи страницы из [current_start, shard_end) -> (новых свечей, максимальный ts страницы)
 
-    start_ts = date_to_timestamp(START_DATE)
-    end_ts = date_to_timestamp(END_DATE)
-
-    print(f"📥 Загрузка {INTERVAL}-минутных свечей {SYMBOL} с {START_DATE} по {END_DATE}...")
-    print(f"⏱️ Целевой диапазон: {start_ts} — {end_ts} (мс)")
+    klines — колонки decode_kline_page (по возрастанию времени); фильтры — маски по всей странице.
+    """
+    timestamps = klines['timestamp']
+    if not len(timestamps):
+        return 0, 0
+    # Свечи ДО текущей границы и ПОСЛЕ конца шарда пропускаем, дубли отбросит accumulator по маске слотов
+    in_range = (timestamps >= current_start) & (timestamps < shard_end)
+    new_klines = accumulator.add_batch(timestamps[in_range], *(klines[name][in_range] for name in VALUE_COLUMNS))
+    return new_klines, int(timestamps[-1])
 
-    # Пытаемся загрузить точку возобновления
-    resume_ts, resume_records, resume_requests = load_resume_info()
-    if resume_ts:
-        current_start = resume_ts
-        print(f"🔄 Продолжаем с timestamp: {current_start}")
-    else:
-        current_start = start_ts
-        print("🆕 Начинаем новую загрузку")
+def fetch_shard(shard, end_ts):
+    """Последовательно загружает один шард, продвигая его собственный курсор"""
+    global request_count, last_save_count
 
-    base_url = "https://api.bybit.com"
     endpoint = "/v5/market/kline"
+    shard_end = min(shard['end'], end_ts)
+
+    while shard['cursor'] < shard_end and not stop_event.is_set():
+        with state_lock:
+            if request_count >= MAX_REQUESTS:
+                return
+
+        params = {
+            "category": "linear",
+            "symbol": SYMBOL,
+            "interval": INTERVAL,
+            "start": shard['cursor'],
+            "limit": LIMIT,
+        }
 
-    MAX_REQUESTS = 10000  # 🛡️ Жёсткий лимит запросов, чтобы не уйти в бесконечность
-
-    # Автосохранение каждые N запросов
-    AUTOSAVE_INTERVAL = 50
-    last_save_count = 0
-
-    try:
-        while current_start < end_ts and request_count < MAX_REQUESTS:
-            params = {
-                "category": "linear",
-                "symbol": SYMBOL,
-                "interval": INTERVAL,
-                "start": current_start,
-                "limit": LIMIT,
-            }
-
-            # Используем безопасный запрос
-            data = make_api_request(base_url + endpoint, params)
-            
-            if data is None:
-                print("❌ Не удалось получить данные после всех попыток, пропускаем...")
-                current_start += 60 * 1000  # пропускаем 1 минуту
-                continue
-
-            if data.get("retCode") != 0:
-                print(f"❌ Ошибка API: {data.get('retMsg')}")
-                time.sleep(1)
-                continue  # попробуем ещё раз
-
-            klines = data["result"]["list"]
-            if not klines:
-                print("ℹ️ Данные закончились (пустой ответ)")
-                break
-
-            # Сортируем свечи по времени (на всякий случай)
-            klines.sort(key=lambda x: int(x[0]))
-
-            new_klines = 0
-            last_ts_in_batch = 0
-            for k in klines:
-                ts = int(k[0])
-                last_ts_in_batch = max(last_ts_in_batch, ts)
-                if ts < current_start:
-                    continue  # пропускаем свечи ДО текущей границы
-                if ts in seen_timestamps:
-                    continue  # пропускаем дубли
-                if ts >= end_ts:
-                    continue  # пропускаем свечи ПОСЛЕ конца периода
-
-                seen_timestamps.add(ts)
-                all_klines.append({
-                    "timestamp": ts,
-                    "open": float(k[1]),
-                    "high": float(k[2]),
-                    "low": float(k[3]),
-                    "close": float(k[4]),
-                    "volume": float(k[5]),
-                })
-                new_klines += 1
-
-            # Продвигаем current_start на основе МАКСИМАЛЬНОГО timestamp в батче
+        window_end = shard['cursor'] + LIMIT * INTERVAL_SECONDS * 1000
+        try:
+            data = make_api_request(BASE_URL + endpoint, params, ttl=cache_ttl(window_end), decode=decode_kline_page)
+        except CacheMiss:
+            # Следующий start тоже не записан: шаг по минуте дал бы тысячи промахов и тихие дыры
+            print(f"❌ [шард {shard['id']}] Нет записанного ответа (replay) для start={shard['cursor']}, шард остановлен")
+            with state_lock:
+                replay_missed.append(shard['id'])
+            return
+
+        if data is None:
+            print(f"❌ [шард {shard['id']}] Не удалось получить данные после всех попыток, пропускаем...")
+            with state_lock:
+                shard['cursor'] += 60 * 1000  # пропускаем 1 минуту
+            continue
+
+        if data.get("retCode") != 0:
+            print(f"❌ [шард {shard['id']}] Ошибка API: {data.get('retMsg')}")
+            time.sleep(1)
+            continue  # попробуем ещё раз
+
+        klines = data["klines"]
+        if not len(klines["timestamp"]):
+            print(f"ℹ️ [шард {shard['id']}] Данные закончились (пустой ответ)")
+            break
+
+        with state_lock:
+            current_start = shard['cursor']
+            with parse_klines_time.time():
+                new_klines, last_ts_in_batch = add_klines(klines, current_start, shard_end)
+
+            # Продвигаем курсор шарда на основе МАКСИМАЛЬНОГО timestamp в батче
             if last_ts_in_batch >= current_start:
                 current_start = last_ts_in_batch + 1
             else:
-                print(f"⚠️ Предупреждение: last_ts_in_batch ({last_ts_in_batch}) < current_start ({current_start})")
+                print(f"⚠️ [шард {shard['id']}] Предупреждение: last_ts_in_batch ({last_ts_in_batch}) < current_start ({current_start})")
                 current_start += 60 * 1000  # пропускаем 1 минуту вперёд, чтобы не зациклиться
 
+            if new_klines == 0 and current_start < shard_end:
+                print(f"ℹ️ [шард {shard['id']}] Нет новых свечей в батче — пропускаем 1 минуту")
+                current_start += 60 * 1000
+
+            shard['cursor'] = current_start
             request_count += 1
-            print(f"✅ Запрос {request_count}: +{new_klines} свечей, всего: {len(all_klines)}, next_start: {current_start}")
+            progress_log.maybe_log(lambda: f"✅ Запросов: {request_count}, свечей: {len(accumulator)}")
 
             # Автосохранение каждые N запросов
             if request_count - last_save_count >= AUTOSAVE_INTERVAL:
@@ -271,25 +370,80 @@ def main():
                 save_progress()
                 last_save_count = request_count
 
-            if new_klines == 0:
-                print("ℹ️ Нет новых свечей в батче — пропускаем 1 минуту")
-                current_start += 60 * 1000
+    with state_lock:
+        if shard['cursor'] >= shard_end or (not stop_event.is_set() and request_count < MAX_REQUESTS):
+            shard['done'] = True
 
-            time.sleep(0.2)  # уважаем rate limit
+def main():
+    global accumulator, request_count, last_save_count, shards, segment_store
+    
+    # Регистрируем обработчик сигналов
+    signal.signal(signal.SIGINT, signal_handler)
+    start_from_env()
+    replay_missed.clear()
+
+    start_ts = date_to_timestamp(START_DATE)
+    end_ts = date_to_timestamp(END_DATE)
+
+    print(f"📥 Загрузка {INTERVAL}-минутных свечей {SYMBOL} с {START_DATE} по {END_DATE}...")
+    print(f"⏱️ Целевой диапазон: {start_ts} — {end_ts} (мс)")
+
+    segment_store = SegmentStore(data_filename('_PARTIAL'))
+    accumulator = KlineAccumulator(start_ts, end_ts, INTERVAL_SECONDS * 1000)
+
+    # Пытаемся загрузить точку возобновления
+    resume_shards_list, resume_records, resume_requests = load_resume_info(end_ts)
+    if resume_shards_list:
+        shards = resume_shards_list
+        last_save_count = request_count
+        print(f"🔄 Продолжаем незавершённые шарды")
+    else:
+        shards = plan_shards(start_ts, end_ts)
+        discard_partial()
+        print("🆕 Начинаем новую загрузку")
 
+    pending = [shard for shard in shards if not shard['done']]
+    print(f"🧩 Шардов: {len(shards)}, к загрузке: {len(pending)}, потоков: {WORKERS}, лимит: {REQUESTS_PER_SECOND} запр/с")
+
+    try:
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            futures = [pool.submit(fetch_shard, shard, end_ts) for shard in pending]
+            try:
+                for future in futures:
+                    # Ожидание с таймаутом, чтобы Ctrl+C обрабатывался в главном потоке
+                    while not future.done():
+                        time.sleep(0.2)
+                    future.result()
+            except BaseException:
+                stop_event.set()  # Останавливаем остальные потоки перед выходом из пула
+                raise
+        print(f"🗄️ {http_cache.summary()}")
+        print(f"🚦 {rate_limiter.summary()}")
+        print(f"📈 {progress_log.registry.summary()}")
+
+        if stop_event.is_set():
+            print("💾 Сохраняем прогресс перед выходом...")
+            save_progress()
+            print("👋 Выход из программы")
+            sys.exit(0)
+        if replay_missed:
+            print(f"❌ Replay неполный: шарды {sorted(replay_missed)} остановлены на незаписанных страницах. "
+                  f"Прогресс сохранён — докачайте их с --cache=record")
+            save_progress()
+            sys.exit(1)
         if request_count >= MAX_REQUESTS:
             print(f"🚨 Достигнут лимит запросов ({MAX_REQUESTS}) — возможно, зацикливание. Прерываем.")
 
         # Финальное сохранение
-        if all_klines:
-            # Сохраняем финальную версию без _PARTIAL в имени
-            final_filename = f"data/bybit_{SYMBOL.lower()}_{INTERVAL}_{START_DATE.replace('-', '')}_{END_DATE.replace('-', '')}.csv"
-            
-            df = pd.DataFrame(all_klines)
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df.set_index('timestamp', inplace=True)
-            df.sort_index(inplace=True)
-            df = df[~df.index.duplicated(keep='first')]  # Финальная очистка от дублей
+        if accumulator:
+            # Дописываем хвост последним сегментом и сливаем сегменты в финальный файл без _PARTIAL в имени
+            final_filename = data_filename('.csv')
+            with state_lock:
+                new_klines, mask = accumulator.unsaved()
+                segment_store.append(new_klines)
+                accumulator.commit(mask)
+            os.makedirs('data', exist_ok=True)
+            df = segment_store.compact(final_filename)
 
             # Проверка целостности
             total_expected = 0
@@ -299,24 +453,33 @@ def main():
                 total_expected = int((df.index[-1] - df.index[0]).total_seconds() / INTERVAL_SECONDS) + 1
                 gaps = total_expected - total_actual
 
-            df.to_csv(final_filename)
-
             print(f"\n🎉 ФИНАЛЬНОЕ СОХРАНЕНИЕ: {total_actual} уникальных свечей в {final_filename}")
+            update_dataset(df, start_ts, end_ts)
             if len(df) > 1:
                 print(f"📅 Диапазон: {df.index[0]} — {df.index[-1]}")
                 print(f"📊 Ожидалось: {total_expected} минут")
                 print(f"📉 Пропущено: {gaps} минут ({gaps/total_expected:.2%})")
 
+            # Индекс пропусков по всему целевому диапазону — для режима --refill
+            gap_index = gaps_from_mask(accumulator.filled, start_ts, INTERVAL_SECONDS * 1000)
+            MISSING_CANDLES.set(missing_count(gap_index, INTERVAL_SECONDS * 1000))
+            GAPS_DETECTED.inc(len(gap_index), source='backfill')
+            save_gap_index(data_filename('_gaps.json'), gap_index, INTERVAL_SECONDS * 1000, start_ts, end_ts)
+            print(f"🕳️ Индекс пропусков: {len(gap_index)} интервалов -> {data_filename('_gaps.json')}")
+
             # Удаляем временные файлы
-            if filename and os.path.exists(filename):
-                os.remove(filename)
-                print(f"🗑️ Удален временный файл: {filename}")
-            resume_file = filename.replace('.csv', '_resume.json') if filename else ""
-            if resume_file and os.path.exists(resume_file):
+            segment_store.clear()
+            print(f"🗑️ Удалены сегменты: {segment_store.directory}")
+            legacy_file = data_filename('_PARTIAL.csv')
+            if os.path.exists(legacy_file):
+                os.remove(legacy_file)
+                print(f"🗑️ Удален временный файл: {legacy_file}")
+            resume_file = data_filename('_PARTIAL_resume.json')
+            if os.path.exists(resume_file):
                 os.remove(resume_file)
                 print(f"🗑️ Удален файл возобновления: {resume_file}")
                 
-            if len(all_klines) > 1_100_000:
+            if len(accumulator) > 1_100_000:
                 print(f"🚨 ВНИМАНИЕ: данных больше 1.1M — проверь, нет ли ошибок в логике!")
         else:
             print("❌ Не удалось загрузить данные")
@@ -326,5 +489,113 @@ def main():
         print("💾 Пытаемся сохранить прогресс...")
         save_progress()
 
+def update_dataset(df, start_ts, end_ts):
+    """Колоночная копия в датасете и досчёт уровней 5m/15m/1h/1d по загруженному диапазону"""
+    write_ohlcv(df, SYMBOL, f"linear_{INTERVAL}")
+    print(f"📦 Колоночная копия: data/dataset/symbol={SYMBOL}/interval=linear_{INTERVAL}")
+    if INTERVAL == "1":
+        levels = update_rollups(SYMBOL, 'linear', start_ts, end_ts)
+        if levels:
+            print(f"🧱 Уровни: " + ', '.join(f"{timeframe}={rows}" for timeframe, rows in levels.items()))
+
+def fetch_refill_window(window):
+    """Загружает одно окно дозагрузки [start, end] (end включительно)"""
+    params = {
+        "category": "linear",
+        "symbol": SYMBOL,
+        "interval": INTERVAL,
+        "start": window[0],
+        "end": window[1],
+        "limit": LIMIT,
+    }
+    try:
+        data = make_api_request(BASE_URL + "/v5/market/kline", params, ttl=cache_ttl(window[1] + 1),
+                                decode=decode_kline_page)
+    except CacheMiss:
+        print(f"❌ Окно {window[0]}—{window[1]} не записано в кэше (replay)")
+        return None
+    if data is None or data.get("retCode") != 0:
+        print(f"❌ Окно {window[0]}—{window[1]} не загружено: {data and data.get('retMsg')}")
+        return None
+    return data["klines"]
+
+def load_final_file(final_filename, start_ts, end_ts, interval_ms):
+    """Итоговый CSV в накопитель свечей (маска заполненных слотов — основа индекса пропусков)"""
+    df = pd.read_csv(final_filename)
+    df['timestamp'] = pd.to_datetime(df['timestamp']).astype('datetime64[ms]').astype('int64')
+    accumulator = KlineAccumulator(start_ts, end_ts, interval_ms)
+    accumulator.add_records(df)
+    return accumulator
+
+def refill_gaps():
+    """Дозагружает только пропущенные интервалы итогового файла, объединяя их в минимум запросов"""
+    final_filename = data_filename('.csv')
+    if not os.path.exists(final_filename):
+        print(f"❌ Нет итогового файла {final_filename} — сначала выполните загрузку")
+        return
+
+    start_ts = date_to_timestamp(START_DATE)
+    end_ts = date_to_timestamp(END_DATE)
+    interval_ms = INTERVAL_SECONDS * 1000
+    gaps_filename = data_filename('_gaps.json')
+
+    # Индекс, записанный после последнего изменения файла данных, описывает именно его: пропуски
+    # берём из него, а многолетний CSV читаем, только если есть что дозагружать
+    refill = None
+    gap_index = None
+    if os.path.exists(gaps_filename) and os.path.getmtime(gaps_filename) >= os.path.getmtime(final_filename):
+        gap_index = load_gap_index(gaps_filename, interval_ms, start_ts, end_ts)
+    if gap_index is None:
+        refill = load_final_file(final_filename, start_ts, end_ts, interval_ms)
+        gap_index = gaps_from_mask(refill.filled, start_ts, interval_ms)
+        print(f"🕳️ Индекс пропусков пересчитан по {final_filename}")
+    else:
+        print(f"🕳️ Индекс пропусков: {gaps_filename}")
+
+    missing_before = missing_count(gap_index, interval_ms)
+    windows = plan_refill_requests(gap_index, interval_ms, LIMIT)
+    print(f"🕳️ Пропусков: {len(gap_index)} ({missing_before} свечей), запросов на дозагрузку: {len(windows)}")
+    if not windows:
+        if refill is not None:
+            save_gap_index(gaps_filename, gap_index, interval_ms, start_ts, end_ts)
+        return
+    if refill is None:
+        refill = load_final_file(final_filename, start_ts, end_ts, interval_ms)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        for klines in pool.map(fetch_refill_window, windows):
+            if klines is not None:
+                # Слоты, которые уже заполнены, accumulator пропустит сам
+                refill.add_records(klines)
+    print(f"🗄️ {http_cache.summary()}")
+    print(f"🚦 {rate_limiter.summary()}")
+
+    gap_index = gaps_from_mask(refill.filled, start_ts, interval_ms)
+    missing_after = missing_count(gap_index, interval_ms)
+    print(f"✅ Дозагружено {missing_before - missing_after} свечей за {time.perf_counter() - started:.1f} с, "
+          f"осталось пропусков: {len(gap_index)} ({missing_after} свечей — вероятно, нет на бирже)")
+
+    result = refill.to_frame()
+    result['timestamp'] = pd.to_datetime(result['timestamp'], unit='ms')
+    result.set_index('timestamp', inplace=True)
+    result.to_csv(final_filename)
+    update_dataset(result, start_ts, end_ts)
+    save_gap_index(gaps_filename, gap_index, interval_ms, start_ts, end_ts)
+    print(f"💾 Обновлены {final_filename} и {gaps_filename}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # python load_dt02.py [--refill] [--cache=off|record|replay]
+    # --refill — дозагрузить только пропуски в готовом файле; --cache — режим кэша ответов API
+    args = sys.argv[1:]
+    for arg in [arg for arg in args if arg.startswith('--cache=')]:
+        mode = arg.split('=', 1)[1]
+        if mode not in CACHE_MODES:
+            print(f"Неизвестный режим кэша {mode}: {', '.join(CACHE_MODES)}")
+            sys.exit(1)
+        http_cache.mode = mode
+        args.remove(arg)
+    if args and args[0] == '--refill':
+        refill_gaps()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,289 @@
+import mmap
+import os
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+try:
+    import _posixshmem      # Внутренний модуль CPython на POSIX (им пользуется сам shared_memory)
+except ImportError:
+    _posixshmem = None
+
+# Шина живых данных: кольцевой буфер фиксированного размера в разделяемой памяти.
+# Один писатель (сборщик) на буфер, читателей сколько угодно; читатели не блокируются — согласованность
+# даёт номер последней записи в заголовке (write_seq), который писатель обновляет после записи.
+BUS_MAGIC = 0x5355424E4F4F4D       # 'MOONBUS'
+BUS_VERSION = 1
+DEFAULT_CAPACITY = 4096             # Больше часа секундных баров
+# Сколько крутиться в ожидании до перехода на sleep; на одном ядре активное ожидание отнимает время у писателя
+SPIN_SECONDS = 0.0005 if (os.cpu_count() or 1) > 1 else 0.0
+POLL_SECONDS = 0.0002
+
+HEADER_DTYPE = np.dtype([
+    ('magic', '<u8'), ('version', '<u4'), ('record_size', '<u4'), ('capacity', '<u8'),
+    ('write_seq', '<u8'),           # Номер последней полностью записанной записи (с 1)
+    ('created_ns', '<i8'), ('closed', '<u8'),
+    ('writer_pid', '<u8'),          # Процесс писателя: второй экземпляр не перехватывает живую шину
+    ('reserved', '<u8'),
+])                                  # 64 байта — одна кэш-линия
+RECORD_DTYPE = np.dtype([
+    ('seq', '<u8'),
+    ('timestamp', '<i8'),           # Время бара/тика, мс
+    ('publish_ns', '<i8'),          # time.time_ns() в момент публикации — для замера задержки
+    ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'), ('volume', '<f8'),
+    ('trades', '<i8'),
+])
+
+
+class BusClosed(EOFError):
+    """Писатель закрыл шину (остановлен или перезапущен), новых записей не будет"""
+
+
+def bus_name(symbol, stream):
+    """Имя сегмента разделяемой памяти: ('TONUSDT', 'ticker') -> 'moon_tonusdt_ticker'"""
+    return f"moon_{symbol.lower()}_{stream}"
+
+
+def _segment_size(capacity):
+    # Записи лежат дважды подряд (зеркало): любые последние N — непрерывный срез без копирования
+    return HEADER_DTYPE.itemsize + 2 * capacity * RECORD_DTYPE.itemsize
+
+
+def _map(buffer, capacity):
+    header = np.ndarray((), HEADER_DTYPE, buffer=buffer)
+    write_seq = np.ndarray(1, '<u8', buffer=buffer, offset=HEADER_DTYPE.fields['write_seq'][1])
+    records = np.ndarray(2 * capacity, RECORD_DTYPE, buffer=buffer, offset=HEADER_DTYPE.itemsize)
+    return header, write_seq, records
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True             # Процесс есть, но чужого пользователя
+    return True
+
+
+def _check_takeover(name):
+    """Бросает FileExistsError, если сегмент name открыт живым писателем"""
+    buffer, detach = _attach_readonly(name)
+    try:
+        if len(buffer) < HEADER_DTYPE.itemsize:
+            return
+        header = np.ndarray((), HEADER_DTYPE, buffer=buffer)
+        pid, closed = int(header['writer_pid']), int(header['closed'])
+        del header
+    finally:
+        detach()
+    if not closed and pid and _pid_alive(pid):
+        raise FileExistsError(f"шина {name} занята писателем pid={pid}")
+
+
+def _attach_readonly(name):
+    """Отображение существующего сегмента только на чтение: (буфер, функция закрытия)"""
+    # SharedMemory(name) до Python 3.13 регистрирует сегмент в трекере ресурсов, и тот удаляет его
+    # при выходе читателя; с 3.13 это выключается track=False
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name, track=False)
+        return shm.buf, shm.close
+    if os.name != 'posix' or _posixshmem is None:
+        shm = shared_memory.SharedMemory(name)     # Без трекера на Windows; на других сборках — как есть
+        return shm.buf, shm.close
+    fd = _posixshmem.shm_open('/' + name, os.O_RDONLY, mode=0o600)
+    try:
+        mapping = mmap.mmap(fd, os.fstat(fd).st_size, prot=mmap.PROT_READ)
+    finally:
+        os.close(fd)
+    return mapping, mapping.close
+
+
+class MarketBusWriter:
+    """Публикация тиков/баров в шину: запись O(1) без системных вызовов.
+
+    Тики сборщика идут в пуле потоков и могут перекрываться, поэтому publish под локальной
+    блокировкой процесса — иначе два потока возьмут один seq. Читателей она не касается.
+    """
+
+    def __init__(self, name, capacity=DEFAULT_CAPACITY):
+        self.name = name
+        self.capacity = capacity
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=_segment_size(capacity))
+        except FileExistsError:
+            # Сегмент остался от упавшего или прежнего писателя: помечаем закрытым, чтобы его
+            # читатели переподключились, и создаём новый. Живого писателя не трогаем
+            _check_takeover(name)
+            stale = shared_memory.SharedMemory(name)
+            if stale.size >= HEADER_DTYPE.itemsize:
+                np.ndarray((), HEADER_DTYPE, buffer=stale.buf)['closed'] = 1
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=_segment_size(capacity))
+
+        self.header, self.write_seq, self.records = _map(self.shm.buf, capacity)
+        self.header['magic'] = BUS_MAGIC
+        self.header['version'] = BUS_VERSION
+        self.header['record_size'] = RECORD_DTYPE.itemsize
+        self.header['capacity'] = capacity
+        self.header['created_ns'] = time.time_ns()
+        self.header['writer_pid'] = os.getpid()
+        self.seq = 0
+        self.write_seq[0] = 0
+        self.lock = threading.Lock()
+
+    def publish(self, timestamp, open_, high, low, close, volume, trades=0):
+        """Записывает бар в следующий слот (и его зеркало), затем объявляет его номером в заголовке"""
+        with self.lock:
+            seq = self.seq + 1
+            slot = seq % self.capacity
+            records = self.records
+            records[slot] = (seq, timestamp, time.time_ns(), open_, high, low, close, volume, trades)
+            records[slot + self.capacity] = records[slot]
+            # Номер обновляется последним: читатель, увидевший seq, видит и запись целиком
+            self.write_seq[0] = seq
+            self.seq = seq
+            return seq
+
+    def close(self, unlink=True):
+        with self.lock:
+            if self.shm is None:
+                return
+            self.header['closed'] = 1
+            del self.header, self.write_seq, self.records
+            self.shm.close()
+            if unlink:
+                # Читатели, которые уже подключены, дочитают свою копию отображения
+                self.shm.unlink()
+            self.shm = None
+
+
+def open_writer(symbol, stream, capacity=DEFAULT_CAPACITY):
+    """Писатель шины для сборщика; None, если шина выключена (MARKET_BUS=0) или недоступна"""
+    if os.environ.get('MARKET_BUS', '1') == '0':
+        return None
+    name = bus_name(symbol, stream)
+    try:
+        writer = MarketBusWriter(name, capacity)
+    except OSError as e:
+        print(f"Шина {name} недоступна, публикация выключена: {e}")
+        return None
+    print(f"Публикация в шину: {name} ({capacity} записей)")
+    return writer
+
+
+class MarketBusReader:
+    """Чтение шины из любого локального процесса: ожидание следующей записи и последние N без копий.
+
+    Читатель не блокирует писателя: если он отстал больше чем на ёмкость буфера, старые записи
+    пропускаются и учитываются в dropped.
+    """
+
+    def __init__(self, name, from_start=False, spin=SPIN_SECONDS, poll=POLL_SECONDS):
+        self.name = name
+        buffer, self._detach = _attach_readonly(name)
+        header = np.ndarray((), HEADER_DTYPE, buffer=buffer)
+        if int(header['magic']) != BUS_MAGIC or int(header['version']) != BUS_VERSION:
+            del header
+            self._detach()
+            raise ValueError(f"{name}: не сегмент шины версии {BUS_VERSION}")
+        self.capacity = int(header['capacity'])
+        self.header, self.write_seq, self.records = _map(buffer, self.capacity)
+        self.spin = spin
+        self.poll = poll
+        self.cursor = 0 if from_start else int(self.write_seq[0])   # Номер последней прочитанной записи
+        self.dropped = 0
+
+    def latest_seq(self):
+        return int(self.write_seq[0])
+
+    def _read(self, seq, head):
+        oldest = head + 2 - self.capacity       # Слот head + 1 писатель может заполнять прямо сейчас
+        if seq < oldest:
+            self.dropped += oldest - seq
+            seq = oldest
+        record = self.records[seq % self.capacity].copy()
+        if seq < int(self.write_seq[0]) + 2 - self.capacity:
+            return None                         # Перезаписана, пока копировали: повторить
+        self.cursor = seq
+        return record
+
+    def wait_next(self, timeout=None):
+        """Следующая запись после прочитанной (numpy.void с полями RECORD_DTYPE); None по таймауту.
+
+        Сначала короткое активное ожидание (задержка — микросекунды), затем опрос с паузой poll.
+        """
+        now = time.monotonic()
+        deadline = None if timeout is None else now + timeout
+        spin_until = now + self.spin
+        while True:
+            head = int(self.write_seq[0])
+            if head > self.cursor:
+                record = self._read(self.cursor + 1, head)
+                if record is not None:
+                    return record
+                continue
+            if self.header['closed']:
+                raise BusClosed(self.name)
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return None
+            if now >= spin_until:
+                time.sleep(self.poll)
+
+    def last_n(self, n, copy=False):
+        """Последние n записей (не больше capacity - 1) от старой к новой.
+
+        По умолчанию — срез разделяемой памяти без копирования: писатель продолжает писать, и если
+        обработка длится дольше, чем заполняется буфер, проверьте результат через valid(view).
+        copy=True возвращает согласованную копию.
+        """
+        while True:
+            head = int(self.write_seq[0])
+            n = max(min(n, head, self.capacity - 1), 0)
+            start = (head - n + 1) % self.capacity
+            view = self.records[start:start + n]
+            if copy:
+                view = view.copy()
+            if self.valid(view):
+                return view
+
+    def valid(self, view):
+        """True, если ни одна запись среза last_n ещё не перезаписана писателем"""
+        if not len(view):
+            return True
+        seqs = view['seq']
+        first = int(seqs[0])
+        return int(seqs[-1]) - first == len(view) - 1 and first >= int(self.write_seq[0]) + 2 - self.capacity
+
+    def closed(self):
+        return bool(self.header['closed'])
+
+    def close(self):
+        if self._detach is None:
+            return
+        del self.header, self.write_seq, self.records
+        try:
+            self._detach()
+        except BufferError:
+            pass        # Срезы last_n ещё используются: отображение освободится вместе с ними
+        self._detach = None
+
+
+if __name__ == "__main__":
+    # python market_bus.py moon_tonusdt_ticker — печатает записи шины и задержку от публикации
+    reader = MarketBusReader(sys.argv[1] if len(sys.argv) > 1 else bus_name('TONUSDT', 'ticker'))
+    try:
+        while True:
+            record = reader.wait_next()
+            latency_us = (time.time_ns() - int(record['publish_ns'])) / 1000
+            print(f"#{record['seq']} {record['timestamp']} close={record['close']} "
+                  f"volume={record['volume']} | {latency_us:.0f} мкс, пропущено {reader.dropped}")
+    except (KeyboardInterrupt, BusClosed):
+        pass
+    finally:
+        reader.close()
@@ -0,0 +1,381 @@
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NAMESPACE = 'moon'
+SUMMARY_INTERVAL = 60.0           # Сводка в лог раз в минуту вместо строки на каждую запись
+PROFILE_SIGNAL = getattr(signal, 'SIGUSR1', None)
+
+# Границы корзин гистограммы, миллисекунды (последняя корзина — всё, что больше)
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+# Для коротких участков (разбор, запись в буфер) — от 10 мкс
+FINE_BUCKETS_MS = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 50, 100]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: O(1) память, пригодна для экспорта"""
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS_MS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms):
+        self.counts[bisect_left(self.buckets, value_ms)] += 1
+        self.total += 1
+        self.sum += value_ms
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, q):
+        """Верхняя граница корзины, в которую попадает квантиль q"""
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self):
+        labels = [f"<={bound}" for bound in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            'buckets_ms': dict(zip(labels, self.counts)),
+            'count': self.total,
+            'mean_ms': self.sum / self.total if self.total else 0.0,
+            'max_ms': self.max,
+            'p50_ms': self.percentile(0.5),
+            'p99_ms': self.percentile(0.99),
+        }
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """Монотонный счётчик с метками: inc(amount, endpoint='kline')"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = collections.defaultdict(float)
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] += amount
+
+    def total(self):
+        with self.lock:
+            return sum(self.values.values())
+
+    def render(self):
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}{_format_labels(key)} {value:g}" for key, value in items]
+
+
+class Gauge(Counter):
+    """Текущее значение с метками (очередь, пропуски в данных, темп лимитера)"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с метками поверх Histogram (корзины в мс, экспорт в секундах)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=HISTOGRAM_BUCKETS_MS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        self.labels(**labels).observe(seconds)
+
+    def labels(self, **labels):
+        """Гистограмма с зафиксированными метками: на горячем пути без разбора меток на каждый вызов"""
+        key = _label_key(labels)
+        with self.lock:
+            child = self.histograms.get(key)
+            if child is None:
+                child = self.histograms[key] = _BoundHistogram(self.buckets)
+            return child
+
+    def time(self, **labels):
+        """with histogram.time(stage='parse'): ... — замер блока"""
+        return _Timer(self.labels(**labels))
+
+    def merged(self):
+        """Все метки одной гистограммой — для сводки"""
+        merged = Histogram(self.buckets)
+        with self.lock:
+            for histogram in self.histograms.values():
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.total += histogram.total
+                merged.sum += histogram.sum
+                merged.max = max(merged.max, histogram.max)
+        return merged
+
+    def render(self):
+        lines = []
+        with self.lock:
+            items = [(key, list(h.counts), h.total, h.sum) for key, h in self.histograms.items()]
+        for key, counts, total, total_ms in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', f'{bound / 1000:g}')])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {total}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total_ms / 1000:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {total}")
+        return lines
+
+
+class _BoundHistogram(Histogram):
+    """Гистограмма одного набора меток: observe() в секундах, потокобезопасно"""
+
+    def __init__(self, buckets):
+        super().__init__(buckets)
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        value = seconds * 1000
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Registry:
+    """Набор метрик процесса: регистрация по имени (повторная возвращает ту же), вывод в формате Prometheus"""
+
+    def __init__(self, namespace=NAMESPACE):
+        self.namespace = namespace
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def _get(self, cls, name, help_text, *args):
+        full_name = f"{self.namespace}_{name}" if self.namespace else name
+        with self.lock:
+            metric = self.metrics.get(full_name)
+            if metric is None:
+                metric = self.metrics[full_name] = cls(full_name, help_text, *args)
+            return metric
+
+    def counter(self, name, help_text=''):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=''):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text='', buckets=HISTOGRAM_BUCKETS_MS):
+        return self._get(LatencyHistogram, name, help_text, buckets)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Одна строка: счётчики и p50/p99 гистограмм, только то, что уже наблюдалось"""
+        parts = []
+        prefix = f"{self.namespace}_" if self.namespace else ''
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            short = metric.name[len(prefix):]
+            if isinstance(metric, LatencyHistogram):
+                merged = metric.merged()
+                if merged.total:
+                    parts.append(f"{short} n={merged.total} p50/p99={merged.percentile(0.5)}/"
+                                 f"{merged.percentile(0.99)} мс")
+            elif metric.values:
+                parts.append(f"{short}={metric.total():g}")
+        return ', '.join(parts)
+
+
+REGISTRY = Registry()
+
+# Метрики сборщиков и загрузчика: общие имена, источник различается метками
+HTTP_REQUESTS = REGISTRY.counter('http_requests_total', 'HTTP-запросы к API по endpoint и статусу')
+HTTP_LATENCY = REGISTRY.histogram('http_request_seconds', 'Время HTTP-запроса к API')
+HTTP_RETRIES = REGISTRY.counter('http_retries_total', 'Повторы запросов по причине')
+PARSE_TIME = REGISTRY.histogram('parse_seconds', 'Разбор ответа API', FINE_BUCKETS_MS)
+WRITE_TIME = REGISTRY.histogram('write_seconds', 'Запись строки в буфер', FINE_BUCKETS_MS)
+FLUSH_TIME = REGISTRY.histogram('flush_seconds', 'Сброс буфера на диск', FINE_BUCKETS_MS)
+ROWS_PERSISTED = REGISTRY.counter('rows_persisted_total', 'Строк записано на диск')
+GAPS_DETECTED = REGISTRY.counter('gaps_detected_total', 'Обнаруженные пропуски данных по источнику')
+MISSING_CANDLES = REGISTRY.gauge('missing_candles', 'Пропущенных свечей в загруженном диапазоне')
+SCHEDULER_LAG = REGISTRY.histogram('scheduler_lag_seconds', 'Опоздание тика относительно границы периода')
+TICKS_MISSED = REGISTRY.counter('ticks_missed_total', 'Пропущенные тики планировщика')
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='127.0.0.1', registry=REGISTRY):
+    """Локальный endpoint /metrics в фоновом потоке; возвращает сервер (server.shutdown() для остановки)"""
+    httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+    httpd.daemon_threads = True
+    httpd.registry = registry
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def start_from_env(registry=REGISTRY):
+    """METRICS_PORT=9108 — поднять /metrics; MOON_PROFILE=1 — профилировщик по SIGUSR1"""
+    port = os.environ.get('METRICS_PORT')
+    if port:
+        start_http_server(int(port), registry=registry)
+        print(f"Метрики: http://127.0.0.1:{port}/metrics")
+    if os.environ.get('MOON_PROFILE'):
+        install_profiler()
+        print(f"Профилировщик: kill -USR1 {os.getpid()} -> profile_*.txt")
+
+
+class PeriodicSummary:
+    """Сводка раз в interval секунд: maybe_log() дёшево вызывать на каждом тике/запросе"""
+
+    def __init__(self, interval=SUMMARY_INTERVAL, registry=REGISTRY):
+        self.interval = interval
+        self.registry = registry
+        self.next_log = time.monotonic()       # Первая запись печатается сразу: видно, что сбор идёт
+        self.lock = threading.Lock()
+
+    def maybe_log(self, extra=None):
+        now = time.monotonic()
+        if now < self.next_log:
+            return False
+        with self.lock:
+            if now < self.next_log:
+                return False
+            self.next_log = now + self.interval
+        line = extra() if callable(extra) else extra
+        stamp = time.strftime('%H:%M:%S')
+        print(f"[{stamp}] {line + ' | ' if line else ''}{self.registry.summary()}")
+        return True
+
+
+class SamplingProfiler:
+    """Сэмплирующий профилировщик: раз в interval снимает стеки всех потоков (sys._current_frames)
+    и пишет их в свёрнутом формате flamegraph ('f1;f2;f3 N') с топом функций в начале файла."""
+
+    def __init__(self, interval=0.005, duration=10.0, directory='.'):
+        self.interval = interval
+        self.duration = duration
+        self.directory = directory
+        self.thread = None
+
+    def start(self):
+        """Запуск сэмплирования в фоне; повторный запуск во время работы игнорируется"""
+        if self.thread is not None and self.thread.is_alive():
+            return False
+        self.thread = threading.Thread(target=self._run, daemon=True, name='sampling-profiler')
+        self.thread.start()
+        return True
+
+    def _run(self):
+        stacks = collections.Counter()
+        own = threading.get_ident()
+        samples = 0
+        stop_at = time.monotonic() + self.duration
+        while time.monotonic() < stop_at:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stacks[';'.join(reversed(stack))] += 1
+            samples += 1
+            time.sleep(self.interval)
+        self.dump(stacks, samples)
+
+    def dump(self, stacks, samples):
+        path = os.path.join(self.directory, f"profile_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+        leaves = collections.Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(stacks.values()) or 1
+        with open(path, 'w') as f:
+            f.write(f"# сэмплов: {samples}, интервал: {self.interval * 1000:g} мс\n")
+            for function, count in leaves.most_common(20):
+                f.write(f"# {count / total:6.1%}  {function}\n")
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Профиль: {path}")
+        return path
+
+
+def install_profiler(signum=PROFILE_SIGNAL, **kwargs):
+    """Включает профилировщик по сигналу (по умолчанию SIGUSR1); обработчик только запускает поток"""
+    profiler = SamplingProfiler(**kwargs)
+    if signum is not None:
+        signal.signal(signum, lambda sig, frame: profiler.start())
+    return profiler
@@ -0,0 +1,376 @@
+import asyncio
+import json
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+from bisect import bisect_left
+
+import numpy as np
+import websockets
+
+from metrics import GAPS_DETECTED
+
+BYBIT_WS_SPOT = 'wss://stream.bybit.com/v5/public/spot'
+PING_INTERVAL = 20
+# Снимок ByBit присылает только на подписку: после разрыва переподписываемся, а если снимок так и
+# не пришёл за это время — переподключаемся
+RESYNC_TIMEOUT = 10.0
+PRICE_SCALE = 10 ** 8            # Цены уровней храним целыми тиками: точное сравнение без float-ключей
+
+# Файл глубины: последовательность блоков, в каждом колонки подряд (колоночный формат).
+# Целые колонки (время, номер обновления, цены в тиках) хранятся разностями между строками:
+# стакан от снимка к снимку меняется мало, и после zlib от них остаются единицы байт на строку.
+CHUNK_MAGIC = b'OBK2'
+CHUNK_HEADER = struct.Struct('<4sII')      # magic, строк в блоке, уровней на сторону
+COLUMN_HEADER = struct.Struct('<I')        # длина сжатой колонки
+DEPTH_COLUMNS = [('timestamp', '<i8', False), ('update_id', '<i8', False),
+                 ('bid_price', '<i8', True), ('bid_size', '<f8', True),
+                 ('ask_price', '<i8', True), ('ask_size', '<f8', True)]
+
+class SequenceGap(Exception):
+    """Пропущено обновление стакана: книга невалидна до следующего snapshot (новой подписки)"""
+
+
+def _parse_levels(levels):
+    """[['2.1305', '120.5'], ...] -> [(тик int, размер float), ...]"""
+    return [(round(float(price) * PRICE_SCALE), float(size)) for price, size in levels or ()]
+
+
+class BookSide:
+    """Одна сторона стакана: два параллельных отсортированных массива — ключи уровней и размеры.
+
+    Ключ — целый тик цены (для bid со знаком минус), поэтому лучший уровень всегда первый, поиск
+    уровня — bisect, а top-N — срез без сортировки. Дельта меняет единицы уровней, и вставка в
+    массив из сотни элементов дешевле любых накладных расходов на numpy-вызов.
+    """
+
+    def __init__(self, descending):
+        self.sign = -1 if descending else 1
+        self.keys = []
+        self.sizes = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def reset(self, levels):
+        levels = sorted((tick * self.sign, size) for tick, size in levels if size > 0)
+        self.keys = [key for key, _ in levels]
+        self.sizes = [size for _, size in levels]
+
+    def apply(self, levels):
+        """Применяет уровни дельты: размер 0 удаляет уровень, иначе вставка или замена"""
+        keys = self.keys
+        sizes = self.sizes
+        for tick, size in levels:
+            key = tick * self.sign
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                if size > 0:
+                    sizes[i] = size
+                else:
+                    del keys[i]
+                    del sizes[i]
+            elif size > 0:
+                keys.insert(i, key)
+                sizes.insert(i, size)
+
+    def top(self, levels):
+        """Лучшие levels уровней: (тики цен, размеры) списками, без сортировки"""
+        return [key * self.sign for key in self.keys[:levels]], self.sizes[:levels]
+
+    def top_prices(self, levels):
+        """Лучшие levels уровней ценами float: (цены, размеры)"""
+        ticks, sizes = self.top(levels)
+        return [tick / PRICE_SCALE for tick in ticks], sizes
+
+
+class L2Book:
+    """Стакан L2 по snapshot + delta ByBit v5 с проверкой номеров обновлений"""
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+        self.update_id = None
+        self.seq = None
+        self.ts = None
+        self.valid = False
+        self.updates = 0
+        self.gaps = 0
+
+    def apply(self, message):
+        """Применяет сообщение orderbook.*; при разрыве последовательности бросает SequenceGap"""
+        data = message['data']
+        update_id = int(data['u'])
+        if message['type'] == 'snapshot' or update_id == 1:
+            # u=1 — биржа перезапустила поток: это тоже полный снимок
+            self.bids.reset(_parse_levels(data.get('b')))
+            self.asks.reset(_parse_levels(data.get('a')))
+            self.valid = True
+        else:
+            if not self.valid:
+                return False
+            if update_id != self.update_id + 1:
+                self.valid = False
+                self.gaps += 1
+                raise SequenceGap(f"{self.symbol}: ожидали u={self.update_id + 1}, пришло {update_id}")
+            self.bids.apply(_parse_levels(data.get('b')))
+            self.asks.apply(_parse_levels(data.get('a')))
+        self.update_id = update_id
+        self.seq = data.get('seq', self.seq)
+        self.ts = int(message.get('cts') or message['ts'])
+        self.updates += 1
+        return True
+
+    def best(self):
+        """(лучший bid, лучший ask) или None для пустой стороны"""
+        bid = -self.bids.keys[0] / PRICE_SCALE if len(self.bids) else None
+        ask = self.asks.keys[0] / PRICE_SCALE if len(self.asks) else None
+        return bid, ask
+
+    def crossed(self):
+        return bool(self.bids.keys and self.asks.keys and -self.bids.keys[0] >= self.asks.keys[0])
+
+
+class DepthWriter:
+    """Снимки top-N в бинарный колоночный файл: блоки по flush_rows строк или раз в flush_interval
+    секунд (что раньше), колонки подряд"""
+
+    def __init__(self, path, levels=20, flush_rows=600, flush_interval=5.0):
+        self.path = path
+        self.levels = levels
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rows = 0
+        self.rows_written = 0
+        self.last_flush = time.monotonic()
+        self.columns = {name: np.zeros((flush_rows, levels) if per_level else flush_rows, dtype=dtype)
+                        for name, dtype, per_level in DEPTH_COLUMNS}
+        self.file = open(path, 'ab')
+
+    def write(self, book):
+        row = self.rows
+        columns = self.columns
+        columns['timestamp'][row] = book.ts
+        columns['update_id'][row] = book.update_id
+        for side, prefix in ((book.bids, 'bid'), (book.asks, 'ask')):
+            ticks, sizes = side.top(self.levels)
+            n = len(ticks)
+            # Отсутствующий уровень: тик 0, размер 0 (при чтении -> NaN)
+            columns[f'{prefix}_price'][row, :n] = ticks
+            columns[f'{prefix}_price'][row, n:] = 0
+            columns[f'{prefix}_size'][row, :n] = sizes
+            columns[f'{prefix}_size'][row, n:] = 0.0
+        self.rows += 1
+        if self.rows >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush_due(self):
+        """Сброс по времени без новых строк: снимки тихого рынка не лежат в памяти до 600-й строки"""
+        if self.rows and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows or self.file is None:
+            return
+        parts = [CHUNK_HEADER.pack(CHUNK_MAGIC, self.rows, self.levels)]
+        for name, dtype, _ in DEPTH_COLUMNS:
+            column = self.columns[name][:self.rows]
+            if dtype == '<i8':
+                column = np.diff(column, axis=0, prepend=np.zeros_like(column[:1]))
+            payload = zlib.compress(column.tobytes(), 6)
+            parts.append(COLUMN_HEADER.pack(len(payload)))
+            parts.append(payload)
+        self.file.write(b''.join(parts))
+        self.file.flush()
+        self.rows_written += self.rows
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_depth(path):
+    """Читает файл DepthWriter в словарь колонок: цены float (NaN — уровня нет), размеры, время.
+
+    Файл отображается в память, блоки распаковываются и склеиваются.
+    """
+    data = np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.empty(0, np.uint8)
+    chunks = {name: [] for name, _, _ in DEPTH_COLUMNS}
+    offset = 0
+    while offset + CHUNK_HEADER.size <= len(data):
+        magic, rows, levels = CHUNK_HEADER.unpack_from(data, offset)
+        if magic != CHUNK_MAGIC:
+            raise ValueError(f"{path}: повреждённый блок на смещении {offset}")
+        offset += CHUNK_HEADER.size
+        for name, dtype, per_level in DEPTH_COLUMNS:
+            (length,) = COLUMN_HEADER.unpack_from(data, offset)
+            offset += COLUMN_HEADER.size
+            column = np.frombuffer(zlib.decompress(data[offset:offset + length]), dtype=dtype)
+            offset += length
+            if per_level:
+                column = column.reshape(rows, levels)
+            if dtype == '<i8':
+                column = np.cumsum(column, axis=0)
+            chunks[name].append(column)
+
+    result = {name: np.concatenate(parts) if parts else np.empty(0) for name, parts in chunks.items()}
+    for prefix in ('bid', 'ask'):
+        ticks = result[f'{prefix}_price']
+        missing = ticks == 0
+        result[f'{prefix}_price'] = np.where(missing, np.nan, ticks / PRICE_SCALE)
+        result[f'{prefix}_size'] = np.where(missing, np.nan, result[f'{prefix}_size'])
+    return result
+
+
+class OrderBookCollector:
+    """Сборщик стакана по WebSocket: книга в памяти, раз в snapshot_interval мс — снимок top-N на диск"""
+
+    def __init__(self, symbol='TONUSDT', depth=50, url=BYBIT_WS_SPOT, levels=20, snapshot_interval=1000,
+                 file_prefix=None, flush_rows=600, flush_interval=5.0, max_backoff=30.0):
+        self.symbol = symbol
+        self.url = url
+        self.topic = f"orderbook.{depth}.{symbol}"
+        self.book = L2Book(symbol)
+        self.snapshot_interval = snapshot_interval
+        prefix = file_prefix or f"{symbol.lower()}_ws"
+        self.writer = DepthWriter(f"{prefix}_depth{levels}.bin", levels, flush_rows, flush_interval)
+        self.next_snapshot = None
+        self.max_backoff = max_backoff
+        self.messages = 0
+        self.reconnects = 0
+        self.resyncs = 0
+        self.resync_needed = False
+        self.resync_started = None      # Время переподписки, снимок после которой ещё не пришёл
+        self.running = True
+
+    def handle_message(self, raw):
+        message = json.loads(raw)
+        if message.get('topic') != self.topic:
+            return False
+        self.messages += 1
+        try:
+            if not self.book.apply(message):
+                return False
+        except SequenceGap as e:
+            print(f"Разрыв последовательности стакана: {e}, переподписка за snapshot")
+            GAPS_DETECTED.inc(source='orderbook', reason='sequence')
+            self.resyncs += 1
+            self.resync_needed = True
+            return False
+
+        # Снимки по сетке биржевого времени, а не на каждую дельту
+        if self.next_snapshot is None:
+            self.next_snapshot = self.book.ts - self.book.ts % self.snapshot_interval
+        if self.book.ts >= self.next_snapshot:
+            self.writer.write(self.book)
+            self.next_snapshot = self.book.ts - self.book.ts % self.snapshot_interval + self.snapshot_interval
+        return True
+
+    async def _keepalive(self, ws):
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            await ws.send(json.dumps({'op': 'ping'}))
+
+    async def resync(self, ws):
+        """Восстановление книги после разрыва; False, если snapshot не пришёл за RESYNC_TIMEOUT.
+
+        Новый snapshot ByBit присылает только на подписку, поэтому отписываемся и подписываемся заново.
+        """
+        if self.book.valid:
+            self.resync_needed = False
+            self.resync_started = None
+            return True
+        if self.resync_started is None:
+            self.resync_started = time.monotonic()
+            await ws.send(json.dumps({'op': 'unsubscribe', 'args': [self.topic]}))
+            await ws.send(json.dumps({'op': 'subscribe', 'args': [self.topic]}))
+            return True
+        return time.monotonic() - self.resync_started < RESYNC_TIMEOUT
+
+    async def _flush_timer(self):
+        # Сброс глубины по времени не зависит от сообщений: в тихом рынке снимки не ждут 600-й строки
+        while True:
+            await asyncio.sleep(min(self.writer.flush_interval, 1.0))
+            self.writer.flush_due()
+
+    async def _recv(self, ws):
+        """Следующее сообщение; при переподписке ждём не дольше остатка RESYNC_TIMEOUT (None — не дождались).
+
+        Замолчавший сокет иначе держал бы сессию без snapshot бесконечно. Вне переподписки — обычный
+        recv(): wait_for на каждое сообщение заметно дороже в горячем цикле.
+        """
+        if self.resync_started is None:
+            return await ws.recv()
+        remaining = RESYNC_TIMEOUT - (time.monotonic() - self.resync_started)
+        try:
+            return await asyncio.wait_for(ws.recv(), max(remaining, 0.0))
+        except asyncio.TimeoutError:
+            return None
+
+    async def _session(self):
+        async with websockets.connect(self.url, ping_interval=None, max_size=None) as ws:
+            await ws.send(json.dumps({'op': 'subscribe', 'args': [self.topic]}))
+            print(f"Подключено к {self.url}, подписка: {self.topic}")
+            keepalive = asyncio.create_task(self._keepalive(ws))
+            flush_timer = asyncio.create_task(self._flush_timer())
+            try:
+                while self.running:
+                    raw = await self._recv(ws)
+                    if raw is not None:
+                        self.handle_message(raw)
+                    if not self.running:
+                        break
+                    if self.resync_needed and not await self.resync(ws):
+                        print(f"Нет snapshot {RESYNC_TIMEOUT:.0f} с после переподписки, переподключение")
+                        break
+            finally:
+                keepalive.cancel()
+                flush_timer.cancel()
+
+    async def run(self, max_reconnects=None):
+        """Цикл с переподключением; после разрыва книга невалидна до нового snapshot по подписке"""
+        backoff = 1.0
+        try:
+            while self.running:
+                try:
+                    await self._session()
+                except (OSError, websockets.WebSocketException) as e:
+                    print(f"Соединение потеряно: {e}")
+                if not self.running:
+                    break
+                # Новая подписка сама пришлёт snapshot
+                self.book.valid = False
+                self.resync_needed = False
+                self.resync_started = None
+                self.reconnects += 1
+                if max_reconnects is not None and self.reconnects > max_reconnects:
+                    break
+                await asyncio.sleep(backoff * (0.5 + random.random()))
+                backoff = min(backoff * 2, self.max_backoff)
+        finally:
+            self.close()
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        self.writer.close()
+        print(f"Сообщений стакана: {self.messages}, снимков: {self.writer.rows_written}, "
+              f"пересинхронизаций: {self.resyncs}, переподключений: {self.reconnects}")
+
+
+if __name__ == "__main__":
+    # python orderbook.py [url] — url локального стенда stub_bybit.py вместо биржи
+    collector = OrderBookCollector(url=sys.argv[1] if len(sys.argv) > 1 else BYBIT_WS_SPOT)
+    try:
+        asyncio.run(collector.run())
+    except KeyboardInterrupt:
+        print("\nОстановлено пользователем")
@@ -0,0 +1,215 @@
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from metrics import HTTP_LATENCY, HTTP_REQUESTS
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket: общий лимит запросов для нескольких потоков"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)                      # Токенов в секунду
+        self.capacity = float(capacity or rate)      # Максимальный "запас" для всплеска
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, tokens=1):
+        """Блокирует поток, пока в ведре не появится нужное количество токенов"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate):
+        """Меняет скорость пополнения; уже накопленные токены сохраняются"""
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+
+    def limit_tokens(self, tokens):
+        """Не даёт запасу превышать остаток квоты, о котором сообщила биржа"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, float(tokens))
+
+
+# Заголовки квоты ByBit v5 (на эндпоинт/IP): лимит окна, остаток и время сброса окна в мс
+LIMIT_HEADER = 'X-Bapi-Limit'
+REMAINING_HEADER = 'X-Bapi-Limit-Status'
+RESET_HEADER = 'X-Bapi-Limit-Reset-Timestamp'
+RATE_LIMIT_CODES = (10006, 10018)         # Too many visits / IP rate limit в теле ответа
+RATE_LIMIT_STATUSES = (403, 429)          # HTTP-статусы превышения лимита по IP
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Экспоненциальная задержка с полным джиттером: случайно в [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_rate_limited(status_code, content=b''):
+    """Ответ означает превышение лимита: HTTP 403/429 или retCode 10006/10018 в теле"""
+    if status_code in RATE_LIMIT_STATUSES:
+        return True
+    # retCode — первое поле ответа ByBit: смотрим начало тела без разбора JSON
+    head = content[:64].replace(b' ', b'')
+    return any(b'"retCode":%d' % code in head for code in RATE_LIMIT_CODES)
+
+
+class AdaptiveRateLimiter:
+    """Общий контроллер темпа запросов: token bucket, подстраиваемый по заголовкам квоты биржи.
+
+    По заголовкам темп ставится так, чтобы остаток квоты окна расходовался ровно к моменту сброса
+    (но не выше max_rate); при нулевом остатке все потоки ждут сброса. Без заголовков темп
+    аддитивно растёт до max_rate. На 429/10006 темп уменьшается вдвое и все потоки уходят в паузу
+    с экспоненциальной задержкой и джиттером.
+    """
+
+    def __init__(self, rate=50, max_rate=None, min_rate=1.0, base_backoff=1.0, max_backoff=60.0):
+        self.max_rate = float(max_rate or rate)
+        self.min_rate = float(min_rate)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(rate)
+        self.lock = threading.Lock()
+        self.paused_until = 0.0           # time.monotonic(), до которого никто не шлёт запросы
+        self.failures = 0                 # Подряд идущие ответы о превышении лимита
+
+        self.started = time.monotonic()
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0                 # Суммарное ожидание в acquire по всем потокам, секунды
+        self.window = deque()             # monotonic-время последних запросов для текущей скорости
+        self.last_quota = None            # (лимит, остаток) из последнего ответа с заголовками
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self):
+        """Блокирует поток до разрешения на запрос"""
+        started = time.monotonic()
+        while True:
+            with self.lock:
+                pause = self.paused_until - time.monotonic()
+            if pause <= 0:
+                break
+            time.sleep(pause)
+        self.bucket.acquire()
+        now = time.monotonic()
+        with self.lock:
+            self.requests += 1
+            self.waited += now - started
+            self.window.append(now)
+            while self.window and now - self.window[0] > 10.0:
+                self.window.popleft()
+
+    def observe(self, status_code, headers=None, content=b''):
+        """Учитывает ответ: заголовки квоты и признаки превышения лимита. True — лимит превышен"""
+        if is_rate_limited(status_code, content):
+            self.on_rate_limited(headers)
+            return True
+        with self.lock:
+            self.failures = 0
+        if headers:
+            self.update_from_headers(headers)
+        return False
+
+    def update_from_headers(self, headers):
+        try:
+            remaining = int(headers[REMAINING_HEADER])
+        except (KeyError, TypeError, ValueError):
+            # Без заголовков квоты — аддитивно возвращаемся к максимальной скорости
+            if self.rate < self.max_rate:
+                self.bucket.set_rate(min(self.max_rate, self.rate + 1.0))
+            return
+        limit = int(headers.get(LIMIT_HEADER) or 0) or None
+        reset_ms = int(headers.get(RESET_HEADER) or 0)
+        seconds_to_reset = max(0.0, reset_ms / 1000 - time.time()) if reset_ms else None
+
+        with self.lock:
+            self.last_quota = (limit, remaining)
+        self.bucket.limit_tokens(remaining)
+        if seconds_to_reset is None:
+            return
+        if remaining <= 0:
+            self._pause(seconds_to_reset + random.uniform(0, 0.05))
+            return
+        # Темп, при котором остаток окна уйдёт ровно к сбросу
+        pace = remaining / seconds_to_reset if seconds_to_reset > 0 else self.max_rate
+        self.bucket.set_rate(max(self.min_rate, min(self.max_rate, pace)))
+
+    def on_rate_limited(self, headers=None):
+        """Превышение лимита: темп вдвое ниже и общая пауза — до сброса окна, если биржа его сообщила,
+        иначе экспоненциальная задержка с джиттером"""
+        with self.lock:
+            self.throttled += 1
+            # Отказы по запросам, ушедшим до начала паузы, — тот же эпизод, задержку не удваиваем
+            if self.paused_until <= time.monotonic():
+                self.failures += 1
+            attempt = self.failures - 1
+        reset_ms = int((headers or {}).get(RESET_HEADER) or 0)
+        if reset_ms:
+            delay = max(0.0, reset_ms / 1000 - time.time()) + random.uniform(0, 0.05)
+        else:
+            delay = backoff_delay(attempt, self.base_backoff, self.max_backoff)
+        self.bucket.set_rate(max(self.min_rate, self.rate / 2))
+        self._pause(delay)
+        return delay
+
+    def _pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def current_rps(self):
+        """Скорость запросов за последние 10 секунд"""
+        with self.lock:
+            if len(self.window) < 2:
+                return 0.0
+            span = time.monotonic() - self.window[0]
+            return len(self.window) / span if span > 0 else 0.0
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started
+        limit, remaining = self.last_quota or (None, None)
+        return {
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'effective_rps': self.requests / elapsed if elapsed > 0 else 0.0,
+            'current_rps': self.current_rps(),
+            'rate': self.rate,
+            'max_rate': self.max_rate,
+            'utilization': (self.requests / elapsed) / self.max_rate if elapsed > 0 else 0.0,
+            'wait_seconds': self.waited,
+            'quota_limit': limit,
+            'quota_remaining': remaining,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"запросов {stats['requests']}, {stats['effective_rps']:.1f} запр/с "
+                f"({stats['utilization']:.0%} от лимита {stats['max_rate']:.0f}), "
+                f"текущий темп {stats['rate']:.1f}, превышений лимита {stats['throttled']}")
+
+    def get(self, session, url, **kwargs):
+        """session.get под контролем лимитера: ожидание, запрос, учёт заголовков ответа"""
+        self.acquire()
+        endpoint = urlparse(url).path
+        started = time.perf_counter()
+        response = session.get(url, **kwargs)
+        HTTP_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+        self.observe(response.status_code, response.headers, response.content)
+        return response
@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import SCHEDULER_LAG, TICKS_MISSED, Histogram
+
+
+class TickMetrics:
+    """Метрики планировщика: отклонение от границы секунды, время запроса, пропущенные тики"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jitter = Histogram()
+        self.latency = Histogram()
+        self.ticks = 0
+        self.missed = 0
+        self.errors = 0
+
+    def record_tick(self, jitter_s):
+        with self.lock:
+            self.ticks += 1
+            self.jitter.observe(jitter_s * 1000)
+        SCHEDULER_LAG.observe(jitter_s)
+
+    def record_missed(self, count=1):
+        with self.lock:
+            self.missed += count
+        TICKS_MISSED.inc(count)
+
+    def record_latency(self, latency_s, failed=False):
+        with self.lock:
+            self.latency.observe(latency_s * 1000)
+            if failed:
+                self.errors += 1
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'ticks': self.ticks,
+                'missed_ticks': self.missed,
+                'errors': self.errors,
+                'jitter': self.jitter.to_dict(),
+                'request_latency': self.latency.to_dict(),
+            }
+
+    def export(self, path):
+        """Сохраняет метрики с гистограммами в JSON"""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def summary(self):
+        data = self.to_dict()
+        return (f"тиков: {data['ticks']}, пропущено: {data['missed_ticks']}, ошибок: {data['errors']} | "
+                f"jitter p50/p99: {data['jitter']['p50_ms']}/{data['jitter']['p99_ms']} мс | "
+                f"запрос p50/p99: {data['request_latency']['p50_ms']}/{data['request_latency']['p99_ms']} мс")
+
+
+class TickScheduler:
+    """Тики ровно на границах секунд настенного времени; ожидание — по монотонным часам.
+
+    Задача выполняется в пуле потоков, поэтому медленный ответ не сдвигает следующий тик:
+    новый запрос стартует по расписанию, пока предыдущий ещё в полёте.
+    """
+
+    def __init__(self, task, period=1.0, max_in_flight=2, metrics=None):
+        self.task = task                      # task(tick_ms) — время тика в мс (граница секунды)
+        self.period = period
+        self.max_in_flight = max_in_flight
+        self.metrics = metrics or TickMetrics()
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.running = False
+
+    def _run_task(self, tick_ms):
+        started = time.monotonic()
+        failed = False
+        try:
+            self.task(tick_ms)
+        except Exception as e:
+            failed = True
+            print(f"Ошибка в задаче тика: {e}")
+        finally:
+            self.metrics.record_latency(time.monotonic() - started, failed)
+            with self.lock:
+                self.in_flight -= 1
+
+    def run(self, duration=None, max_ticks=None):
+        """Блокирующий цикл; Ctrl+C пробрасывается наружу после остановки пула"""
+        self.running = True
+        # Ближайшая граница периода по настенным часам
+        next_wall = (int(time.time() / self.period) + 1) * self.period
+        stop_at = time.monotonic() + duration if duration is not None else None
+        fired = 0
+
+        try:
+            while self.running:
+                # Пересчитываем цель в монотонное время на каждом тике: коррекции NTP не копятся
+                deadline = time.monotonic() + (next_wall - time.time())
+                if stop_at is not None and deadline > stop_at:
+                    break
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+                lateness = time.monotonic() - deadline
+                if lateness >= self.period:
+                    # Проспали целые периоды — фиксируем пропуск и переходим к ближайшей границе
+                    skipped = int(lateness // self.period)
+                    self.metrics.record_missed(skipped)
+                    next_wall += skipped * self.period
+                    lateness -= skipped * self.period
+
+                with self.lock:
+                    busy = self.in_flight >= self.max_in_flight
+                    if not busy:
+                        self.in_flight += 1
+                if busy:
+                    self.metrics.record_missed()
+                else:
+                    self.metrics.record_tick(lateness)
+                    self.executor.submit(self._run_task, int(round(next_wall * 1000)))
+
+                next_wall += self.period
+                fired += 1
+                if max_ticks is not None and fired >= max_ticks:
+                    break
+        finally:
+            self.running = False
+            self.executor.shutdown(wait=True)
+
+    def stop(self):
+        self.running = False
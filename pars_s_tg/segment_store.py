@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+KLINE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+# Сегмент на диске — .npy со структурированным массивом: читается через mmap без разбора текста
+KLINE_DTYPE = np.dtype([('timestamp', '<i8'), ('open', '<f8'), ('high', '<f8'),
+                        ('low', '<f8'), ('close', '<f8'), ('volume', '<f8')])
+
+
+class SegmentStore:
+    """Append-only хранилище свечей: каждый чекпоинт пишет только новые свечи в отдельный сегмент"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_file = os.path.join(directory, 'manifest.json')
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file) as f:
+                return json.load(f)
+        return {'segments': []}
+
+    def _write_manifest(self):
+        # Атомарная запись: при падении остаётся либо старый, либо новый манифест
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_file, self.manifest_file)
+
+    @property
+    def segments(self):
+        return self.manifest['segments']
+
+    @property
+    def total_rows(self):
+        return sum(segment['rows'] for segment in self.segments)
+
+    def append(self, klines):
+        """Записывает новые свечи (list[dict] или DataFrame) неизменяемым сегментом"""
+        if len(klines) == 0:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        df = pd.DataFrame(klines, columns=KLINE_COLUMNS)
+        records = np.empty(len(df), dtype=KLINE_DTYPE)
+        for column in KLINE_COLUMNS:
+            records[column] = df[column].to_numpy()
+
+        segment_name = f"segment_{len(self.segments):06d}.npy"
+        segment_path = os.path.join(self.directory, segment_name)
+        tmp_path = segment_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, records)
+        os.replace(tmp_path, segment_path)
+
+        segment = {
+            'file': segment_name,
+            'start': int(records['timestamp'].min()),
+            'end': int(records['timestamp'].max()),
+            'rows': len(records),
+        }
+        self.segments.append(segment)
+        try:
+            self._write_manifest()
+        except OSError:
+            self.segments.pop()      # Сегмент не попал в манифест: те же свечи запишет следующая попытка
+            raise
+        return segment
+
+    def time_range(self):
+        """Диапазон timestamp (мс) по данным манифеста, без чтения сегментов"""
+        if not self.segments:
+            return None, None
+        return (min(segment['start'] for segment in self.segments),
+                max(segment['end'] for segment in self.segments))
+
+    def iter_arrays(self):
+        """Сегменты по одному как структурированные массивы; .npy отображаются в память (mmap)"""
+        for segment in self.segments:
+            yield np.load(os.path.join(self.directory, segment['file']), mmap_mode='r')
+
+    def load(self):
+        """Читает все сегменты в один DataFrame (timestamp в мс, без сортировки)"""
+        arrays = list(self.iter_arrays())
+        if not arrays:
+            return pd.DataFrame(columns=KLINE_COLUMNS)
+        records = np.concatenate(arrays)
+        return pd.DataFrame({column: records[column] for column in KLINE_COLUMNS})
+
+    def compact(self, final_filename):
+        """Сливает сегменты в итоговый файл: сортировка по времени и удаление дублей"""
+        df = self.load()
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        df.set_index('timestamp', inplace=True)
+        df.sort_index(inplace=True)
+        df = df[~df.index.duplicated(keep='first')]
+        df.to_csv(final_filename)
+        return df
+
+    def clear(self):
+        """Удаляет каталог с сегментами и манифестом"""
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        self.manifest = {'segments': []}
@@ -0,0 +1,185 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Корень колоночного датасета: data/dataset/symbol=TONUSDT/interval=1/day=2025-10-22/part-0.parquet
+DATASET_ROOT = 'data/dataset'
+DAY_MS = 24 * 60 * 60 * 1000
+PART_FILE = 'part-0.parquet'
+# Дописывание (append=True) кладёт новые строки рядом с part-0 маленькими файлами delta-N; при чтении
+# более поздний файл перекрывает строки с тем же timestamp. Когда их набирается MAX_DELTAS, партиция
+# сливается обратно в один part-0 — так минутные записи сборщика не переписывают весь день каждый раз
+DELTA_PREFIX = 'delta-'
+MAX_DELTAS = 32
+# Крупные таймфреймы (уровни bars.py) партиционируются по месяцам/годам, чтобы не плодить файлы на 1-2 строки
+PARTITION_UNITS = {'day': 'D', 'month': 'M', 'year': 'Y'}
+
+
+def partition_dir(symbol, interval, root=DATASET_ROOT):
+    """Каталог с днями для пары symbol/interval"""
+    return os.path.join(root, f"symbol={symbol}", f"interval={interval}")
+
+
+def _day_name(day_index):
+    return (datetime(1970, 1, 1) + timedelta(days=int(day_index))).strftime('%Y-%m-%d')
+
+
+def _to_timestamp_ms(value):
+    """Приводит int (мс), строку даты или datetime к timestamp в миллисекундах"""
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize(timezone.utc)
+    return int(ts.timestamp() * 1000)
+
+
+def normalize_frame(df):
+    """Типизирует данные: timestamp int64 (мс), все числовые колонки float64, текстовые колонки отбрасываются"""
+    df = df.reset_index() if 'timestamp' not in df.columns else df
+    timestamps = df['timestamp']
+    if not pd.api.types.is_integer_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps).astype('datetime64[ms]').astype('int64')
+
+    columns = {'timestamp': timestamps.to_numpy(dtype=np.int64)}
+    for column in df.columns:
+        if column != 'timestamp' and pd.api.types.is_numeric_dtype(df[column]):
+            columns[column] = df[column].to_numpy(dtype=np.float64)
+    return pd.DataFrame(columns)
+
+
+def partition_files(path):
+    """Файлы партиции по пути её part-0 в порядке применения: part-0, затем delta-N по возрастанию"""
+    day_dir = os.path.dirname(path)
+    deltas = sorted(name for name in os.listdir(day_dir)
+                    if name.startswith(DELTA_PREFIX) and name.endswith('.parquet'))
+    return [path] + [os.path.join(day_dir, name) for name in deltas]
+
+
+def _merge_files(files, df=None):
+    """Строки партиции (и новые строки df поверх): файлы по порядку, повтор timestamp — побеждает более поздний"""
+    frames = [pq.read_table(f).to_pandas() for f in files]
+    if df is not None:
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+    return (df.drop_duplicates('timestamp', keep='last')
+              .sort_values('timestamp')
+              .reset_index(drop=True))
+
+
+def _write_parquet(df, path):
+    tmp_path = path + '.tmp'
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def compact_partition(path):
+    """Сливает delta-файлы партиции в part-0; повторный запуск после сбоя даёт тот же результат"""
+    files = partition_files(path)
+    if len(files) == 1:
+        return 0
+    df = _merge_files(files)
+    _write_parquet(df, path)
+    # Если упадём здесь, оставшиеся delta применятся к part-0 ещё раз и ничего не изменят
+    for delta in files[1:]:
+        os.remove(delta)
+    return len(df)
+
+
+def write_ohlcv(df, symbol, interval, root=DATASET_ROOT, partition='day', append=False):
+    """Записывает данные в датасет, разбивая по дням (или месяцам/годам); повторная запись того же timestamp перезаписывает строку.
+
+    append=False сливает строки с партицией и переписывает её целиком (разовая загрузка истории).
+    append=True для частых маленьких записей: строки ложатся отдельным delta-файлом, а партиция
+    переписывается раз в MAX_DELTAS записей. Возвращает число записанных строк.
+    """
+    df = normalize_frame(df)
+    if df.empty:
+        return 0
+
+    base_dir = partition_dir(symbol, interval, root)
+    df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    unit = PARTITION_UNITS[partition]
+    periods = df['timestamp'].to_numpy().astype('datetime64[ms]').astype(f"datetime64[{unit}]")
+    # Границы партиций в отсортированных данных: один проход вместо маски на каждую партицию
+    bounds = np.flatnonzero(np.diff(periods.astype(np.int64))) + 1
+    written = 0
+    for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(df)]):
+        day_df = df.iloc[lo:hi]
+        day_dir = os.path.join(base_dir, f"{partition}={np.datetime_as_string(periods[lo])}")
+        path = os.path.join(day_dir, PART_FILE)
+        day_df = day_df.drop_duplicates('timestamp', keep='last').reset_index(drop=True)
+        if append and os.path.exists(path):
+            files = partition_files(path)
+            # Номер — следующий за последним: после сбоя посреди слияния часть delta может остаться
+            number = int(os.path.basename(files[-1])[len(DELTA_PREFIX):-len('.parquet')]) + 1 if len(files) > 1 else 1
+            _write_parquet(day_df, os.path.join(day_dir, f"{DELTA_PREFIX}{number:06d}.parquet"))
+            if len(files) >= MAX_DELTAS:
+                compact_partition(path)
+            written += len(day_df)
+            continue
+
+        if os.path.exists(path):
+            day_df = _merge_files(partition_files(path), day_df)
+        os.makedirs(day_dir, exist_ok=True)
+        _write_parquet(day_df, path)
+        written += len(day_df)
+    return written
+
+
+def list_partitions(symbol, interval, start=None, end=None, root=DATASET_ROOT):
+    """Файлы part-0 партиций, пересекающихся с [start, end) — отсечение по пути без чтения данных"""
+    base_dir = partition_dir(symbol, interval, root)
+    if not os.path.isdir(base_dir):
+        return []
+
+    start_ms, end_ms = _to_timestamp_ms(start), _to_timestamp_ms(end)
+    first_day = _day_name(start_ms // DAY_MS) if start_ms is not None else None
+    last_day = _day_name((end_ms - 1) // DAY_MS) if end_ms is not None else None
+
+    files = []
+    for name in sorted(os.listdir(base_dir)):
+        partition, _, period = name.partition('=')
+        if partition not in PARTITION_UNITS:
+            continue
+        # '2025-10' и '2025' сравниваются с префиксом даты той же длины
+        if first_day and period < first_day[:len(period)] or last_day and period > last_day[:len(period)]:
+            continue
+        path = os.path.join(base_dir, name, PART_FILE)
+        if os.path.exists(path):
+            files.append(path)
+    return files
+
+
+def read_ohlcv(symbol, interval, start=None, end=None, columns=None, root=DATASET_ROOT):
+    """Читает диапазон [start, end): лишние дни отсекаются по партициям, строки — фильтром по timestamp"""
+    partitions = list_partitions(symbol, interval, start, end, root)
+    if not partitions:
+        return pd.DataFrame(columns=['timestamp'] + list(columns or []))
+    files = [f for path in partitions for f in partition_files(path)]
+
+    start_ms, end_ms = _to_timestamp_ms(start), _to_timestamp_ms(end)
+    condition = None
+    if start_ms is not None:
+        condition = ds.field('timestamp') >= start_ms
+    if end_ms is not None:
+        upper = ds.field('timestamp') < end_ms
+        condition = upper if condition is None else condition & upper
+
+    if columns is not None:
+        columns = ['timestamp'] + [c for c in columns if c != 'timestamp']
+    if len(files) == len(partitions):
+        return ds.dataset(files, format='parquet').to_table(columns=columns, filter=condition).to_pandas()
+    # Есть несжатые delta: читаем файлы по порядку, чтобы более поздняя строка перекрыла прежнюю
+    tables = [ds.dataset(f, format='parquet').to_table(columns=columns, filter=condition) for f in files]
+    return (pa.concat_tables(tables).to_pandas()
+              .drop_duplicates('timestamp', keep='last')
+              .sort_values('timestamp', kind='stable')
+              .reset_index(drop=True))
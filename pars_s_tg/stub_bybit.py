@@ -0,0 +1,317 @@
+# Локальная замена ByBit для офлайн-тестов и бенчмарков
+import asyncio
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+
+
+def load_session(path):
+    """Читает записанную сессию: одно JSON-сообщение биржи на строку"""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def make_synthetic_session(path, symbol='TONUSDT', minutes=10, start_ms=1761148800000, seed=0):
+    """Генерирует сессию в формате ByBit v5 public: тикер раз в 100 мс, сделки, свеча 1m"""
+    rng = random.Random(seed)
+    price = 2.13
+    lines = []
+    for minute in range(minutes):
+        candle_start = start_ms + minute * 60_000
+        o = h = l = price
+        volume = turnover = 0.0
+        for step in range(600):
+            ts = candle_start + step * 100
+            price = max(0.01, price + rng.gauss(0, 0.0005))
+            size = round(rng.uniform(1, 500), 2)
+            h, l = max(h, price), min(l, price)
+            volume += size
+            turnover += size * price
+            lines.append(json.dumps({
+                'topic': f"publicTrade.{symbol}", 'type': 'snapshot', 'ts': ts,
+                'data': [{'T': ts, 's': symbol, 'S': rng.choice(['Buy', 'Sell']), 'v': str(size),
+                          'p': f"{price:.4f}", 'L': 'ZeroPlusTick', 'i': str(ts * 10 + step % 10), 'BT': False}],
+            }))
+            lines.append(json.dumps({
+                'topic': f"tickers.{symbol}", 'type': 'snapshot', 'cs': ts, 'ts': ts,
+                'data': {'symbol': symbol, 'lastPrice': f"{price:.4f}", 'highPrice24h': '2.3060',
+                         'lowPrice24h': '2.1150', 'prevPrice24h': '2.2000', 'volume24h': '4215071.76',
+                         'turnover24h': '9265384.11', 'price24hPcnt': '-0.0318', 'usdIndexPrice': f"{price:.6f}"},
+            }))
+            confirm = step == 599
+            if step % 10 == 0 or confirm:
+                lines.append(json.dumps({
+                    'topic': f"kline.1.{symbol}", 'type': 'snapshot', 'ts': ts,
+                    'data': [{'start': candle_start, 'end': candle_start + 59_999, 'interval': '1',
+                              'open': f"{o:.4f}", 'close': f"{price:.4f}", 'high': f"{h:.4f}", 'low': f"{l:.4f}",
+                              'volume': f"{volume:.2f}", 'turnover': f"{turnover:.4f}", 'confirm': confirm,
+                              'timestamp': ts}],
+                }))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return len(lines)
+
+
+def make_synthetic_orderbook_session(path, symbol='TONUSDT', seconds=60, updates_per_second=200, depth=50,
+                                     start_ms=1761148800000, seed=0, tick=0.0001):
+    """Генерирует поток orderbook.{depth} в формате ByBit v5: snapshot и дельты с u по порядку"""
+    rng = random.Random(seed)
+    mid = 21300                               # Середина стакана в тиках
+    book = {'b': {mid - i: round(rng.uniform(10, 5000), 2) for i in range(1, depth + 1)},
+            'a': {mid + i: round(rng.uniform(10, 5000), 2) for i in range(1, depth + 1)}}
+    topic = f"orderbook.{depth}.{symbol}"
+
+    def levels(side, ticks):
+        return [[f"{t * tick:.4f}", f"{book[side].get(t, 0.0):.2f}"] for t in sorted(ticks)]
+
+    lines = [json.dumps({'topic': topic, 'type': 'snapshot', 'ts': start_ms, 'cts': start_ms,
+                         'data': {'s': symbol, 'b': levels('b', book['b']), 'a': levels('a', book['a']),
+                                  'u': 1, 'seq': 1000}})]
+    step_ms = 1000 / updates_per_second
+    for u in range(2, int(seconds * updates_per_second) + 2):
+        ts = start_ms + int(u * step_ms)
+        changed = {'b': set(), 'a': set()}
+        if rng.random() < 0.05:
+            # Сдвиг середины: уровень противоположной стороны снимается, на своей появляется новый
+            move = rng.choice((-1, 1))
+            mid += move
+            side, other = ('b', 'a') if move > 0 else ('a', 'b')
+            book[other].pop(mid, None)
+            changed[other].add(mid)
+            book[side][mid - move] = round(rng.uniform(10, 5000), 2)
+            changed[side].add(mid - move)
+        for _ in range(rng.randint(1, 4)):
+            side = rng.choice('ba')
+            level = mid - rng.randint(1, depth + 10) if side == 'b' else mid + rng.randint(1, depth + 10)
+            if rng.random() < 0.3:
+                book[side].pop(level, None)
+            else:
+                book[side][level] = round(rng.uniform(10, 5000), 2)
+            changed[side].add(level)
+        lines.append(json.dumps({'topic': topic, 'type': 'delta', 'ts': ts, 'cts': ts,
+                                 'data': {'s': symbol, 'b': levels('b', changed['b']),
+                                          'a': levels('a', changed['a']), 'u': u, 'seq': 1000 + u}}))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return len(lines)
+
+
+def synthetic_kline(ts, interval_ms=60_000):
+    """Детерминированная свеча ByBit v5 для момента ts: одна и та же при любом запросе и разбиении"""
+    i = ts // interval_ms
+    noise = (i * 2654435761 % 1000) / 1e5
+    close = 2.0 + 0.2 * math.sin(i / 5000) + noise
+    open_ = 2.0 + 0.2 * math.sin((i - 1) / 5000) + ((i - 1) * 2654435761 % 1000) / 1e5
+    high = max(open_, close) + 0.0004
+    low = min(open_, close) - 0.0004
+    volume = 100 + i * 7919 % 10000
+    return [str(ts), f"{open_:.4f}", f"{high:.4f}", f"{low:.4f}", f"{close:.4f}", f"{volume:.2f}",
+            f"{volume * close:.4f}"]
+
+
+class ReplayServer:
+    """WebSocket-сервер, отдающий записанные сообщения по подписке клиента"""
+
+    def __init__(self, messages, host='127.0.0.1', port=8765, speed=0.0, drop_after=None):
+        self.messages = messages
+        self.host = host
+        self.port = port
+        self.speed = speed              # 0 — без пауз, 1.0 — в реальном времени, 10 — в 10 раз быстрее
+        self.drop_after = drop_after    # Разрывать соединение после N сообщений (проверка переподключения)
+        self.position = 0               # Переподключившийся клиент продолжает с места разрыва
+        self.sent = 0
+        self.connections = 0
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    async def handler(self, ws):
+        self.connections += 1
+        topics = set()
+        async for raw in ws:
+            request = json.loads(raw)
+            if request.get('op') == 'subscribe':
+                topics.update(request.get('args', []))
+                await ws.send(json.dumps({'success': True, 'ret_msg': '', 'op': 'subscribe', 'conn_id': 'stub'}))
+                break
+
+        listener = asyncio.create_task(self._answer_pings(ws))
+        try:
+            sent_here = 0
+            previous_ts = None
+            while self.position < len(self.messages):
+                raw = self.messages[self.position]
+                self.position += 1
+                message = json.loads(raw)
+                if message.get('topic') not in topics:
+                    continue
+                ts = message.get('ts')
+                if self.speed and previous_ts is not None and ts is not None:
+                    await asyncio.sleep(max(0, ts - previous_ts) / 1000 / self.speed)
+                previous_ts = ts
+                await ws.send(raw)
+                self.sent += 1
+                sent_here += 1
+                if self.drop_after and sent_here >= self.drop_after:
+                    # Пропускаем часть потока, как будто сообщения ушли, пока клиента не было
+                    self.position += self.drop_after // 10
+                    return
+        finally:
+            listener.cancel()
+
+    async def _answer_pings(self, ws):
+        async for raw in ws:
+            if json.loads(raw).get('op') == 'ping':
+                await ws.send(json.dumps({'success': True, 'ret_msg': 'pong', 'op': 'ping'}))
+
+    async def serve_forever(self):
+        async with websockets.serve(self.handler, self.host, self.port):
+            print(f"Стенд ByBit WS: {self.url}, сообщений: {len(self.messages)}")
+            await asyncio.Future()
+
+
+class _RestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'     # keep-alive, как у настоящего API
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        status, payload = stub.handle(url.path, params)
+        body = json.dumps(payload, separators=(',', ':')).encode()     # Компактный JSON, как у ByBit
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in stub.quota_headers().items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubRestServer:
+    """HTTP-замена ByBit REST (/v5/market/tickers, /v5/market/kline) с настраиваемой задержкой,
+    ошибками, квотой запросов и пагинацией свечей"""
+
+    def __init__(self, symbols=None, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, seed=0,
+                 quota=None, quota_window=1.0, kline_range=None, max_limit=1000, missing_rate=0.0):
+        self.symbols = symbols or ['TONUSDT']
+        self.latency = latency          # Задержка ответа, секунды
+        self.error_rate = error_rate    # Доля ответов с ошибкой
+        # Квота как у биржи: quota запросов за окно quota_window секунд, сверх — retCode 10006
+        self.quota = quota
+        self.quota_window = quota_window
+        self.window_start = time.time()
+        self.window_used = 0
+        self.rejected = 0
+        # История свечей [start, end) мс: генерируется на лету, missing_rate — доля "дыр" в истории
+        self.kline_range = kline_range
+        self.max_limit = max_limit
+        self.missing_rate = missing_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _RestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def ticker(self, symbol, now_ms):
+        price = 1.0 + sum(map(ord, symbol)) % 1000 / 100 + (now_ms // 1000 % 60) * 0.001
+        return {
+            'symbol': symbol, 'lastPrice': f"{price:.4f}", 'bid1Price': f"{price - 0.0001:.4f}",
+            'ask1Price': f"{price + 0.0001:.4f}", 'highPrice24h': f"{price * 1.05:.4f}",
+            'lowPrice24h': f"{price * 0.95:.4f}", 'prevPrice24h': f"{price:.4f}",
+            'volume24h': '4215071.76', 'turnover24h': '9265384.11', 'price24hPcnt': '0.0012',
+        }
+
+    def handle(self, path, params):
+        """Возвращает (HTTP статус, JSON) для запроса"""
+        with self.lock:
+            self.requests += 1
+            failed = self.rng.random() < self.error_rate
+            if self.quota is not None:
+                now = time.time()
+                if now - self.window_start >= self.quota_window:
+                    self.window_start, self.window_used = now, 0
+                self.window_used += 1
+                if self.window_used > self.quota:
+                    failed = True
+                    self.rejected += 1
+        if self.latency:
+            time.sleep(self.latency)
+        now_ms = int(time.time() * 1000)
+        if failed:
+            return 200, {'retCode': 10006, 'retMsg': 'Too many visits!', 'result': {}, 'time': now_ms}
+
+        if path == '/v5/market/tickers':
+            symbols = [params['symbol']] if 'symbol' in params else self.symbols
+            tickers = [self.ticker(symbol, now_ms) for symbol in symbols if symbol in self.symbols]
+            return 200, {'retCode': 0, 'retMsg': 'OK', 'time': now_ms,
+                         'result': {'category': params.get('category', 'spot'), 'list': tickers}}
+        if path == '/v5/market/kline':
+            return 200, self.klines(params, now_ms)
+        return 404, {'retCode': 10001, 'retMsg': f"unknown path {path}", 'result': {}, 'time': now_ms}
+
+    def klines(self, params, now_ms):
+        """Страница свечей как у ByBit v5: от start вперёд не больше limit, в ответе новые первыми"""
+        interval = params.get('interval', '1')
+        interval_ms = (int(interval) if interval.isdigit() else 1440) * 60_000
+        limit = min(int(params.get('limit', 200)), self.max_limit)
+        first, last = self.kline_range or (0, now_ms)
+        start = max(int(params.get('start', first)), first)
+        end = min(int(params['end']) + 1 if 'end' in params else last, last)
+        ts = start + (-start) % interval_ms
+        rows = []
+        while ts < end and len(rows) < limit:
+            # Пропуск свечи детерминирован по времени: повторный запрос видит те же дыры
+            if not self.missing_rate or (ts // interval_ms * 40503 % 10000) / 10000 >= self.missing_rate:
+                rows.append(synthetic_kline(ts, interval_ms))
+            ts += interval_ms
+        rows.reverse()
+        return {'retCode': 0, 'retMsg': 'OK', 'time': now_ms,
+                'result': {'category': params.get('category', 'linear'), 'symbol': params.get('symbol'),
+                           'list': rows}}
+
+    def quota_headers(self):
+        """Заголовки X-Bapi-Limit* текущего окна квоты (пусто, если квота не задана)"""
+        if self.quota is None:
+            return {}
+        with self.lock:
+            remaining = max(0, self.quota - self.window_used)
+            reset_ms = int((self.window_start + self.quota_window) * 1000)
+        return {'X-Bapi-Limit': str(self.quota), 'X-Bapi-Limit-Status': str(remaining),
+                'X-Bapi-Limit-Reset-Timestamp': str(reset_ms)}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    # python stub_bybit.py session.jsonl [port] — отдать записанную сессию
+    if len(sys.argv) < 2:
+        print("Использование: python stub_bybit.py <session.jsonl> [port]")
+        sys.exit(1)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+    asyncio.run(ReplayServer(load_session(sys.argv[1]), port=port).serve_forever())
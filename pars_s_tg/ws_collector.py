@@ -0,0 +1,287 @@
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+import websockets
+
+from bars import BAR_COLUMNS, BarAggregator, update_rollups
+from buffered_writer import BufferedWriter
+from market_bus import open_writer
+from metrics import GAPS_DETECTED
+from storage import DATASET_ROOT, write_ohlcv
+
+BYBIT_WS_SPOT = 'wss://stream.bybit.com/v5/public/spot'
+PING_INTERVAL = 20          # Bybit закрывает соединение без ping дольше ~30 с
+KLINE_INTERVAL = '1'
+KLINE_INTERVAL_MS = int(KLINE_INTERVAL) * 60 * 1000
+
+TICKER_COLUMNS = ['timestamp', 'last_price', 'high_24h', 'low_24h', 'volume_24h', 'turnover_24h']
+KLINE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+TRADE_COLUMNS = ['timestamp', 'price', 'size', 'side', 'trade_id']
+BAR_INTERVAL_MS = 1000
+ROLLUP_EVERY_MS = 60 * 1000      # Как часто (по биржевому времени) 1s-бары уходят в датасет и уровни
+ROLLUP_PREFIX = 'spot_trades'
+
+
+class StreamCollector:
+    """Потоковый сборщик ByBit: тикер, закрытые свечи и сделки по WebSocket с биржевыми timestamp"""
+
+    def __init__(self, symbol='TONUSDT', url=BYBIT_WS_SPOT, file_prefix=None, record_file=None,
+                 max_backoff=30.0, flush_rows=1000, flush_interval=5.0, dataset_root=DATASET_ROOT, publish=False):
+        self.symbol = symbol
+        self.url = url
+        self.max_backoff = max_backoff
+        self.topics = [f"tickers.{symbol}", f"kline.{KLINE_INTERVAL}.{symbol}", f"publicTrade.{symbol}"]
+
+        prefix = file_prefix or f"{symbol.lower()}_ws"
+        self.ticker_writer = BufferedWriter(f"{prefix}_ticker.csv", TICKER_COLUMNS, flush_rows, flush_interval)
+        self.kline_writer = BufferedWriter(f"{prefix}_kline_{KLINE_INTERVAL}m.csv", KLINE_COLUMNS, flush_rows, flush_interval)
+        self.trade_writer = BufferedWriter(f"{prefix}_trades.csv", TRADE_COLUMNS, flush_rows, flush_interval)
+        # Настоящие 1s-бары из сделок: CSV для потока и датасет с уровнями 1m..1d (None — без датасета)
+        self.bar_writer = BufferedWriter(f"{prefix}_bars_1s.csv", BAR_COLUMNS, flush_rows, flush_interval)
+        self.bars = BarAggregator(BAR_INTERVAL_MS)
+        self.dataset_root = dataset_root
+        self.pending_bars = []
+        self.rollup_task = None          # Последняя запущенная запись баров в датасет (в потоке)
+        self.rollup_errors = 0
+        self.record_file = open(record_file, 'a') if record_file else None
+        # Живые тикер и 1s-бары в шину разделяемой памяти для стратегий (publish=True — в живом сборщике)
+        self.ticker_bus = open_writer(symbol, 'ws_ticker') if publish else None
+        self.bar_bus = open_writer(symbol, 'bars_1s') if publish else None
+
+        self.last_kline_start = None     # Старт последней закрытой свечи — для поиска пропусков
+        self.last_message_ts = None      # Биржевое время последнего сообщения
+        self.disconnected_at = None      # Биржевое время последнего сообщения перед разрывом
+        self.gaps = []                   # [(from_ms, to_ms, причина)]
+        self.messages = 0
+        self.message_errors = 0          # Сообщения, которые не удалось разобрать (пропущены)
+        self.reconnects = 0
+        self.running = True
+
+    # ---------- разбор сообщений ----------
+
+    def handle_message(self, raw):
+        """Разбирает одно сообщение биржи и пишет строки в буферы"""
+        if self.record_file:
+            self.record_file.write(raw if raw.endswith('\n') else raw + '\n')
+
+        message = json.loads(raw)
+        topic = message.get('topic')
+        if not topic:
+            return  # ответы на subscribe/ping
+        self.messages += 1
+        ts = message.get('ts')
+        if ts is not None:
+            if self.disconnected_at is not None:
+                # Первое сообщение после переподключения: тикеры и сделки за время разрыва потеряны
+                self.record_gap(self.disconnected_at, ts, 'reconnect')
+                self.disconnected_at = None
+            self.last_message_ts = ts
+
+        if topic.startswith('tickers.'):
+            self._handle_ticker(message)
+        elif topic.startswith('kline.'):
+            self._handle_kline(message)
+        elif topic.startswith('publicTrade.'):
+            self._handle_trades(message)
+
+    def _handle_ticker(self, message):
+        ticker = message['data']
+        row = (
+            int(message['ts']),
+            float(ticker['lastPrice']),
+            float(ticker['highPrice24h']),
+            float(ticker['lowPrice24h']),
+            float(ticker['volume24h']),
+            float(ticker['turnover24h']),
+        )
+        self.ticker_writer.write(row)
+        if self.ticker_bus:
+            ts, last, high, low, volume, _ = row
+            self.ticker_bus.publish(ts, last, high, low, last, volume)
+
+    def _handle_kline(self, message):
+        for kline in message['data']:
+            if not kline.get('confirm'):
+                continue  # Пишем только закрытые свечи — без повторов одной и той же минуты
+            start = int(kline['start'])
+            if self.last_kline_start is not None:
+                if start <= self.last_kline_start:
+                    continue
+                if start - self.last_kline_start > KLINE_INTERVAL_MS:
+                    self.record_gap(self.last_kline_start + KLINE_INTERVAL_MS, start, 'kline')
+            self.last_kline_start = start
+            self.kline_writer.write((
+                start,
+                float(kline['open']),
+                float(kline['high']),
+                float(kline['low']),
+                float(kline['close']),
+                float(kline['volume']),
+                float(kline['turnover']),
+            ))
+
+    def _handle_trades(self, message):
+        for trade in message['data']:
+            ts, price, size = int(trade['T']), float(trade['p']), float(trade['v'])
+            self.trade_writer.write((ts, price, size, 1 if trade['S'] == 'Buy' else -1, trade['i']))
+            bar = self.bars.add(ts, price, size)
+            if bar is not None:
+                self._write_bar(bar)
+
+    def _write_bar(self, bar):
+        self.bar_writer.write(bar)
+        if self.bar_bus:
+            self.bar_bus.publish(*bar)
+        if self.dataset_root is None:
+            return
+        self.pending_bars.append(bar)
+        if bar[0] - self.pending_bars[0][0] >= ROLLUP_EVERY_MS:
+            self.schedule_rollup()
+
+    def schedule_rollup(self):
+        """Отдаёт накопленные бары на запись в датасет: в потоке, если работает цикл asyncio"""
+        bars, self.pending_bars = self.pending_bars, []
+        if not bars:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._materialize(bars)      # Синхронный вызов (разбор записанной сессии без цикла)
+            return
+        # Parquet и уровни пишутся десятки-сотни мс: в цикле это задержало бы сообщения и ping.
+        # Пачки идут по очереди — следующая ждёт предыдущую, порядок записи сохраняется
+        self.rollup_task = loop.create_task(self._materialize_async(bars, self.rollup_task))
+
+    async def _materialize_async(self, bars, previous):
+        if previous is not None:
+            await previous
+        try:
+            await asyncio.to_thread(self._materialize, bars)
+        except Exception as e:
+            self.rollup_errors += 1
+            print(f"Ошибка записи баров в датасет: {e}")
+
+    async def wait_rollups(self):
+        if self.rollup_task is not None:
+            await self.rollup_task
+            self.rollup_task = None
+
+    def materialize_bars(self):
+        """Пишет накопленные 1s-бары в датасет и досчитывает уровни 1m..1d только по их диапазону"""
+        bars, self.pending_bars = self.pending_bars, []
+        if bars:
+            self._materialize(bars)
+
+    def _materialize(self, bars):
+        if not bars:
+            return
+        df = pd.DataFrame(bars, columns=BAR_COLUMNS)
+        label = f"{ROLLUP_PREFIX}_1s"
+        # Раз в минуту — маленькие delta-файлы, а не перезапись всего дня 1s-баров
+        write_ohlcv(df, self.symbol, label, self.dataset_root, append=True)
+        update_rollups(self.symbol, ROLLUP_PREFIX, int(df['timestamp'].iloc[0]),
+                       int(df['timestamp'].iloc[-1]) + BAR_INTERVAL_MS, base='1s', root=self.dataset_root,
+                       append=True)
+
+    def record_gap(self, from_ms, to_ms, reason):
+        """Запоминает пропущенный интервал [from_ms, to_ms)"""
+        self.gaps.append((from_ms, to_ms, reason))
+        GAPS_DETECTED.inc(source='ws', reason=reason)
+        start = datetime.utcfromtimestamp(from_ms / 1000).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"Пропуск данных ({reason}): с {start} UTC, {(to_ms - from_ms) / 1000:.0f} с")
+
+    # ---------- соединение ----------
+
+    async def _keepalive(self, ws):
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            await ws.send(json.dumps({'op': 'ping'}))
+
+    async def _session(self):
+        async with websockets.connect(self.url, ping_interval=None) as ws:
+            await ws.send(json.dumps({'op': 'subscribe', 'args': self.topics}))
+            print(f"Подключено к {self.url}, подписка: {', '.join(self.topics)}")
+            keepalive = asyncio.create_task(self._keepalive(ws))
+            try:
+                async for raw in ws:
+                    try:
+                        self.handle_message(raw)
+                    except Exception as e:
+                        # Одно битое сообщение не должно останавливать сбор: пропускаем и считаем
+                        self.message_errors += 1
+                        print(f"Ошибка разбора сообщения ({type(e).__name__}: {e}): {str(raw)[:200]}")
+                    if not self.running:
+                        break
+            finally:
+                keepalive.cancel()
+
+    async def run(self, max_reconnects=None):
+        """Основной цикл: переподключение с экспоненциальной задержкой и учётом пропусков"""
+        backoff = 1.0
+        try:
+            while self.running:
+                connected_at = time.monotonic()
+                try:
+                    await self._session()
+                except (OSError, websockets.WebSocketException) as e:
+                    print(f"Соединение потеряно: {e}")
+
+                if not self.running:
+                    break
+                if self.last_message_ts is not None:
+                    self.disconnected_at = self.last_message_ts
+                # Сессия продержалась долго — считаем соединение здоровым и сбрасываем задержку
+                if time.monotonic() - connected_at > 60:
+                    backoff = 1.0
+                self.reconnects += 1
+                if max_reconnects is not None and self.reconnects > max_reconnects:
+                    break
+                delay = backoff * (0.5 + random.random())
+                print(f"Переподключение через {delay:.1f} с (попытка {self.reconnects})")
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, self.max_backoff)
+        finally:
+            # Последний бар и хвост баров — тоже в потоке и до ожидания записей, иначе задача
+            # записи останется без ожидания, а close() писал бы датасет прямо в цикле
+            self.flush_last_bar()
+            self.schedule_rollup()
+            await self.wait_rollups()
+            self.close()
+
+    def stop(self):
+        self.running = False
+
+    def flush_last_bar(self):
+        # Последний бар мог не закрыться — сохраняем его как есть, иначе сделки последней секунды пропадут
+        bar = self.bars.flush()
+        if bar is not None:
+            self._write_bar(bar)
+
+    def close(self):
+        # После run() бар и хвост уже записаны; без цикла (разбор записанной сессии) — здесь же
+        self.flush_last_bar()
+        self.materialize_bars()
+        for writer in (self.ticker_writer, self.kline_writer, self.trade_writer, self.bar_writer):
+            writer.close()
+        if self.record_file:
+            self.record_file.close()
+            self.record_file = None
+        for bus in (self.ticker_bus, self.bar_bus):
+            if bus:
+                bus.close()
+        print(f"Сообщений: {self.messages}, ошибок разбора: {self.message_errors}, "
+              f"переподключений: {self.reconnects}, пропусков: {len(self.gaps)}")
+
+
+if __name__ == "__main__":
+    # python ws_collector.py [url] — url локального стенда stub_bybit.py вместо биржи
+    collector = StreamCollector(url=sys.argv[1] if len(sys.argv) > 1 else BYBIT_WS_SPOT, publish=True)
+    try:
+        asyncio.run(collector.run())
+    except KeyboardInterrupt:
+        print("\nОстановлено пользователем")
@@ -1,8 +1,43 @@
 import requests
-import pandas as pd
-import time
 from datetime import datetime
+import asyncio
+import itertools
 import os
+import sys
+
+# Общие модули проекта лежат в pars_s_tg
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pars_s_tg'))
+
+from buffered_writer import BufferedWriter, UpsertWriter, install_signal_handlers
+from indicators import IndicatorSet
+from market_bus import open_writer
+from metrics import PARSE_TIME, WRITE_TIME, PeriodicSummary, start_from_env
+from rate_limit import AdaptiveRateLimiter
+from scheduler import TickScheduler
+
+# timestamp и time_utc — время тика планировщика (у свечей — время открытия свечи),
+# time_local — локальное время получения ответа: разница между ними — задержка запроса
+TICKER_COLUMNS = ['symbol', 'timestamp', 'time_utc', 'time_local', 'open', 'high', 'low', 'close', 'volume']
+PRICE_COLUMNS = ['symbol', 'timestamp', 'time_utc', 'time_local', 'price', 'volume']
+FLUSH_ROWS = 60          # Сброс на диск раз в ~минуту при сборе 1 раз в секунду
+FLUSH_INTERVAL = 10.0    # ...но не реже чем раз в 10 секунд
+RATE_LIMIT = 50          # Потолок запросов в секунду на процесс (rate_limit из конфига)
+
+# Общий для всех сборщиков процесса контроллер темпа: учитывает квоту из заголовков ByBit
+rate_limiter = AdaptiveRateLimiter(RATE_LIMIT)
+# Вместо строки в консоль на каждую запись — сводка раз в минуту (последняя запись + метрики)
+summary_log = PeriodicSummary()
+parse_ticker_time = PARSE_TIME.labels(stage='ticker')
+parse_kline_time = PARSE_TIME.labels(stage='kline')
+
+def report_tick_metrics(metrics, csv_file):
+    """Печатает сводку по тикам и сохраняет гистограммы рядом с CSV"""
+    metrics_file = csv_file.replace('.csv', '_ticks.json')
+    metrics.export(metrics_file)
+    print(f"Тайминг: {metrics.summary()}")
+    print(f"Гистограммы jitter/задержек: {metrics_file}")
+    print(f"Запросы к API: {rate_limiter.summary()}")
+    print(f"Метрики: {summary_log.registry.summary()}")
 
 class ByBitTONCollector1s:
     def __init__(self, symbol='TONUSDT', csv_filename='bybit_tonusdt_1s.csv'):
@@ -10,19 +45,22 @@ class ByBitTONCollector1s:
         self.csv_filename = csv_filename
         self.base_url = 'https://api.bybit.com'
         self.initialize_csv()
+        self.indicators = IndicatorSet()
+        # Каждый тик сразу в шину разделяемой памяти: потребителям не нужно читать CSV
+        self.bus = open_writer(symbol, 'ticker')
     
     def initialize_csv(self):
-        """Создает CSV файл с заголовками"""
-        if not os.path.exists(self.csv_filename):
-            df = pd.DataFrame(columns=[
-                'symbol', 'timestamp', 'time_utc', 'time_local', 
-                'open', 'high', 'low', 'close', 'volume'
-            ])
-            df.to_csv(self.csv_filename, index=False)
+        """Открывает буферизованный CSV, при необходимости создает файл с заголовками"""
+        is_new = not os.path.exists(self.csv_filename)
+        # Два тика могут выполняться одновременно: внутри сброса строки упорядочиваются по времени тика
+        self.writer = BufferedWriter(self.csv_filename, TICKER_COLUMNS, flush_rows=FLUSH_ROWS,
+                                     flush_interval=FLUSH_INTERVAL, sort_key='timestamp')
+        self.write_time = WRITE_TIME.labels(file=self.writer.name)
+        if is_new:
             print(f"Создан файл для данных ByBit: {self.csv_filename}")
     
-    def get_bybit_ticker_data(self):
-        """Получает тикерные данные с ByBit"""
+    def get_bybit_ticker_data(self, tick_ms):
+        """Получает тикерные данные с ByBit; запись помечается временем тика tick_ms"""
         try:
             url = f"{self.base_url}/v5/market/tickers"
             params = {
@@ -30,19 +68,20 @@ class ByBitTONCollector1s:
                 'symbol': self.symbol
             }
             
-            response = requests.get(url, params=params, timeout=5)
-            data = response.json()
+            response = rate_limiter.get(requests, url, params=params, timeout=5)
+            with parse_ticker_time.time():
+                data = response.json()
             
             if data['retCode'] == 0 and data['result']['list']:
                 ticker = data['result']['list'][0]
-                current_time = datetime.now()
+                received = datetime.now()
                 
                 # БЕЗ ОКРУГЛЕНИЯ - сохраняем все цифры как есть
                 record = {
                     'symbol': self.symbol,
-                    'timestamp': int(current_time.timestamp() * 1000),
-                    'time_utc': current_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'time_local': current_time.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+                    'timestamp': tick_ms,
+                    'time_utc': datetime.utcfromtimestamp(tick_ms / 1000).strftime('%Y-%m-%d %H:%M:%S'),
+                    'time_local': received.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
                     'open': float(ticker['lastPrice']),     # БЕЗ ОКРУГЛЕНИЯ
                     'high': float(ticker['highPrice24h']),  # БЕЗ ОКРУГЛЕНИЯ
                     'low': float(ticker['lowPrice24h']),    # БЕЗ ОКРУГЛЕНИЯ
@@ -56,16 +95,32 @@ class ByBitTONCollector1s:
         return None
     
     def save_to_csv(self, data):
-        """Сохраняет данные в CSV"""
+        """Сохраняет данные в CSV (через буфер, сброс пачками)"""
         try:
-            df = pd.DataFrame([data])
             # Сохраняем без округления
-            df.to_csv(self.csv_filename, mode='a', header=False, index=False, float_format='%.10f')
+            with self.write_time.time():
+                self.writer.write(tuple(data[column] for column in TICKER_COLUMNS))
             return True
         except Exception as e:
             print(f"Ошибка сохранения в CSV: {e}")
             return False
     
+    def collect_tick(self, tick_ms):
+        """Один тик: запрос, сохранение и вывод"""
+        # Получаем данные
+        ticker_data = self.get_bybit_ticker_data(tick_ms)
+        
+        if ticker_data:
+            # Сохраняем данные
+            if self.save_to_csv(ticker_data):
+                if self.bus:
+                    self.bus.publish(ticker_data['timestamp'], ticker_data['open'], ticker_data['high'],
+                                     ticker_data['low'], ticker_data['close'], ticker_data['volume'])
+                self.indicators.update(ticker_data['close'], key=tick_ms)
+                count = next(self.counter)
+                summary_log.maybe_log(lambda: f"#{count} | Price: {ticker_data['close']} | "
+                                              f"Volume: {ticker_data['volume']} | {self.indicators.summary()}")
+    
     def run_collector_1s(self):
         """Запускает сбор данных каждую секунду"""
         print("=" * 60)
@@ -74,38 +129,26 @@ class ByBitTONCollector1s:
         print("ОКРУГЛЕНИЕ: НЕТ (все цифры полностью)")
         print("=" * 60)
         
-        collection_count = 0
-        start_time = time.time()
+        self.counter = itertools.count(1)
+        install_signal_handlers()
+        # Индикаторы прогреваем по уже собранной истории, дальше обновляем O(1) на тик
+        warm_bars = self.indicators.warm_up_csv(self.csv_filename)
+        if warm_bars:
+            print(f"Индикаторы прогреты по {warm_bars} записям: {self.indicators.summary()}")
         
-        while True:
-            try:
-                collection_count += 1
-                
-                # Получаем данные
-                ticker_data = self.get_bybit_ticker_data()
-                
-                if ticker_data:
-                    # Сохраняем данные
-                    if self.save_to_csv(ticker_data):
-                        current_time = datetime.now().strftime('%H:%M:%S')
-                        print(f"#{collection_count} | {current_time} | "
-                              f"Price: {ticker_data['close']} | "
-                              f"Volume: {ticker_data['volume']}")
-                
-                # Точная пауза на 1 секунду
-                elapsed = time.time() - start_time
-                sleep_time = 1.0 - (elapsed % 1.0)
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
-                    
-            except KeyboardInterrupt:
-                print(f"\n\nОстановлено пользователем")
-                print(f"Всего собрано записей: {collection_count}")
-                print(f"Данные сохранены в: {self.csv_filename}")
-                break
-            except Exception as e:
-                print(f"Ошибка: {e}")
-                time.sleep(1)
+        # Тики ровно на границах секунд по монотонным часам; медленный запрос не сдвигает следующий
+        scheduler = TickScheduler(self.collect_tick, period=1.0)
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            print(f"\n\nОстановлено пользователем")
+            print(f"Всего собрано записей: {self.writer.rows_written + self.writer.count}")
+            print(f"Данные сохранены в: {self.csv_filename}")
+        finally:
+            self.writer.close()
+            if self.bus:
+                self.bus.close()
+            report_tick_metrics(scheduler.metrics, self.csv_filename)
 
 # Упрощенная версия для максимальной скорости
 def simple_1s_collector():
@@ -113,104 +156,139 @@ def simple_1s_collector():
     csv_file = 'tonusdt_1s_fullprecision.csv'
     
     if not os.path.exists(csv_file):
-        df = pd.DataFrame(columns=['symbol', 'timestamp', 'time_utc', 'time_local', 'price', 'volume'])
-        df.to_csv(csv_file, index=False)
         print("Создан новый файл для данных")
+    writer = BufferedWriter(csv_file, PRICE_COLUMNS, flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL,
+                            sort_key='timestamp')
+    write_time = WRITE_TIME.labels(file=writer.name)
+    bus = open_writer('TONUSDT', 'price')
+    install_signal_handlers()
     
     print("Запуск сбора данных каждую секунду...")
     print("Режим: БЕЗ ОКРУГЛЕНИЯ")
-    count = 0
+    counter = itertools.count(1)
     
-    try:
-        while True:
-            count += 1
-            current_time = datetime.now()
-            
-            # Быстрый запрос к ByBit API
-            url = "https://api.bybit.com/v5/market/tickers"
-            params = {'category': 'spot', 'symbol': 'TONUSDT'}
-            
-            response = requests.get(url, params=params, timeout=3)
+    def tick(tick_ms):
+        # Быстрый запрос к ByBit API
+        url = "https://api.bybit.com/v5/market/tickers"
+        params = {'category': 'spot', 'symbol': 'TONUSDT'}
+        
+        response = rate_limiter.get(requests, url, params=params, timeout=3)
+        with parse_ticker_time.time():
             data = response.json()
+        
+        if data['retCode'] == 0 and data['result']['list']:
+            ticker = data['result']['list'][0]
+            received = datetime.now()
             
-            if data['retCode'] == 0 and data['result']['list']:
-                ticker = data['result']['list'][0]
-                
-                # БЕЗ ОКРУГЛЕНИЯ - все цифры полностью
-                record = {
-                    'symbol': 'TONUSDT',
-                    'timestamp': int(current_time.timestamp() * 1000),
-                    'time_utc': current_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'time_local': current_time.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
-                    'price': float(ticker['lastPrice']),    # Все цифры полностью
-                    'volume': float(ticker['volume24h'])    # Все цифры полностью
-                }
-                
-                # Сохраняем без округления
-                df = pd.DataFrame([record])
-                df.to_csv(csv_file, mode='a', header=False, index=False, float_format='%.10f')
-                
-                print(f"#{count} | {record['time_local']} | Price: {record['price']} | Volume: {record['volume']}")
+            # БЕЗ ОКРУГЛЕНИЯ - все цифры полностью; время строки — тик, а не приход ответа
+            record = {
+                'symbol': 'TONUSDT',
+                'timestamp': tick_ms,
+                'time_utc': datetime.utcfromtimestamp(tick_ms / 1000).strftime('%Y-%m-%d %H:%M:%S'),
+                'time_local': received.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+                'price': float(ticker['lastPrice']),    # Все цифры полностью
+                'volume': float(ticker['volume24h'])    # Все цифры полностью
+            }
             
-            # Точная задержка на 1 секунду
-            time.sleep(1.0)
+            # Сохраняем без округления
+            with write_time.time():
+                writer.write(tuple(record[column] for column in PRICE_COLUMNS))
+            if bus:
+                price = record['price']
+                bus.publish(record['timestamp'], price, price, price, price, record['volume'])
             
+            count = next(counter)
+            summary_log.maybe_log(lambda: f"#{count} | Price: {record['price']} | Volume: {record['volume']}")
+    
+    # Тики ровно на границах секунд, запрос не сдвигает следующий тик
+    scheduler = TickScheduler(tick, period=1.0)
+    try:
+        scheduler.run()
     except KeyboardInterrupt:
-        print(f"\nОстановлено. Собрано записей: {count}")
+        print(f"\nОстановлено. Собрано записей: {writer.rows_written + writer.count}")
+    finally:
+        writer.close()
+        if bus:
+            bus.close()
+        report_tick_metrics(scheduler.metrics, csv_file)
 
 # Версия с Kline данными каждую секунду
 def kline_1s_collector():
     """Сбор Kline данных каждую секунду без округления"""
     csv_file = 'tonusdt_kline_1s.csv'
-    
-    if not os.path.exists(csv_file):
-        df = pd.DataFrame(columns=['symbol', 'timestamp', 'time_utc', 'time_local', 'open', 'high', 'low', 'close', 'volume'])
-        df.to_csv(csv_file, index=False)
+    # Одна строка на свечу: текущая обновляется в памяти и пишется, когда закроется
+    # (старые файлы с повторами сжимает pars_s_tg/compact_csv.py)
+    writer = UpsertWriter(csv_file, TICKER_COLUMNS, key='timestamp',
+                          flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL)
+    write_time = WRITE_TIME.labels(file=writer.name)
+    # Текущая свеча публикуется каждую секунду: у записей одной минуты одинаковый timestamp
+    bus = open_writer('TONUSDT', 'kline_1m')
+    install_signal_handlers()
     
     print("Сбор Kline данных каждую секунду...")
-    count = 0
+    counter = itertools.count(1)
+    # Индикаторы считаются по закрытым минутным свечам: текущая свеча обновляется каждую секунду
+    indicators = IndicatorSet()
+    warm_bars = indicators.warm_up_csv(csv_file, key='timestamp')
+    if warm_bars:
+        print(f"Индикаторы прогреты по {warm_bars} записям: {indicators.summary()}")
+    close_index = TICKER_COLUMNS.index('close')
+    timestamp_index = TICKER_COLUMNS.index('timestamp')
     
-    try:
-        while True:
-            count += 1
-            current_time = datetime.now()
+    def tick(tick_ms):
+        url = "https://api.bybit.com/v5/market/kline"
+        params = {
+            'category': 'spot',
+            'symbol': 'TONUSDT',
+            'interval': '1',
+            'limit': 1
+        }
+        
+        response = rate_limiter.get(requests, url, params=params, timeout=5)
+        with parse_kline_time.time():
+            data = response.json()
+        
+        if data['retCode'] == 0 and data['result']['list']:
+            kline = data['result']['list'][0]
+            received = datetime.now()
             
-            url = "https://api.bybit.com/v5/market/kline"
-            params = {
-                'category': 'spot',
+            # БЕЗ ОКРУГЛЕНИЯ
+            record = {
                 'symbol': 'TONUSDT',
-                'interval': '1',
-                'limit': 1
+                'timestamp': int(kline[0]),
+                'time_utc': datetime.utcfromtimestamp(int(kline[0])/1000).strftime('%Y-%m-%d %H:%M:%S'),
+                'time_local': received.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+                'open': float(kline[1]),    # Все цифры полностью
+                'high': float(kline[2]),    # Все цифры полностью
+                'low': float(kline[3]),     # Все цифры полностью
+                'close': float(kline[4]),   # Все цифры полностью
+                'volume': float(kline[5])   # Все цифры полностью
             }
             
-            response = requests.get(url, params=params, timeout=5)
-            data = response.json()
-            
-            if data['retCode'] == 0 and data['result']['list']:
-                kline = data['result']['list'][0]
-                
-                # БЕЗ ОКРУГЛЕНИЯ
-                record = {
-                    'symbol': 'TONUSDT',
-                    'timestamp': int(kline[0]),
-                    'time_utc': datetime.utcfromtimestamp(int(kline[0])/1000).strftime('%Y-%m-%d %H:%M:%S'),
-                    'time_local': current_time.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
-                    'open': float(kline[1]),    # Все цифры полностью
-                    'high': float(kline[2]),    # Все цифры полностью
-                    'low': float(kline[3]),     # Все цифры полностью
-                    'close': float(kline[4]),   # Все цифры полностью
-                    'volume': float(kline[5])   # Все цифры полностью
-                }
-                
-                df = pd.DataFrame([record])
-                df.to_csv(csv_file, mode='a', header=False, index=False, float_format='%.10f')
-                
-                print(f"#{count} | {record['time_local']} | Close: {record['close']} | High: {record['high']} | Low: {record['low']}")
+            with write_time.time():
+                closed = writer.upsert(tuple(record[column] for column in TICKER_COLUMNS))
+            if bus:
+                bus.publish(record['timestamp'], record['open'], record['high'], record['low'],
+                            record['close'], record['volume'])
             
-            time.sleep(1.0)
+            # Новая свеча — значит предыдущая закрылась, её close идёт в индикаторы (по порядку свечей)
+            if closed is not None:
+                indicators.update(closed[close_index], key=closed[timestamp_index])
             
+            count = next(counter)
+            summary_log.maybe_log(lambda: f"#{count} | Close: {record['close']} | High: {record['high']} | "
+                                          f"Low: {record['low']} | {indicators.summary()}")
+    
+    scheduler = TickScheduler(tick, period=1.0)
+    try:
+        scheduler.run()
     except KeyboardInterrupt:
-        print(f"\nОстановлено. Записей: {count}")
+        print(f"\nОстановлено. Записей: {writer.rows_written + writer.count}")
+    finally:
+        writer.close()
+        if bus:
+            bus.close()
+        report_tick_metrics(scheduler.metrics, csv_file)
 
 # ЗАПУСК СКРИПТА
 if __name__ == "__main__":
@@ -218,13 +296,30 @@ if __name__ == "__main__":
     print("1 - Тикерные данные каждую секунду (рекомендуется)")
     print("2 - Kline данные каждую секунду")
     print("3 - Простая версия (только цена и объем)")
+    print("4 - WebSocket поток: тикер, закрытые свечи и сделки с биржевым временем")
+    print("5 - Стакан заявок: L2 по WebSocket, снимки top-20 раз в секунду")
     
-    choice = input("Введите номер (1-3): ").strip()
+    choice = input("Введите номер (1-5): ").strip()
+    # METRICS_PORT=9108 — endpoint /metrics, MOON_PROFILE=1 — профиль горячих путей по kill -USR1
+    # Свежие тики/бары публикуются в шину разделяемой памяти (market_bus.py), MARKET_BUS=0 — выключить
+    start_from_env()
     
     if choice == "1":
         collector = ByBitTONCollector1s()
         collector.run_collector_1s()
     elif choice == "2":
         kline_1s_collector()
+    elif choice == "4":
+        from ws_collector import StreamCollector
+        try:
+            asyncio.run(StreamCollector(publish=True).run())
+        except KeyboardInterrupt:
+            print("\nОстановлено пользователем")
+    elif choice == "5":
+        from orderbook import OrderBookCollector
+        try:
+            asyncio.run(OrderBookCollector().run())
+        except KeyboardInterrupt:
+            print("\nОстановлено пользователем")
     else:
         simple_1s_collector()
\ No newline at end of file
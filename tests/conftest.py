@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули pars_s_tg импортируются как соседние, так же как в parsing_ton.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pars_s_tg'))
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from backtest import PRICE_COLUMNS, run_backtest
+
+
+def loop_backtest(prices, signal, stop_loss=0.0, take_profit=0.0, fee=0.00055):
+    """Эталон: тот же бэктест обычным циклом по барам, лог-доходность каждого бара"""
+    open_, high, low, close = (prices[column] for column in PRICE_COLUMNS)
+    fee_log = np.log1p(-fee)
+    log_returns = np.zeros(len(close))
+    in_position = False
+    previous_wanted = False
+    entry = 0.0
+    for t in range(len(close)):
+        wanted = t > 0 and signal[t - 1] > 0
+        if in_position and not wanted:
+            log_returns[t] += np.log(open_[t] / close[t - 1]) + fee_log
+            in_position = False
+        if wanted and not previous_wanted:
+            in_position = True
+            entry = reference = open_[t]
+            log_returns[t] += fee_log
+        elif in_position:
+            reference = close[t - 1]
+        if in_position:
+            stop = stop_loss and low[t] <= entry * (1 - stop_loss)
+            take = take_profit and high[t] >= entry * (1 + take_profit)
+            if stop:
+                price = min(open_[t], entry * (1 - stop_loss))
+            elif take:
+                price = max(open_[t], entry * (1 + take_profit))
+            else:
+                price = close[t]
+            log_returns[t] += np.log(price / reference)
+            if stop or take:
+                log_returns[t] += fee_log
+                in_position = False
+        previous_wanted = wanted
+    if in_position:
+        log_returns[-1] += fee_log
+    return log_returns
+
+
+def random_prices(n, seed):
+    rng = np.random.default_rng(seed)
+    close = 2.0 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    open_ = np.concatenate(([2.0], close[:-1])) * np.exp(rng.normal(0, 0.001, n))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.003, n)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.003, n)))
+    prices = {'open': open_, 'high': high, 'low': low, 'close': close}
+    signal = (rng.random(n) < 0.6).astype(np.int8)
+    return prices, signal
+
+
+@pytest.mark.parametrize('stop_loss, take_profit', [(0.0, 0.0), (0.002, 0.0), (0.0, 0.003), (0.002, 0.004)])
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_loop_reference(seed, stop_loss, take_profit):
+    prices, signal = random_prices(500, seed)
+    result = run_backtest(prices, signal, stop_loss=stop_loss, take_profit=take_profit, initial_capital=1.0)
+    expected = np.exp(np.cumsum(loop_backtest(prices, signal, stop_loss, take_profit)))
+    np.testing.assert_allclose(result['equity'], expected, rtol=1e-12)
+
+
+def test_entry_and_stop_in_same_bar_pay_two_fees():
+    prices = {'open': np.array([10.0, 10.0, 10.0]), 'high': np.array([10.0, 10.0, 10.0]),
+              'low': np.array([10.0, 9.0, 10.0]), 'close': np.array([10.0, 9.5, 10.0])}
+    result = run_backtest(prices, np.array([1, 1, 1]), stop_loss=0.05, fee=0.01, initial_capital=1.0)
+    assert result['stop_exits'] == 1
+    assert result['final_value'] == pytest.approx(0.95 * 0.99 ** 2)
+
+
+@pytest.mark.parametrize('n', [0, 1, 2])
+def test_short_history(n):
+    prices, signal = random_prices(n, seed=0)
+    result = run_backtest(prices, np.ones(n, dtype=np.int8), initial_capital=100.0)
+    assert len(result['equity']) == len(result['drawdown']) == n
+    if n < 2:
+        assert result['final_value'] == 100.0 and result['total_trades'] == 0
+        assert result['max_drawdown'] == 0.0 and result['sharpe'] == 0.0
+    else:
+        # Вход по open второго бара и закрытие по его close: одна сделка
+        assert result['total_trades'] == 1
+    assert not run_backtest(prices, signal, equity_curve=False).keys() & {'equity', 'drawdown'}
@@ -0,0 +1,78 @@
+import csv
+import time
+
+from buffered_writer import FLUSH_TICK, BufferedWriter, UpsertWriter
+
+COLUMNS = ['timestamp', 'close', 'volume']
+
+
+def read_rows(path):
+    with open(path, newline='') as f:
+        return [(int(row['timestamp']), float(row['close'])) for row in csv.DictReader(f)]
+
+
+def test_buffered_writer_appends_after_header(tmp_path):
+    path = str(tmp_path / 'ticks.csv')
+    writer = BufferedWriter(path, COLUMNS, flush_rows=2)
+    for i in range(3):
+        writer.write((i, 1.5 + i, 10.0))
+    assert writer.rows_written == 2 and writer.count == 1
+    writer.close()
+    # Повторное открытие дописывает без второго заголовка
+    writer = BufferedWriter(path, COLUMNS)
+    writer.write((3, 4.5, 10.0))
+    writer.close()
+    assert read_rows(path) == [(0, 1.5), (1, 2.5), (2, 3.5), (3, 4.5)]
+
+
+
+
+def test_time_flush_without_new_writes(tmp_path):
+    path = str(tmp_path / 'quiet.csv')
+    writer = BufferedWriter(path, COLUMNS, flush_rows=100, flush_interval=0.1)
+    writer.write((0, 1.5, 10.0))
+    # Новых строк нет, но фоновый поток сбрасывает буфер по времени
+    deadline = time.monotonic() + 5 * FLUSH_TICK + 1.0
+    while writer.count and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert writer.count == 0 and read_rows(path) == [(0, 1.5)]
+    writer.close()
+
+
+def test_sort_key_orders_rows_within_a_flush(tmp_path):
+    path = str(tmp_path / 'ticks.csv')
+    writer = BufferedWriter(path, COLUMNS, flush_rows=3, sort_key='timestamp')
+    for ts in (2000, 1000, 3000):          # Ответ на тик 1000 пришёл позже тика 2000
+        writer.write((ts, ts / 1000, 1.0))
+    # Строка старше уже сброшенных не переставляется назад — уходит в следующий сброс
+    writer.write((500, 0.5, 1.0))
+    writer.close()
+    assert [ts for ts, _ in read_rows(path)] == [1000, 2000, 3000, 500]
+
+
+def test_upsert_writes_one_row_per_candle(tmp_path):
+    path = str(tmp_path / 'kline.csv')
+    writer = UpsertWriter(path, COLUMNS, flush_rows=1)
+    assert writer.upsert((60, 1.0, 1.0)) is None
+    assert writer.upsert((60, 1.1, 2.0)) is None
+    assert writer.upsert((120, 2.0, 1.0)) == (60, 1.1, 2.0)
+    # Опоздавший ответ про закрытую свечу не пишется и не откатывает текущую
+    assert writer.upsert((60, 0.5, 9.0)) is None
+    assert writer.upsert((120, 2.2, 3.0)) is None
+    assert writer.stale == 1 and writer.count == 1
+    writer.close()
+    assert read_rows(path) == [(60, 1.1), (120, 2.2)]
+
+
+def test_upsert_replaces_open_candle_after_restart(tmp_path):
+    path = str(tmp_path / 'kline.csv')
+    writer = UpsertWriter(path, COLUMNS)
+    writer.upsert((60, 1.0, 1.0))
+    writer.upsert((120, 2.0, 1.0))
+    writer.close()                     # Свеча 120 записана незакрытой
+
+    writer = UpsertWriter(path, COLUMNS)
+    writer.upsert((120, 2.5, 4.0))
+    writer.upsert((180, 3.0, 1.0))
+    writer.close()
+    assert read_rows(path) == [(60, 1.0), (120, 2.5), (180, 3.0)]
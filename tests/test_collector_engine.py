@@ -0,0 +1,13 @@
+from collector_engine import CollectorEngine
+
+
+def test_poll_exceptions_are_counted(tmp_path, capsys):
+    engine = CollectorEngine({'spot': ['TONUSDT']}, period=0.05, workers=2, output_dir=str(tmp_path))
+    # Ответ без lastPrice: handle_ticker падает внутри пула потоков
+    engine.fetch_tickers = lambda category, symbol=None: {'time': 1, 'result': {'list': [{'symbol': 'TONUSDT'}]}}
+    engine.run(duration=0.3)
+    engine.close()
+    stats = engine.stats()
+    assert stats['poll_failures'] >= 1
+    assert stats['poll_failures'] == stats['ticks']
+    assert 'Ошибка опроса spot:TONUSDT: KeyError' in capsys.readouterr().out
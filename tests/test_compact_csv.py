@@ -0,0 +1,46 @@
+import csv
+
+from compact_csv import compact_csv
+
+HEADER = 'symbol,timestamp,close\n'
+
+
+def write(path, lines):
+    with open(path, 'w', newline='') as f:
+        f.write(HEADER + ''.join(lines))
+
+
+def read_rows(path):
+    with open(path, newline='') as f:
+        return [(int(row['timestamp']), row['close']) for row in csv.DictReader(f)]
+
+
+def test_last_update_wins_and_output_is_sorted(tmp_path):
+    path = str(tmp_path / 'kline.csv')
+    write(path, ['TON,120,1\n', 'TON,60,1\n', 'TON,60,2\n', 'TON,120,3\n', 'TON,180,4\n', 'TON,180,5\n'])
+    stats = compact_csv(path)
+    assert read_rows(path) == [(60, '2'), (120, '3'), (180, '5')]
+    assert stats == {'rows_in': 6, 'rows_out': 3, 'late': 0, 'bad': 0}
+
+
+def test_late_and_bad_rows(tmp_path):
+    path = str(tmp_path / 'kline.csv')
+    output = str(tmp_path / 'compact.csv')
+    lines = [f'TON,{ts},{ts}\n' for ts in range(0, 600, 60)]
+    lines.insert(7, 'TON,60,late\n')            # Свеча 60 уже вышла из окна и записана
+    lines.insert(3, 'TON,oops,1\n')
+    lines.append('TON,600,trunc')             # Недописанная последняя строка
+    write(path, lines)
+    stats = compact_csv(path, output=output, window=2)
+    assert read_rows(output) == [(ts, str(ts)) for ts in range(0, 600, 60)]
+    assert stats == {'rows_in': 13, 'rows_out': 10, 'late': 1, 'bad': 2}
+    # С output исходный файл не меняется
+    assert sum(1 for _ in open(path)) == 14
+
+
+def test_late_row_inside_window_still_updates(tmp_path):
+    path = str(tmp_path / 'kline.csv')
+    write(path, ['TON,60,1\n', 'TON,120,1\n', 'TON,60,2\n', 'TON,180,1\n'])
+    stats = compact_csv(path, window=4)
+    assert read_rows(path) == [(60, '2'), (120, '1'), (180, '1')]
+    assert stats['late'] == 0
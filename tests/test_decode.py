@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+import pytest
+
+import decode
+from decode import KLINE_FIELDS, decode_kline_page, decode_klines
+
+ROWS = [['1674432120000', '2.13', '2.15', '2.12', '2.14', '1000.5', '2140.1'],
+        ['1674432060000', '2.12', '2.14', '2.11', '2.13', '900', '1917'],
+        ['1674432000000', '2.11', '2.13', '2.10', '2.12', '800.25', '1696.53']]
+
+
+def page(rows, **extra):
+    body = {'retCode': 0, 'retMsg': 'OK', 'result': {'category': 'linear', 'symbol': 'TONUSDT', 'list': rows},
+            'time': 1674432180000, **extra}
+    return json.dumps(body, separators=(',', ':')).encode()
+
+
+def expected_columns(rows):
+    rows = sorted(rows, key=lambda row: int(row[0]))
+    columns = {'timestamp': np.array([int(row[0]) for row in rows], dtype=np.int64)}
+    for index, name in enumerate(KLINE_FIELDS[1:], 1):
+        columns[name] = np.array([float(row[index]) for row in rows])
+    return columns
+
+
+def assert_columns(actual, expected):
+    assert list(actual) == KLINE_FIELDS
+    assert actual['timestamp'].dtype == np.int64
+    for name in KLINE_FIELDS:
+        np.testing.assert_array_equal(actual[name], expected[name])
+
+
+@pytest.mark.parametrize('raw', [page(ROWS), page(ROWS).decode(), json.dumps(json.loads(page(ROWS)), indent=1)])
+def test_page_descending_to_ascending_columns(raw):
+    data = decode_kline_page(raw)
+    assert data['retCode'] == 0 and data['result']['symbol'] == 'TONUSDT'
+    assert_columns(data['klines'], expected_columns(ROWS))
+
+
+def test_unordered_and_empty_pages():
+    shuffled = [ROWS[1], ROWS[0], ROWS[2]]
+    assert_columns(decode_kline_page(page(shuffled))['klines'], expected_columns(ROWS))
+    empty = decode_kline_page(page([]))['klines']
+    assert all(len(empty[name]) == 0 for name in KLINE_FIELDS)
+
+
+def test_irregular_page_falls_back_to_full_parse():
+    # Пустое поле ломает быстрый путь: страница разбирается целиком и ошибка видна вызывающему
+    with pytest.raises(ValueError):
+        decode_kline_page(page([ROWS[0][:6] + ['']]))
+    error = decode_kline_page(json.dumps({'retCode': 10001, 'retMsg': 'params error', 'result': {}}))
+    assert error['retCode'] == 10001 and len(error['klines']['timestamp']) == 0
+
+
+def test_same_result_with_stdlib_json(monkeypatch):
+    monkeypatch.setattr(decode, 'loads', json.loads)
+    assert_columns(decode_kline_page(page(ROWS))['klines'], expected_columns(ROWS))
+    assert_columns(decode_klines(ROWS), expected_columns(ROWS))
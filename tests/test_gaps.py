@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+
+from gaps import gaps_from_mask, load_gap_index, missing_count, plan_refill_requests, save_gap_index
+
+START = 1674432000000
+MINUTE = 60_000
+
+
+def test_gaps_from_mask_includes_edges():
+    filled = np.array([False, True, True, False, False, True, False])
+    gaps = gaps_from_mask(filled, START, MINUTE)
+    assert gaps.tolist() == [[START, START + MINUTE], [START + 3 * MINUTE, START + 5 * MINUTE],
+                             [START + 6 * MINUTE, START + 7 * MINUTE]]
+    assert missing_count(gaps, MINUTE) == 4
+    assert len(gaps_from_mask(np.ones(5, dtype=bool), START, MINUTE)) == 0
+
+
+def test_plan_merges_nearby_gaps_into_one_window():
+    gaps = np.array([[START, START + 2 * MINUTE], [START + 150 * MINUTE, START + 151 * MINUTE]])
+    assert plan_refill_requests(gaps, MINUTE, limit=200) == [(START, START + 199 * MINUTE)]
+
+
+def test_plan_covers_every_missing_candle():
+    rng = np.random.default_rng(0)
+    filled = rng.random(5000) < 0.97
+    filled[1000:1450] = False                       # Длинная дыра больше limit
+    gaps = gaps_from_mask(filled, START, MINUTE)
+    windows = plan_refill_requests(gaps, MINUTE, limit=200)
+
+    covered = np.zeros(len(filled), dtype=bool)
+    for window_start, window_end in windows:
+        assert window_end - window_start == 199 * MINUTE       # end включительный
+        covered[(window_start - START) // MINUTE:(window_end - START) // MINUTE + 1] = True
+    assert covered[~filled].all()
+    # Жадное покрытие: окна не пересекаются и каждое начинается с пропущенной свечи
+    starts = [(window_start - START) // MINUTE for window_start, _ in windows]
+    assert all(not filled[start] for start in starts)
+    assert all(b - a >= 200 for a, b in zip(starts, starts[1:]))
+
+
+def test_save_gap_index(tmp_path):
+    gaps = np.array([[START, START + 3 * MINUTE]])
+    path = tmp_path / 'gaps.json'
+    save_gap_index(str(path), gaps, MINUTE, START, START + 10 * MINUTE)
+    index = json.loads(path.read_text())
+    assert index['missing_candles'] == 3 and index['gaps'] == [[START, START + 3 * MINUTE]]
+
+
+def test_load_gap_index_checks_range(tmp_path):
+    gaps = np.array([[START, START + 3 * MINUTE], [START + 5 * MINUTE, START + 6 * MINUTE]])
+    path = str(tmp_path / 'gaps.json')
+    save_gap_index(path, gaps, MINUTE, START, START + 10 * MINUTE)
+    assert load_gap_index(path, MINUTE, START, START + 10 * MINUTE).tolist() == gaps.tolist()
+    assert load_gap_index(path, MINUTE, START, START + 20 * MINUTE) is None
+    assert load_gap_index(path, 5 * MINUTE, START, START + 10 * MINUTE) is None
+    assert load_gap_index(str(tmp_path / 'missing.json'), MINUTE, START, START + 10 * MINUTE) is None
+    save_gap_index(path, np.empty((0, 2), dtype=np.int64), MINUTE, START, START + 10 * MINUTE)
+    assert load_gap_index(path, MINUTE, START, START + 10 * MINUTE).shape == (0, 2)
@@ -0,0 +1,34 @@
+import pytest
+
+import load_dt02
+from http_cache import MODE_OFF, MODE_RECORD, MODE_REPLAY, CacheMiss, HttpCache
+
+URL = 'https://api.bybit.com/v5/market/kline'
+PAGE = '{"retCode":0,"retMsg":"OK","result":{"list":[]}}'
+
+
+def test_record_then_replay(tmp_path):
+    HttpCache(str(tmp_path), mode=MODE_RECORD).put(URL, {'start': '1', 'limit': '200'}, PAGE)
+    replay = HttpCache(str(tmp_path), mode=MODE_REPLAY)
+    # Порядок параметров не важен
+    assert replay.get(URL, {'limit': '200', 'start': '1'}) == PAGE
+    with pytest.raises(CacheMiss):
+        replay.get(URL, {'start': '2', 'limit': '200'})
+    assert HttpCache(str(tmp_path)).mode == MODE_OFF
+    assert HttpCache(str(tmp_path)).get(URL, {'start': '1', 'limit': '200'}) is None
+
+
+def test_replay_miss_is_raised_to_the_caller(tmp_path, monkeypatch):
+    cache = HttpCache(str(tmp_path), mode=MODE_RECORD)
+    cache.put(URL, {'start': '1'}, PAGE)
+    cache.mode = MODE_REPLAY
+    monkeypatch.setattr(load_dt02, 'http_cache', cache)
+
+    def no_network(*args, **kwargs):
+        raise AssertionError('replay не должен ходить в сеть')
+
+    monkeypatch.setattr(load_dt02.requests, 'get', no_network)
+    assert load_dt02.make_api_request(URL, {'start': '1'})['retCode'] == 0
+    with pytest.raises(CacheMiss):
+        load_dt02.make_api_request(URL, {'start': '2'})
+    assert cache.hits == 1 and cache.misses == 1
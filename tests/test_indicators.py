@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import EMA, MACD, RSI, SMA, BBands, IndicatorSet
+
+N = 3000
+
+
+def closes(n=N, seed=0):
+    rng = np.random.default_rng(seed)
+    return 2.0 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+
+
+# Пакетные формулы pandas в соглашениях pandas-ta: ema с presma, rsi на rma, bbands с ddof=0
+
+def batch_ema(close, length):
+    close = close.copy()
+    seed = close.iloc[:length].mean()
+    close.iloc[:length - 1] = np.nan
+    close.iloc[length - 1] = seed
+    return close.ewm(span=length, adjust=False).mean()
+
+
+def batch_rsi(close, length):
+    change = close.diff()
+    gain = change.clip(lower=0).ewm(alpha=1 / length, min_periods=length).mean()
+    loss = (-change).clip(lower=0).ewm(alpha=1 / length, min_periods=length).mean()
+    return 100 * gain / (gain + loss)
+
+
+def batch_macd(close, fast, slow, signal):
+    macd = batch_ema(close, fast) - batch_ema(close, slow)
+    signal_line = pd.Series(np.nan, index=close.index)
+    signal_line.iloc[slow - 1:] = batch_ema(macd.iloc[slow - 1:], signal)
+    return pd.DataFrame({'macd': macd, 'signal': signal_line, 'histogram': macd - signal_line})
+
+
+def batch_bbands(close, length, std):
+    mid = close.rolling(length).mean()
+    deviation = close.rolling(length).std(ddof=0)
+    return pd.DataFrame({'lower': mid - std * deviation, 'mid': mid, 'upper': mid + std * deviation})
+
+
+CASES = {
+    'sma': (lambda: SMA(50), lambda close: close.rolling(50).mean()),
+    'ema': (lambda: EMA(20), lambda close: batch_ema(close, 20)),
+    'rsi': (lambda: RSI(14), lambda close: batch_rsi(close, 14)),
+    'macd': (lambda: MACD(12, 26, 9), lambda close: batch_macd(close, 12, 26, 9)),
+    'bbands': (lambda: BBands(20, 2.0), lambda close: batch_bbands(close, 20, 2.0)),
+}
+
+
+def as_rows(values, width):
+    """Значения update() в матрицу: None (индикатор не прогрет) -> NaN"""
+    rows = []
+    for value in values:
+        if not isinstance(value, tuple):
+            value = (value,) * width if value is None else (value,)
+        rows.append([np.nan if v is None else v for v in value])
+    return np.array(rows, dtype=np.float64)
+
+
+@pytest.mark.parametrize('name', CASES)
+def test_update_matches_pandas_batch(name):
+    make, batch = CASES[name]
+    close = pd.Series(closes())
+    expected = batch(close).to_numpy().reshape(N, -1)
+    indicator = make()
+    streamed = as_rows([indicator.update(x) for x in close], expected.shape[1])
+    np.testing.assert_array_equal(np.isnan(streamed), np.isnan(expected))
+    np.testing.assert_allclose(streamed, expected, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('name', CASES)
+def test_warm_up_then_update_matches_pandas_batch(name):
+    make, batch = CASES[name]
+    close = pd.Series(closes(seed=1))
+    expected = batch(close).to_numpy().reshape(N, -1)
+    half = N // 2
+    indicator = make()
+    warmed = indicator.warm_up(close.iloc[:half].to_numpy())
+    streamed = as_rows([warmed] + [indicator.update(x) for x in close.iloc[half:]], expected.shape[1])
+    np.testing.assert_allclose(streamed, expected[half - 1:], rtol=0, atol=1e-9)
+
+
+def test_out_of_order_ticks_are_dropped():
+    indicators = IndicatorSet({'sma': SMA(2)})
+    for tick, price in [(0, 1.0), (1000, 2.0), (3000, 4.0), (2000, 3.0)]:
+        indicators.update(price, key=tick)
+    assert indicators.stale == 1
+    assert indicators.bars == 3
+    assert indicators.values()['sma'] == 3.0
+    assert indicators.update(5.0, key=3000) is None
+    assert indicators.update(5.0, key=4000) == {'sma': 4.5}
+
+
+def test_update_without_key_applies_every_price():
+    indicators = IndicatorSet({'sma': SMA(2)})
+    for price in [3.0, 2.0, 1.0]:
+        indicators.update(price)
+    assert indicators.bars == 3 and indicators.stale == 0
+    assert indicators.values()['sma'] == 1.5
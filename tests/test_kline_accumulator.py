@@ -0,0 +1,38 @@
+import numpy as np
+
+from kline_accumulator import KlineAccumulator
+
+START = 1674432000000
+MINUTE = 60_000
+
+
+def candles(accumulator, minutes):
+    timestamps = np.array([START + m * MINUTE for m in minutes], dtype=np.int64)
+    values = np.arange(len(minutes), dtype=np.float64)
+    return accumulator.add_batch(timestamps, values, values, values, values, values)
+
+
+def test_add_batch_skips_duplicates_and_foreign_timestamps():
+    accumulator = KlineAccumulator(START, START + 10 * MINUTE)
+    assert candles(accumulator, [0, 1, 1, 3]) == 3
+    assert candles(accumulator, [3, 4, 10, -1]) == 1
+    assert accumulator.add_batch([START + 30_000], [1.0], [1.0], [1.0], [1.0], [1.0]) == 0
+    assert accumulator.add(START + 5 * MINUTE, 1.0, 1.0, 1.0, 1.0, 1.0)
+    assert not accumulator.add(START + 5 * MINUTE, 2.0, 2.0, 2.0, 2.0, 2.0)
+    assert list(accumulator.timestamps()) == [START + m * MINUTE for m in (0, 1, 3, 4, 5)]
+    assert len(accumulator) == 5
+
+
+def test_unsaved_until_commit():
+    accumulator = KlineAccumulator(START, START + 10 * MINUTE)
+    candles(accumulator, [0, 1])
+    frame, mask = accumulator.unsaved()
+    assert len(frame) == 2
+    # Запись сегмента не удалась: commit не вызван, свечи остаются в следующей пачке
+    candles(accumulator, [2])
+    frame, mask = accumulator.unsaved()
+    assert list(frame['timestamp']) == [START, START + MINUTE, START + 2 * MINUTE]
+    accumulator.commit(mask)
+    candles(accumulator, [3])
+    frame, _ = accumulator.unsaved()
+    assert list(frame['timestamp']) == [START + 3 * MINUTE]
@@ -0,0 +1,182 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import load_dt02
+from http_cache import MODE_OFF, MODE_RECORD, MODE_REPLAY, HttpCache
+from kline_accumulator import KlineAccumulator
+from rate_limit import AdaptiveRateLimiter
+from segment_store import SegmentStore
+from stub_bybit import StubRestServer
+
+START = load_dt02.date_to_timestamp('2023-01-23')
+MINUTE = 60_000
+DAY = 24 * 60 * MINUTE
+
+
+@pytest.fixture
+def loader(tmp_path, monkeypatch):
+    """load_dt02 с чистым состоянием в tmp_path и стендом ByBit на два дня минутных свечей"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    server = StubRestServer(kline_range=(START, START + 2 * DAY)).start()
+    monkeypatch.setattr(load_dt02, 'BASE_URL', server.url)
+    monkeypatch.setattr(load_dt02, 'SHARD_DAYS', 1)
+    monkeypatch.setattr(load_dt02, 'http_cache', HttpCache(mode=MODE_OFF))
+    monkeypatch.setattr(load_dt02, 'rate_limiter', AdaptiveRateLimiter(100_000))
+    monkeypatch.setattr(load_dt02, 'request_count', 0)
+    monkeypatch.setattr(load_dt02, 'last_save_count', 0)
+    monkeypatch.setattr(load_dt02, 'shards', [])
+    monkeypatch.setattr(load_dt02, 'segment_store', None)
+    monkeypatch.setattr(load_dt02, 'accumulator', None)
+    load_dt02.stop_event.clear()
+    reset(load_dt02)
+    yield load_dt02
+    server.stop()
+
+
+def reset(module):
+    """Состояние нового запуска процесса: пустой накопитель, сегменты читаются из манифеста"""
+    module.segment_store = SegmentStore(module.data_filename('_PARTIAL'))
+    module.accumulator = KlineAccumulator(START, START + 2 * DAY, MINUTE)
+
+
+def test_plan_shards_covers_range(loader):
+    shards = loader.plan_shards(START, START + 2 * DAY + 5 * MINUTE)
+    assert [(shard['start'], shard['end']) for shard in shards] == [
+        (START, START + DAY), (START + DAY, START + 2 * DAY), (START + 2 * DAY, START + 2 * DAY + 5 * MINUTE)]
+    assert all(shard['cursor'] == shard['start'] and not shard['done'] for shard in shards)
+    assert loader.plan_shards(START, START) == []
+
+
+def test_resume_shards_formats(loader):
+    saved = loader.plan_shards(START, START + 2 * DAY)
+    assert loader.resume_shards({'shards': saved}, START + 2 * DAY) is saved
+    # Старый формат: один курсор, всё до него уже загружено
+    legacy = loader.resume_shards({'last_timestamp': START + DAY}, START + 2 * DAY)
+    assert [(shard['start'], shard['end']) for shard in legacy] == [(START + DAY, START + 2 * DAY)]
+
+
+def test_interrupted_backfill_resumes_remaining_shards(loader, monkeypatch):
+    end = START + 2 * DAY
+    loader.shards = loader.plan_shards(START, end)
+    loader.fetch_shard(loader.shards[0], end)
+    assert loader.shards[0]['done'] and len(loader.accumulator) == 24 * 60
+    loader.save_progress()
+
+    with open(loader.data_filename('_PARTIAL_resume.json')) as f:
+        resume = json.load(f)
+    assert [shard['done'] for shard in resume['shards']] == [True, False]
+    assert resume['total_records'] == 24 * 60
+
+    reset(loader)
+    monkeypatch.setattr('builtins.input', lambda prompt: 'y')
+    shards, total, requests = loader.load_resume_info(end)
+    assert total == 24 * 60 and requests == loader.request_count
+    assert [shard['done'] for shard in shards] == [True, False]
+    # Свечи из сегментов уже на диске: в следующий сегмент попадут только новые
+    assert len(loader.accumulator.unsaved()[0]) == 0
+
+    loader.fetch_shard(shards[1], end)
+    assert len(loader.accumulator) == 2 * 24 * 60
+    loader.save_progress()
+    assert loader.segment_store.total_rows == 2 * 24 * 60
+    df = loader.segment_store.compact(loader.data_filename('.csv'))
+    assert len(df) == 2 * 24 * 60 and df.index.is_monotonic_increasing
+
+
+def test_new_download_discards_abandoned_partial(loader, monkeypatch):
+    monkeypatch.setattr(loader, 'START_DATE', '2023-01-23')
+    monkeypatch.setattr(loader, 'END_DATE', '2023-01-24')
+    monkeypatch.setattr(loader.signal, 'signal', lambda signum, handler: None)
+    monkeypatch.setattr(loader, 'start_from_env', lambda: None)
+    reset(loader)
+    # Брошенный прогон: сегмент с другими ценами и старый _PARTIAL.csv, точки возобновления нет
+    stale = pd.DataFrame({'timestamp': START + np.arange(10) * MINUTE, 'open': 999.0, 'high': 999.0,
+                          'low': 999.0, 'close': 999.0, 'volume': 1.0})
+    loader.segment_store.append(stale)
+    legacy_file = loader.data_filename('_PARTIAL.csv')
+    open(legacy_file, 'w').close()
+
+    loader.main()
+    df = pd.read_csv(loader.data_filename('.csv'))
+    assert len(df) == 24 * 60
+    assert (df['close'] < 999.0).all()
+    assert not os.path.exists(legacy_file) and not os.path.exists(loader.segment_store.directory)
+
+
+def test_replay_with_missing_page_stops_the_shard(loader, tmp_path, monkeypatch):
+    end = START + 2 * DAY
+    cache = HttpCache(str(tmp_path / 'http_cache'), mode=MODE_RECORD)
+    monkeypatch.setattr(loader, 'http_cache', cache)
+    loader.shards = loader.plan_shards(START, end)
+    loader.fetch_shard(loader.shards[0], end)
+    first_shard_pages = cache.stores
+    # Записан только первый шард; из второго — одна страница, не первая
+    loader.fetch_shard(dict(loader.shards[1], cursor=START + DAY + 200 * MINUTE, end=START + DAY + 400 * MINUTE), end)
+
+    reset(loader)
+    cache = HttpCache(cache.directory, mode=MODE_REPLAY)
+    monkeypatch.setattr(loader, 'http_cache', cache)
+    monkeypatch.setattr(loader.requests, 'get', lambda *args, **kwargs: pytest.fail('replay ходит в сеть'))
+    loader.shards = loader.plan_shards(START, end)
+    for shard in loader.shards:
+        loader.fetch_shard(shard, end)
+    assert loader.shards[0]['done'] and len(loader.accumulator) == 24 * 60
+    # Промах на первой странице второго шарда останавливает шард, а не идёт по минуте
+    assert not loader.shards[1]['done'] and loader.shards[1]['cursor'] == START + DAY
+    assert loader.replay_missed == [1]
+    assert cache.misses == 1 and cache.hits == first_shard_pages
+
+
+def test_main_aborts_incomplete_replay(loader, tmp_path, monkeypatch):
+    monkeypatch.setattr(loader, 'START_DATE', '2023-01-23')
+    monkeypatch.setattr(loader, 'END_DATE', '2023-01-24')
+    monkeypatch.setattr(loader.signal, 'signal', lambda signum, handler: None)
+    monkeypatch.setattr(loader, 'start_from_env', lambda: None)
+    monkeypatch.setattr(loader, 'http_cache', HttpCache(str(tmp_path / 'http_cache'), mode=MODE_REPLAY))
+    reset(loader)
+    with pytest.raises(SystemExit) as exit_info:
+        loader.main()
+    assert exit_info.value.code == 1
+    assert loader.replay_missed == [0]
+    assert not os.path.exists(loader.data_filename('.csv'))
+
+
+def test_refill_uses_persisted_gap_index(loader, monkeypatch):
+    monkeypatch.setattr(loader, 'START_DATE', '2023-01-23')
+    monkeypatch.setattr(loader, 'END_DATE', '2023-01-24')
+    monkeypatch.setattr(loader.signal, 'signal', lambda signum, handler: None)
+    monkeypatch.setattr(loader, 'start_from_env', lambda: None)
+    reset(loader)
+    loader.main()
+    final_file, gaps_file = loader.data_filename('.csv'), loader.data_filename('_gaps.json')
+    windows = []
+    fetch = loader.fetch_refill_window
+    monkeypatch.setattr(loader, 'fetch_refill_window', lambda window: windows.append(window) or fetch(window))
+
+    # CSV изменён после индекса (вырезаны свечи): индекс устарел, пропуски считаются по CSV
+    df = pd.read_csv(final_file)
+    df.drop(df.index[100:130]).to_csv(final_file, index=False)
+    os.utime(gaps_file, (0, 0))
+    loader.refill_gaps()
+    assert windows == [(START + 100 * MINUTE, START + 299 * MINUTE)]
+    assert len(pd.read_csv(final_file)) == 24 * 60
+    assert json.load(open(gaps_file))['gaps'] == []
+
+    # Свежий индекс без пропусков: CSV даже не читается
+    windows.clear()
+    load_final_file = loader.load_final_file
+    monkeypatch.setattr(loader, 'load_final_file', lambda *args: pytest.fail('CSV читается при свежем индексе'))
+    loader.refill_gaps()
+    assert windows == []
+
+    # Окна дозагрузки строятся по сохранённому индексу
+    monkeypatch.setattr(loader, 'load_final_file', load_final_file)
+    loader.save_gap_index(gaps_file, np.array([[START + 500 * MINUTE, START + 510 * MINUTE]]), MINUTE, START, START + DAY)
+    loader.refill_gaps()
+    assert windows == [(START + 500 * MINUTE, START + 699 * MINUTE)]
+    assert json.load(open(gaps_file))['gaps'] == []
@@ -0,0 +1,101 @@
+import os
+import subprocess
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+from market_bus import BusClosed, MarketBusReader, MarketBusWriter
+
+
+@pytest.fixture
+def bus():
+    writer = MarketBusWriter(f"moon_test_{os.getpid()}", capacity=8)
+    yield writer
+    writer.close()
+
+
+def publish(writer, count):
+    for i in range(count):
+        writer.publish(1000 * i, 1.0, 1.0, 1.0, float(i), 0.0)
+
+
+def test_last_n_after_wrap(bus):
+    publish(bus, 21)
+    reader = MarketBusReader(bus.name)
+    view = reader.last_n(100, copy=True)
+    # Не больше capacity - 1: слот следующей записи может быть заполнен прямо сейчас
+    assert list(view['seq']) == list(range(15, 22))
+    assert list(view['close']) == [float(i) for i in range(14, 21)]
+    assert reader.valid(view)
+    publish(bus, 8)
+    assert not reader.valid(view)
+    reader.close()
+
+
+def test_wait_next_counts_overwritten_records(bus):
+    reader = MarketBusReader(bus.name, from_start=True)
+    publish(bus, 20)
+    record = reader.wait_next(timeout=1.0)
+    # Записи 1..12 перезаписаны: самая старая доступная — 20 + 2 - 8
+    assert record['seq'] == 14
+    assert reader.dropped == 13
+    seqs = [int(reader.wait_next(timeout=1.0)['seq']) for _ in range(6)]
+    assert seqs == list(range(15, 21))
+    assert reader.wait_next(timeout=0.01) is None
+    reader.close()
+
+
+def test_concurrent_publish_gives_unique_seq(bus):
+    seqs = []
+
+    def worker():
+        seqs.extend(bus.publish(i, 1.0, 1.0, 1.0, 1.0, 0.0) for i in range(2000))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(seqs) == list(range(1, 8001))
+    reader = MarketBusReader(bus.name)
+    view = reader.last_n(7)
+    assert np.all(np.diff(view['seq'].astype(np.int64)) == 1)
+    del view
+    reader.close()
+
+
+def test_reader_sees_close(bus):
+    reader = MarketBusReader(bus.name)
+    bus.close()
+    with pytest.raises(BusClosed):
+        reader.wait_next(timeout=1.0)
+    reader.close()
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_live_writer_is_not_taken_over(bus):
+    with pytest.raises(FileExistsError):
+        MarketBusWriter(bus.name, capacity=8)
+    publish(bus, 3)
+    reader = MarketBusReader(bus.name, from_start=True)
+    assert reader.wait_next(timeout=1.0)['seq'] == 1
+    reader.close()
+
+
+def test_dead_writer_is_taken_over(bus):
+    publish(bus, 3)
+    reader = MarketBusReader(bus.name)
+    bus.header['writer_pid'] = dead_pid()
+    writer = MarketBusWriter(bus.name, capacity=8)
+    with pytest.raises(BusClosed):
+        reader.wait_next(timeout=1.0)
+    reader.close()
+    bus.close(unlink=False)      # Сегмент уже принадлежит новому писателю
+    writer.close()
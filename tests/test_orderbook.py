@@ -0,0 +1,135 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+import pytest
+
+import orderbook
+from orderbook import L2Book, OrderBookCollector, SequenceGap, read_depth
+
+TOPIC = 'orderbook.50.TONUSDT'
+
+
+def message(kind, u, bids=(), asks=(), ts=1000):
+    return {'topic': TOPIC, 'type': kind, 'ts': ts,
+            'data': {'s': 'TONUSDT', 'b': [list(level) for level in bids], 'a': [list(level) for level in asks],
+                     'u': u, 'seq': u}}
+
+
+def snapshot(u=10, ts=1000):
+    return message('snapshot', u, bids=[('2.10', '5'), ('2.09', '7')], asks=[('2.11', '3'), ('2.12', '4')], ts=ts)
+
+
+def test_snapshot_and_deltas():
+    book = L2Book('TONUSDT')
+    assert book.apply(message('delta', 9, bids=[('2.10', '1')])) is False      # До snapshot дельты не нужны
+    assert book.apply(snapshot())
+    assert book.best() == (2.10, 2.11)
+    book.apply(message('delta', 11, bids=[('2.105', '2'), ('2.09', '0')], asks=[('2.11', '0')]))
+    assert book.best() == (2.105, 2.12)
+    assert book.bids.top_prices(5) == ([2.105, 2.10], [2.0, 5.0])
+    assert book.update_id == 11 and not book.crossed()
+
+
+def test_gap_invalidates_until_snapshot():
+    book = L2Book('TONUSDT')
+    book.apply(snapshot())
+    with pytest.raises(SequenceGap):
+        book.apply(message('delta', 12, bids=[('2.10', '1')]))
+    assert not book.valid and book.gaps == 1
+    assert book.apply(message('delta', 13)) is False
+    assert book.apply(snapshot(u=20))
+    assert book.valid and book.update_id == 20
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, raw):
+        self.sent.append(json.loads(raw))
+
+
+def test_collector_resubscribes_on_gap(tmp_path):
+    collector = OrderBookCollector(file_prefix=str(tmp_path / 'ton'), snapshot_interval=1000)
+    ws = FakeSocket()
+    assert collector.handle_message(json.dumps(snapshot(ts=1000)))
+    assert collector.handle_message(json.dumps(message('delta', 12, ts=1100))) is False
+    assert collector.resync_needed and collector.resyncs == 1
+
+    assert asyncio.run(collector.resync(ws))
+    assert [request['op'] for request in ws.sent] == ['unsubscribe', 'subscribe']
+    assert all(request['args'] == [TOPIC] for request in ws.sent)
+    # Повторная проверка до snapshot не шлёт подписку снова
+    assert asyncio.run(collector.resync(ws)) and len(ws.sent) == 2
+
+    collector.handle_message(json.dumps(snapshot(u=30, ts=2500)))
+    assert asyncio.run(collector.resync(ws))
+    assert not collector.resync_needed and collector.resync_started is None
+    collector.close()
+
+    depth = read_depth(str(tmp_path / 'ton_depth20.bin'))
+    assert list(depth['timestamp']) == [1000, 2500]
+    assert list(depth['update_id']) == [10, 30]
+    assert depth['bid_price'][0, 0] == 2.10 and np.isnan(depth['bid_price'][0, 2])
+
+
+def test_collector_gives_up_without_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(orderbook, 'RESYNC_TIMEOUT', 0.0)
+    collector = OrderBookCollector(file_prefix=str(tmp_path / 'ton'))
+    collector.handle_message(json.dumps(snapshot()))
+    collector.handle_message(json.dumps(message('delta', 15)))
+    ws = FakeSocket()
+    assert asyncio.run(collector.resync(ws))
+    assert not asyncio.run(collector.resync(ws))
+    collector.close()
+
+
+def test_depth_writer_flushes_by_time(tmp_path):
+    path = str(tmp_path / 'depth.bin')
+    writer = orderbook.DepthWriter(path, levels=5, flush_rows=600, flush_interval=0.05)
+    book = L2Book('TONUSDT')
+    book.apply(snapshot())
+    writer.write(book)
+    writer.flush_due()
+    assert writer.rows_written == 0
+    time.sleep(0.06)
+    writer.flush_due()
+    assert writer.rows_written == 1
+    assert list(read_depth(path)['timestamp']) == [1000]
+    writer.close()
+
+
+class SilentSocket(FakeSocket):
+    """Отдаёт сообщения по очереди, потом молчит, не закрывая соединение"""
+
+    def __init__(self, messages):
+        super().__init__()
+        self.messages = [json.dumps(m) for m in messages]
+
+    async def recv(self):
+        if self.messages:
+            return self.messages.pop(0)
+        await asyncio.Event().wait()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def test_silent_socket_ends_session_after_resync_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(orderbook, 'RESYNC_TIMEOUT', 0.2)
+    ws = SilentSocket([snapshot(), message('delta', 15, ts=1100)])
+    monkeypatch.setattr(orderbook.websockets, 'connect', lambda *args, **kwargs: ws)
+    collector = OrderBookCollector(file_prefix=str(tmp_path / 'ton'), flush_interval=0.05)
+
+    started = time.monotonic()
+    asyncio.run(asyncio.wait_for(collector._session(), timeout=5.0))
+    assert time.monotonic() - started < 2.0
+    assert [request['op'] for request in ws.sent] == ['subscribe', 'unsubscribe', 'subscribe']
+    # Снимок до разрыва сброшен по времени, хотя новых сообщений не было
+    assert collector.writer.rows_written == 1
+    collector.close()
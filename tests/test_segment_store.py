@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from segment_store import SegmentStore
+
+START = 1674432000000
+MINUTE = 60_000
+
+
+def klines(minutes, close=1.0):
+    return pd.DataFrame({'timestamp': [START + m * MINUTE for m in minutes], 'open': close, 'high': close,
+                         'low': close, 'close': close, 'volume': 10.0})
+
+
+def test_append_and_reload(tmp_path):
+    directory = str(tmp_path / 'partial')
+    store = SegmentStore(directory)
+    assert store.append(klines([])) is None
+    first = store.append(klines([0, 1, 2]))
+    store.append(klines([5, 3]))
+    assert first == {'file': 'segment_000000.npy', 'start': START, 'end': START + 2 * MINUTE, 'rows': 3}
+    assert store.time_range() == (START, START + 5 * MINUTE)
+
+    # Новый экземпляр видит те же сегменты через манифест
+    reopened = SegmentStore(directory)
+    assert reopened.total_rows == 5
+    assert sorted(reopened.load()['timestamp']) == [START + m * MINUTE for m in (0, 1, 2, 3, 5)]
+    assert sorted(os.listdir(directory)) == ['manifest.json', 'segment_000000.npy', 'segment_000001.npy']
+
+
+def test_compact_sorts_and_keeps_first_duplicate(tmp_path):
+    store = SegmentStore(str(tmp_path / 'partial'))
+    store.append(klines([2, 0], close=1.0))
+    store.append(klines([1, 2], close=2.0))
+    df = store.compact(str(tmp_path / 'final.csv'))
+    assert list(df.index) == list(pd.to_datetime([START + m * MINUTE for m in (0, 1, 2)], unit='ms'))
+    assert list(df['close']) == [1.0, 2.0, 1.0]
+    saved = pd.read_csv(tmp_path / 'final.csv', index_col='timestamp', parse_dates=True)
+    assert np.allclose(saved['close'], df['close'])
+    store.clear()
+    assert not os.path.exists(store.directory) and store.total_rows == 0
+
+
+def test_failed_manifest_write_leaves_store_unchanged(tmp_path, monkeypatch):
+    store = SegmentStore(str(tmp_path / 'partial'))
+    store.append(klines([0]))
+
+    def broken():
+        raise OSError('диск заполнен')
+
+    monkeypatch.setattr(store, '_write_manifest', broken)
+    with pytest.raises(OSError):
+        store.append(klines([1]))
+    assert store.total_rows == 1
+    monkeypatch.undo()
+    store.append(klines([1]))
+    assert SegmentStore(store.directory).total_rows == 2
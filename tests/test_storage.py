@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import storage
+from bars import read_bars, rebuild_rollups, update_rollups
+from storage import PART_FILE, list_partitions, partition_files, read_ohlcv, write_ohlcv
+
+START = 1674432000000          # 2023-01-23
+MINUTE = 60 * 1000
+
+
+def minutes(first, count, close=1.0):
+    timestamps = START + (first + np.arange(count, dtype=np.int64)) * MINUTE
+    return pd.DataFrame({'timestamp': timestamps, 'open': close, 'high': close, 'low': close,
+                         'close': close, 'volume': 1.0})
+
+
+def test_append_writes_deltas_without_rewriting_partition(tmp_path):
+    root = str(tmp_path)
+    write_ohlcv(minutes(0, 10), 'TONUSDT', 'linear_1', root)
+    (path,) = list_partitions('TONUSDT', 'linear_1', root=root)
+    stat = os.stat(path)
+
+    write_ohlcv(minutes(10, 5), 'TONUSDT', 'linear_1', root, append=True)
+    write_ohlcv(minutes(12, 5, close=2.0), 'TONUSDT', 'linear_1', root, append=True)
+    assert os.stat(path).st_mtime_ns == stat.st_mtime_ns
+    assert [os.path.basename(f) for f in partition_files(path)] == [
+        PART_FILE, 'delta-000001.parquet', 'delta-000002.parquet']
+
+    df = read_ohlcv('TONUSDT', 'linear_1', root=root)
+    assert list(df['timestamp']) == list(START + np.arange(17) * MINUTE)
+    # Более поздняя запись того же timestamp перекрывает прежнюю
+    assert list(df['close']) == [1.0] * 12 + [2.0] * 5
+    window = read_ohlcv('TONUSDT', 'linear_1', START + 11 * MINUTE, START + 13 * MINUTE, root=root)
+    assert list(window['close']) == [1.0, 2.0]
+
+
+def test_deltas_are_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'MAX_DELTAS', 3)
+    root = str(tmp_path)
+    write_ohlcv(minutes(0, 1), 'TONUSDT', 'linear_1', root)
+    for i in range(1, 4):
+        write_ohlcv(minutes(i, 1, close=float(i)), 'TONUSDT', 'linear_1', root, append=True)
+    (path,) = list_partitions('TONUSDT', 'linear_1', root=root)
+    assert partition_files(path) == [path]
+    df = read_ohlcv('TONUSDT', 'linear_1', root=root)
+    assert list(df['close']) == [1.0, 1.0, 2.0, 3.0]
+
+    write_ohlcv(minutes(4, 1), 'TONUSDT', 'linear_1', root, append=True)
+    assert len(partition_files(path)) == 2
+
+
+def test_appended_rollups_match_full_rebuild(tmp_path):
+    appended, rebuilt = str(tmp_path / 'appended'), str(tmp_path / 'rebuilt')
+    history = minutes(0, 180)
+    history['close'] = np.linspace(1.0, 2.0, len(history))
+    write_ohlcv(history.iloc[:1], 'TONUSDT', 'linear_1', appended)
+    for lo in range(1, len(history), 7):
+        chunk = history.iloc[lo:lo + 7]
+        write_ohlcv(chunk, 'TONUSDT', 'linear_1', appended, append=True)
+        update_rollups('TONUSDT', 'linear', int(chunk['timestamp'].iloc[0]),
+                       int(chunk['timestamp'].iloc[-1]) + MINUTE, root=appended, append=True)
+
+    write_ohlcv(history, 'TONUSDT', 'linear_1', rebuilt)
+    rebuild_rollups('TONUSDT', 'linear', root=rebuilt)
+    for timeframe in ('5m', '15m', '1h', '1d'):
+        pd.testing.assert_frame_equal(read_bars('TONUSDT', 'linear', timeframe, root=appended),
+                                      read_bars('TONUSDT', 'linear', timeframe, root=rebuilt))
@@ -0,0 +1,38 @@
+import asyncio
+import socket
+import threading
+
+import websockets
+
+from stub_bybit import ReplayServer, load_session, make_synthetic_session
+from ws_collector import StreamCollector
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_rollups_are_written_off_the_loop_including_last_bar(tmp_path):
+    session = str(tmp_path / 'session.jsonl')
+    make_synthetic_session(session, minutes=2)
+    server = ReplayServer(load_session(session), port=free_port())
+    collector = StreamCollector(url=server.url, file_prefix=str(tmp_path / 'ws'), dataset_root=str(tmp_path / 'ds'))
+    written = []
+    materialize = collector._materialize
+
+    def record(bars):
+        written.append((threading.current_thread() is threading.main_thread(), len(bars)))
+        materialize(bars)
+
+    collector._materialize = record
+
+    async def main():
+        async with websockets.serve(server.handler, server.host, server.port):
+            await collector.run(max_reconnects=0)
+
+    asyncio.run(main())
+    assert written and not any(in_loop for in_loop, _ in written)
+    assert sum(rows for _, rows in written) == collector.bar_writer.rows_written
+    assert collector.rollup_task is None and collector.pending_bars == []